@@ -1,31 +1,159 @@
+import hashlib
 import json
-import random
-import ollama
+import shutil
+import threading
+import time
 import os
-from datetime import datetime
-import PyPDF2
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain.chains import RetrievalQA
-from langchain_community.llms import Ollama
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dedup import QuestionDeduplicator
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from exam_builder import ExamBuilder
+from generation_cache import GenerationCache
+from question_store import GLOBAL_BANK, QuestionStore, bank_key
+from question_parser import JSON_FORMAT_INSTRUCTIONS, QUESTION_FORMAT_VERSION, parse_complete_questions, parse_questions
+from ingest_jobs import IngestJobQueue
+from ingestion import EmbeddingPipeline, count_pdf_pages, iter_pdf_pages, pdf_snapshot
+from metrics import LLM_CALLS, LLM_TOKENS, REGISTRY, STAGE_ERRORS, STAGE_SECONDS, span
+from model_pool import EMBEDDING, GENERATION, ModelPool
+from retrieval import KeywordIndex, KeywordIndexStore, hybrid_search
+from scheduler import GenerationScheduler
+from vector_store_registry import SharedVectorStore, VectorStoreRegistry, embedding_model_tag, shared_collection_name
+
+# Uploaded PDFs are kept here, relative to the working directory
+UPLOAD_DIR = "uploads"
+
+# Questions issued in an exam are left out of new exams for this many days
+DEFAULT_EXAM_EXCLUDE_DAYS = 30
+
+
+def chunk_id(text):
+    """Content-hash id of a chunk, used as its id in the vector store"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def open_chroma(**options):
+    """Open a Chroma vector store; LangChain and Chroma are imported on first use"""
+    from langchain_community.vectorstores import Chroma
+    return Chroma(**options)
+
+
+def release_chroma(store):
+    """Let an evicted Chroma store's client be freed once nothing uses the store.
+
+    Chroma keeps one client system per persist directory cached for the life
+    of the process; removing it from that cache lets it be garbage-collected
+    when the last view of the store goes away.
+    """
+    identifier = getattr(getattr(store, "_client", None), "_identifier", None)
+    if identifier is None:
+        return
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:
+        try:
+            # Chroma 0.4 keeps the same cache on chromadb.api.client
+            from chromadb.api.client import SharedSystemClient
+        except ImportError:
+            return
+    # Spelled _identifer_to_system before Chroma 0.5; clients without the cache hold nothing to release
+    systems = getattr(SharedSystemClient, "_identifier_to_system", None)
+    if systems is None:
+        systems = getattr(SharedSystemClient, "_identifer_to_system", {})
+    systems.pop(identifier, None)
+
+
+def file_sha256(path):
+    """Content hash of a file, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def store_upload(source, dest_path):
+    """Write an upload (a file path or a readable file object) to dest_path atomically.
+
+    The data goes to a temporary file next to dest_path that is then renamed
+    over it, so an ingestion job still reading the previous version of the
+    file never sees it truncated or half-written.
+    """
+    tmp_path = f"{dest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            if isinstance(source, str):
+                with open(source, "rb") as src:
+                    shutil.copyfileobj(src, f)
+            else:
+                shutil.copyfileobj(source, f)
+        os.replace(tmp_path, dest_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return dest_path
+
+
+@contextmanager
+def stage_timer(timings, stage):
+    """Add the time spent in the block to timings[stage] (seconds), if timings is a dict.
+
+    The block is also traced as a metrics span named after the stage.
+    """
+    start = time.perf_counter()
+    try:
+        with span(stage):
+            yield
+    finally:
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def record_llm_usage(model, response):
+    """Count tokens reported in an Ollama chat response (or final stream part)"""
+    for kind, field in (("prompt", "prompt_eval_count"), ("completion", "eval_count")):
+        tokens = response.get(field)
+        if tokens:
+            LLM_TOKENS.inc(tokens, model=model, kind=kind)
+
 
 class AIQuestionBankGenerator:
-    def __init__(self, model="qwen2.5:1.5b", embedding_model="qwen2.5:1.5b"):
+    def __init__(self, model="qwen2.5:1.5b", embedding_model="nomic-embed-text",
+                 embed_batch_size=32, embed_workers=4, embed_retries=3,
+                 extract_workers=4, parallel_extract_min_pages=50,
+                 max_open_stores=8, max_open_store_bytes=None, shared_vector_store=False,
+                 retrieval_k=3, retrieval_fetch_k=20, retrieval_mmr_lambda=0.7,
+                 max_inflight_llm=2, generation_cache_ttl=7 * 24 * 3600, generation_cache_size=2000,
+                 dedup_threshold=0.92, exam_exclude_days=DEFAULT_EXAM_EXCLUDE_DAYS, ingest_workers=2,
+                 ollama_host=None, embedding_host=None, keep_alive="30m", preload_models=True, backends=None):
         self.model = model
+        # A dedicated embedding model; changing it re-embeds documents as they are next ingested
         self.embedding_model = embedding_model
+        # Ollama server URL; None uses the client default (OLLAMA_HOST or localhost:11434).
+        # Embedding traffic can be sent to a separate server with embedding_host.
+        self.ollama_host = ollama_host
         
-        # Initialize empty question bank
-        self.question_bank = {}
+        # Keeps both models loaded and routes generation and embedding calls to
+        # their hosts. backends ({"generation": ..., "embedding": ...}, see
+        # backends.py) replaces the Ollama backend for either role.
+        self.models = ModelPool(
+            {GENERATION: model, EMBEDDING: embedding_model},
+            hosts={GENERATION: ollama_host, EMBEDDING: embedding_host or ollama_host},
+            keep_alive=keep_alive,
+            backends=backends
+        )
         
-        # Try to load existing question bank if it exists
-        try:
-            if os.path.exists("question_bank.json") and os.path.getsize("question_bank.json") > 0:
-                with open("question_bank.json", "r") as f:
-                    self.question_bank = json.load(f)
-        except Exception as e:
-            print(f"Error loading existing question bank: {e}")
-            # Continue with empty question bank
+        # Indexed question bank storage; existing JSON banks are imported once
+        self.question_store = QuestionStore(
+            os.path.join("question_banks", "questions.sqlite"),
+            legacy_dir="question_banks",
+            legacy_global_bank="question_bank.json"
+        )
+        
+        # Exams are stratified over document pages and avoid recently issued questions
+        self.exam_builder = ExamBuilder(self.question_store)
+        self.exam_exclude_days = exam_exclude_days
         
         self.templates = {
             "mcq": "Generate {num} multiple choice questions about {topic} for {difficulty} level. Each question should have 4 options and one correct answer. Use the provided context information when applicable.",
@@ -35,133 +163,401 @@ class AIQuestionBankGenerator:
         }
         
         # Create upload directory if it doesn't exist
-        self.upload_dir = "uploads"
+        self.upload_dir = UPLOAD_DIR
         os.makedirs(self.upload_dir, exist_ok=True)
         
         # Create directory for vector DB persistence
         self.vector_db_dir = "vectordb"
         os.makedirs(self.vector_db_dir, exist_ok=True)
         
-        # Dictionary to store vector stores for each PDF
-        self.vector_stores = {}
-        self.embeddings = OllamaEmbeddings(model=self.embedding_model)
+        # Chunk embeddings are cached by content hash and shared across documents
+        self.embedding_cache = EmbeddingCache(os.path.join("cache", "embeddings.sqlite"))
+        self.embeddings = CachedEmbeddings(
+            self.models.backend(EMBEDDING).embeddings(self.embedding_model),
+            self.embedding_model,
+            self.embedding_cache
+        )
         
-        # Load existing vector stores if they exist
-        self._load_existing_vector_stores()
-    
-    def _load_existing_vector_stores(self):
-        """Load existing vector stores from vectordb directory"""
-        if not os.path.exists(self.vector_db_dir):
-            return
-            
-        # Check for PDF-specific subdirectories
-        for pdf_dir in os.listdir(self.vector_db_dir):
-            pdf_vector_dir = os.path.join(self.vector_db_dir, pdf_dir)
-            if os.path.isdir(pdf_vector_dir):
-                try:
-                    # Try to load the vector store for this PDF
-                    vector_store = Chroma(
-                        persist_directory=pdf_vector_dir,
-                        embedding_function=self.embeddings
-                    )
-                    self.vector_stores[pdf_dir] = vector_store
-                    print(f"Loaded vector store for: {pdf_dir}")
-                except Exception as e:
-                    print(f"Error loading vector store for {pdf_dir}: {e}")
+        # Large PDFs are extracted on a process pool
+        self.extract_workers = extract_workers
+        self.parallel_extract_min_pages = parallel_extract_min_pages
+        
+        # Batched, concurrent embedding of document chunks during ingestion
+        self.embedding_pipeline = EmbeddingPipeline(
+            self.embeddings,
+            batch_size=embed_batch_size,
+            max_workers=embed_workers,
+            max_retries=embed_retries
+        )
+        
+        # Either one collection for all PDFs, filtered by "source" metadata
+        # (migrate existing stores with migrate_vector_stores.py), or a store
+        # per PDF, opened lazily with only the most recently used kept open
+        self.shared_vector_db_dir = "vectordb_shared"
+        if shared_vector_store:
+            self.vector_stores = SharedVectorStore(
+                self.shared_vector_db_dir,
+                lambda persist_directory: open_chroma(
+                    collection_name=shared_collection_name(self.embedding_model),
+                    persist_directory=persist_directory,
+                    embedding_function=self.embeddings
+                )
+            )
+        else:
+            self.vector_stores = VectorStoreRegistry(
+                self.vector_db_dir,
+                lambda persist_directory: open_chroma(
+                    persist_directory=persist_directory,
+                    embedding_function=self.embeddings
+                ),
+                max_open=max_open_stores,
+                max_open_bytes=max_open_store_bytes,
+                release_store=release_chroma
+            )
+        
+        # Hybrid retrieval: retrieval_fetch_k candidates from the vector store and
+        # the per-document BM25 index are fused and re-ranked for diversity, and
+        # retrieval_k of them become the context of each generation request
+        self.retrieval_k = retrieval_k
+        self.retrieval_fetch_k = retrieval_fetch_k
+        self.retrieval_mmr_lambda = retrieval_mmr_lambda
+        self.keyword_indexes = KeywordIndexStore("keyword_index", max_open=max_open_stores)
+        
+        # Admission control for LLM calls: bounded concurrency, fair per-user
+        # queueing and merging of identical in-flight requests
+        self.scheduler = GenerationScheduler(max_inflight=max_inflight_llm)
+        
+        # Near-duplicate detection when saving questions (None disables it)
+        self.question_index_dir = "question_index"
+        self.deduplicator = None
+        if dedup_threshold is not None:
+            self.deduplicator = QuestionDeduplicator(
+                self.embeddings,
+                # Vectors of different embedding models cannot share an index
+                lambda collection_name: open_chroma(
+                    collection_name=f"{collection_name}_{embedding_model_tag(self.embedding_model)}",
+                    persist_directory=self.question_index_dir,
+                    embedding_function=self.embeddings,
+                    collection_metadata={"hnsw:space": "cosine"}
+                ),
+                threshold=dedup_threshold
+            )
+        
+        # Generation results are cached so repeating a request skips the LLM
+        self.generation_cache = GenerationCache(
+            os.path.join("cache", "generations.sqlite"),
+            ttl_seconds=generation_cache_ttl,
+            max_entries=generation_cache_size
+        )
+        
+        # Uploaded documents are ingested by background workers; created last
+        # because queued jobs from a previous run start right away. Headless
+        # callers pass ingest_workers=0 and call process_document themselves.
+        self.ingest_jobs = None
+        if ingest_workers:
+            self.ingest_jobs = IngestJobQueue(
+                self.process_document,
+                os.path.join("cache", "ingest_jobs.sqlite"),
+                workers=ingest_workers
+            )
+            # Documents stored with another embedding model are re-embedded in the background
+            self.reembed_outdated()
+        
+        # Load both models in the background so the first requests do not wait for them
+        if preload_models:
+            self.models.preload()
+        
+        # Cache, queue and job statistics are exported with the metrics until close()
+        self._metrics_collector = REGISTRY.register_collector(self.metrics_samples)
+
+    def close(self):
+        """Stop the background workers and the model pool, and stop exporting metrics"""
+        REGISTRY.unregister_collector(self._metrics_collector)
+        if self.ingest_jobs is not None:
+            self.ingest_jobs.close()
+        self.models.close()
+
+    def metrics_samples(self):
+        """Current cache hit counts, scheduler queue and ingestion backlog, for the metrics endpoint"""
+        embedding = self.embeddings.stats()
+        generation = self.generation_cache.stats()
+        scheduler = self.scheduler.stats()
+        samples = [
+            ("qbank_cache_hits_total", "counter", "Cache hits by cache", {"cache": "embedding"}, embedding["hits"]),
+            ("qbank_cache_hits_total", "counter", "Cache hits by cache", {"cache": "generation"}, generation["hits"]),
+            ("qbank_cache_misses_total", "counter", "Cache misses by cache", {"cache": "embedding"}, embedding["misses"]),
+            ("qbank_cache_misses_total", "counter", "Cache misses by cache", {"cache": "generation"}, generation["misses"]),
+            ("qbank_llm_queue_depth", "gauge", "LLM calls waiting for a scheduler slot", {}, scheduler["queue_depth"]),
+            ("qbank_llm_inflight", "gauge", "LLM calls running", {}, scheduler["inflight"]),
+            ("qbank_llm_merged_total", "counter", "Requests merged into an identical in-flight call", {}, scheduler["merged"]),
+            ("qbank_llm_queue_wait_seconds_avg", "gauge", "Average wait for a scheduler slot", {}, scheduler["avg_wait"])
+        ]
+        if self.ingest_jobs is not None:
+            samples.append(("qbank_ingest_jobs_pending", "gauge", "Ingestion jobs queued or running", {},
+                            self.ingest_jobs.pending()))
+        for role, status in self.models.status().items():
+            samples.append(("qbank_model_ready", "gauge", "1 when the model serving a role is loaded",
+                            {"role": role, "model": status["model"]}, 1 if status["state"] == "ready" else 0))
+        return samples
+
+    def embeddings_outdated(self, pdf_filename):
+        """True if a document's stored vectors come from another embedding model (or an unknown one)"""
+        previous = self.question_store.document_version(bank_key(pdf_filename))
+        if previous is None:
+            return pdf_filename in self.vector_stores
+        return previous["embedding_model"] != self.embedding_model
+
+    def reembed_outdated(self):
+        """Queue uploaded documents embedded with another model for re-ingestion. Returns how many."""
+        queued = 0
+        for pdf_filename in sorted(os.listdir(self.upload_dir)):
+            if not pdf_filename.lower().endswith(".pdf"):
+                continue
+            try:
+                if self.embeddings_outdated(pdf_filename):
+                    self.ingest_jobs.submit(os.path.join(self.upload_dir, pdf_filename))
+                    queued += 1
+            except Exception as e:
+                print(f"Error checking embeddings of {pdf_filename}: {e}")
+        if queued:
+            print(f"Re-embedding {queued} documents with {self.embedding_model}")
+        return queued
+
+    def warm_up(self, max_documents=None):
+        """Import the retrieval libraries and open the most recently uploaded documents' stores.
+
+        Meant to run in the background after start-up, so the first requests
+        do not pay for it. At most max_documents (default: as many as are kept
+        open) vector stores and keyword indexes are opened. Returns how many.
+        """
+        import langchain.docstore.document
+        import langchain.text_splitter
+        
+        max_documents = max_documents or self.keyword_indexes.max_open
+        pdf_filenames = [name for name in os.listdir(self.upload_dir) if name.lower().endswith(".pdf")]
+        pdf_filenames.sort(key=lambda name: os.path.getmtime(os.path.join(self.upload_dir, name)), reverse=True)
+        warmed = 0
+        for pdf_filename in pdf_filenames[:max_documents]:
+            try:
+                vector_store = self.vector_stores.get(pdf_filename)
+                if vector_store is not None:
+                    self._keyword_index(pdf_filename, vector_store)
+                    warmed += 1
+            except Exception as e:
+                print(f"Error opening stores of {pdf_filename}: {e}")
+        return warmed
+
+    def iter_pdf_pages(self, pdf_path):
+        """Yield (page_number, text) for each page of a PDF as it is extracted"""
+        return iter_pdf_pages(
+            pdf_path,
+            workers=self.extract_workers,
+            parallel_min_pages=self.parallel_extract_min_pages
+        )
 
     def extract_text_from_pdf(self, pdf_path):
         """Extract text from a PDF file"""
-        text = ""
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page_num in range(len(pdf_reader.pages)):
-                    text += pdf_reader.pages[page_num].extract_text() + "\n"
-            return text
+            return "".join(page_text + "\n" for _, page_text in self.iter_pdf_pages(pdf_path))
         except Exception as e:
             print(f"Error extracting text from PDF: {e}")
             return ""
 
-    def process_document(self, file_path):
-        """Process a document and add it to a document-specific vector store"""
-        # Extract text from PDF
-        document_text = self.extract_text_from_pdf(file_path)
-        
-        if not document_text:
-            return False
-        
+    def process_document(self, file_path, on_progress=None):
+        """Process a document and add it to a document-specific vector store.
+
+        Pages are extracted, split and embedded as a stream, so embedding starts
+        before extraction finishes. Re-uploading a PDF only embeds chunks that
+        are new, deletes chunks that are gone and flags saved questions citing
+        them as stale. on_progress, if given, is called with a dict of pages,
+        total_pages, chunks (found so far) and chunks_done (stored so far).
+        Returns a dict of ingestion stats (chunks, added, unchanged, removed,
+        cache hits/misses, stale questions, version) or False on failure.
+        """
+        with span("ingest", document=os.path.basename(file_path)) as current:
+            # Hash and extract a private copy, so an upload replacing the file
+            # midway cannot mix two versions or record the other version's hash
+            with pdf_snapshot(file_path) as snapshot:
+                stats = self._ingest(file_path, snapshot, on_progress)
+            current.set(**(stats or {"failed": True}))
+            return stats
+
+    def _ingest(self, file_path, snapshot, on_progress=None):
         # Get PDF filename without path
         pdf_filename = os.path.basename(file_path)
+        document = bank_key(pdf_filename)
         
-        # Create a PDF-specific directory for vector store
-        pdf_vector_dir = os.path.join(self.vector_db_dir, pdf_filename)
-        os.makedirs(pdf_vector_dir, exist_ok=True)
+        # An identical file needs no work at all
+        file_hash = file_sha256(snapshot)
+        previous = self.question_store.document_version(document)
+        outdated = self.embeddings_outdated(pdf_filename)
+        if previous is not None and previous["file_hash"] == file_hash and not outdated and pdf_filename in self.vector_stores:
+            return {"chunks": previous["chunks"], "added": 0, "unchanged": previous["chunks"], "removed": 0,
+                    "moved": 0, "cache_hits": 0, "cache_misses": 0, "stale_questions": 0,
+                    "version": previous["version"]}
         
-        # Split text into chunks
+        # Split each page into chunks as it arrives
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             length_function=len
         )
-        chunks = text_splitter.split_text(document_text)
         
-        # Create vector store specifically for this PDF
-        vector_store = Chroma.from_texts(
-            texts=chunks,
-            embedding=self.embeddings,
-            persist_directory=pdf_vector_dir
-        )
+        # Vectors from another embedding model cannot be mixed with new ones,
+        # so the document is embedded from scratch (cached chunks are reused)
+        if outdated:
+            try:
+                self.vector_stores.reset(pdf_filename)
+            except Exception as e:
+                print(f"Error resetting vector store of {pdf_filename}: {e}")
+                return False
+        
+        # Open (or create) the vector store for this PDF
+        vector_store = self.vector_stores.get(pdf_filename, create=True)
+        if vector_store is None:
+            return False
+        
+        # Chunks already stored (by content-hash id) are kept as they are
+        try:
+            existing = vector_store.get_metadatas()
+        except Exception as e:
+            print(f"Error reading existing chunks of {pdf_filename}: {e}")
+            return False
+        
+        # The keyword index is rebuilt from the new version as chunks stream by
+        keyword_index = KeywordIndex()
+        current = set()
+        moved = {}
+        progress = {"pages": 0, "total_pages": None, "chunks": 0, "chunks_done": 0}
+        done = {"unchanged": 0, "embedded": 0}
+        
+        def report(pipeline_stats=None):
+            if pipeline_stats is not None:
+                done["embedded"] = pipeline_stats["chunks"]
+            progress["chunks_done"] = done["unchanged"] + done["embedded"]
+            if on_progress:
+                on_progress(dict(progress))
         
-        # Persist the vector store
-        if hasattr(vector_store, 'persist'):
-            vector_store.persist()
+        def iter_new_chunks():
+            if on_progress:
+                progress["total_pages"] = count_pdf_pages(snapshot)
+            for page_number, page_text in self.iter_pdf_pages(snapshot):
+                for chunk in text_splitter.split_text(page_text):
+                    chunk_key = chunk_id(chunk)
+                    if chunk_key in current:
+                        continue
+                    current.add(chunk_key)
+                    metadata = {"source": pdf_filename, "page": page_number}
+                    keyword_index.add([chunk_key], [chunk], [metadata])
+                    if chunk_key not in existing:
+                        yield chunk_key, chunk, metadata
+                    else:
+                        done["unchanged"] += 1
+                        if existing[chunk_key].get("page") != page_number:
+                            moved[chunk_key] = metadata
+                progress["pages"] = page_number
+                progress["chunks"] = len(current)
+                report()
+        
+        # Each finished batch is written and persisted right away, so a failure
+        # partway through keeps everything embedded so far
+        try:
+            stats = self.embedding_pipeline.run(iter_new_chunks(), vector_store.upsert, on_progress=report)
+        except Exception as e:
+            print(f"Error processing {pdf_filename}: {e}")
+            return False
+        
+        # A PDF without extractable text (e.g. scanned images) has nothing to embed
+        if not current:
+            return False
+        
+        # Only now that the new version is fully stored, drop what it no longer contains
+        removed = [chunk_key for chunk_key in existing if chunk_key not in current]
+        try:
+            vector_store.update_metadatas(moved.keys(), moved.values())
+            vector_store.delete(removed)
+        except Exception as e:
+            print(f"Error removing old chunks of {pdf_filename}: {e}")
+            return False
         
-        # Add to our dictionary of vector stores
-        self.vector_stores[pdf_filename] = vector_store
+        try:
+            self.keyword_indexes.save(pdf_filename, keyword_index)
+        except Exception as e:
+            # Retrieval still works from the vector store alone
+            print(f"Error saving keyword index for {pdf_filename}: {e}")
         
-        return True
+        stats["added"] = stats.pop("chunks")
+        stats["chunks"] = len(current)
+        stats["unchanged"] = len(current) - stats["added"]
+        stats["removed"] = len(removed)
+        stats["moved"] = len(moved)
+        stats["stale_questions"] = self.question_store.flag_stale(document, removed)
+        stats["version"] = self.question_store.record_document_version(
+            document, file_hash, len(current), stats["added"], len(removed), self.embedding_model
+        )
+        return stats
 
     def save_uploaded_file(self, file_upload):
         """Save an uploaded file to the uploads directory"""
         if not file_upload:
             return None
             
-        filename = os.path.join(self.upload_dir, file_upload.name)
-        with open(filename, "wb") as f:
-            f.write(file_upload.read())
-        return filename
+        return store_upload(file_upload, os.path.join(self.upload_dir, os.path.basename(file_upload.name)))
 
-    def generate_questions_with_rag(self, pdf_filename, topic, difficulty, q_type, num):
-        """Generate questions using RAG for a specific PDF"""
-        if q_type not in self.templates:
-            raise ValueError(f"Unsupported question type: {q_type}")
-            
-        # Build the prompt
+    def _backend(self, role=GENERATION):
+        """Return the backend serving a role"""
+        return self.models.backend(role)
+
+    def _keyword_index(self, pdf_filename, vector_store):
+        """Load a PDF's keyword index, building it from the vector store if it predates keyword indexing"""
+        keyword_index = self.keyword_indexes.get(pdf_filename)
+        if keyword_index is None:
+            keyword_index = KeywordIndex(*vector_store.get_chunks())
+            self.keyword_indexes.save(pdf_filename, keyword_index)
+        return keyword_index
+
+    def _retrieve_context(self, pdf_filename, topic, difficulty, q_type):
+        """Return the chunks retrieved for a generation request.
+
+        Vector and BM25 candidates are fused and re-ranked with MMR, so the
+        context covers more of the document than the few nearest chunks.
+        """
+        vector_store = self.vector_stores.get(pdf_filename)
+        if vector_store is None:
+            return []
+        
+        # Construct a query combining the topic and difficulty
+        query = f"I need to create {q_type} questions about {topic} at {difficulty} level."
+        vector_hits = []
+        # Until a document is re-embedded with the current model only its keyword index is searched
+        with span("vector_search"):
+            if not self.embeddings_outdated(pdf_filename):
+                vector_hits = [
+                    (chunk_id(doc.page_content), doc.page_content, doc.metadata)
+                    for doc in vector_store.similarity_search(query, k=self.retrieval_fetch_k)
+                ]
+        with span("rerank"):
+            chunks = hybrid_search(
+                topic,
+                self._keyword_index(pdf_filename, vector_store),
+                vector_hits,
+                k=self.retrieval_k,
+                fetch_k=self.retrieval_fetch_k,
+                mmr_lambda=self.retrieval_mmr_lambda
+            )
+        from langchain.docstore.document import Document
+        return [Document(page_content=text, metadata=metadata) for _, text, metadata in chunks]
+
+    def _build_prompt(self, pdf_filename, topic, difficulty, q_type, num, docs):
+        """Build the LLM prompt, adding retrieved context when there is any"""
         prompt = self.templates[q_type].format(topic=topic, difficulty=difficulty, num=num)
+        if not docs:
+            return prompt + "\n" + JSON_FORMAT_INSTRUCTIONS
         
-        # If we have a vector store for this PDF, use it for RAG
-        if pdf_filename in self.vector_stores:
-            try:
-                # Get the vector store for this specific PDF
-                vector_store = self.vector_stores[pdf_filename]
-                
-                # Set up retrieval QA chain
-                llm = Ollama(model=self.model)
-                qa_chain = RetrievalQA.from_chain_type(
-                    llm=llm,
-                    chain_type="stuff",
-                    retriever=vector_store.as_retriever(search_kwargs={"k": 3})
-                )
-                
-                # Construct a query combining the topic and difficulty
-                query = f"I need to create {q_type} questions about {topic} at {difficulty} level."
-                
-                # Get relevant context from this specific PDF
-                docs = vector_store.similarity_search(query, k=3)
-                context = "\n".join([doc.page_content for doc in docs])
-                
-                # Enhanced prompt with context
-                enhanced_prompt = f"""
+        # Number the passages so questions can cite the ones they are based on
+        context = "\n".join(f"[{i + 1}] {doc.page_content}" for i, doc in enumerate(docs))
+        return f"""
                 Context information from {pdf_filename}:
                 {context}
                 
@@ -169,43 +565,329 @@ class AIQuestionBankGenerator:
                 {prompt}
                 
                 Format each question clearly and include answers.
+                {JSON_FORMAT_INSTRUCTIONS}
                 """
-                
-                # Generate response using the QA chain
-                response = ollama.chat(model=self.model, messages=[{"role": "user", "content": enhanced_prompt}])
-                return response["message"]["content"].split('\n')
-            except Exception as e:
-                print(f"Error using RAG for generation: {e}")
-                # Fall back to standard generation if RAG fails
-                pass
+
+    @staticmethod
+    def _context_refs(docs):
+        """(chunk id, page) for each retrieved passage, in prompt order"""
+        return [(chunk_id(doc.page_content), doc.metadata.get("page")) for doc in docs or []]
+
+    def _chat(self, prompt):
+        """Send a single-turn prompt to the generation model and return the reply text"""
+        try:
+            response = self._backend().chat(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                format="json",
+                keep_alive=self.models.keep_alive
+            )
+        except Exception:
+            LLM_CALLS.inc(model=self.model, status="error")
+            raise
+        LLM_CALLS.inc(model=self.model, status="ok")
+        record_llm_usage(self.model, response)
+        return response["message"]["content"]
+
+    def _document_version(self, pdf_filename):
+        """Cheap version stamp for an uploaded PDF (modification time and size)"""
+        try:
+            st = os.stat(os.path.join(self.upload_dir, pdf_filename))
+            return f"{st.st_mtime_ns}-{st.st_size}"
+        except OSError:
+            return None
+
+    def _retrieve_or_empty(self, pdf_filename, topic, difficulty, q_type, timings=None):
+        """Retrieve context for a request, or return [] if the PDF has no usable store"""
+        # If we have a vector store for this PDF, use it for RAG
+        if pdf_filename not in self.vector_stores:
+            return []
+        try:
+            # Get relevant context from this specific PDF
+            with stage_timer(timings, "retrieve"):
+                return self._retrieve_context(pdf_filename, topic, difficulty, q_type)
+        except Exception as e:
+            print(f"Error using RAG for generation: {e}")
+            # Fall back to standard generation if RAG fails
+            return []
+
+    def _prepare_generation(self, pdf_filename, topic, difficulty, q_type, num, timings=None, docs=None):
+        """Build the prompt for a request, retrieving context unless docs are given.
+
+        Returns (prompt, cache_key, context_refs).
+        """
+        if q_type not in self.templates:
+            raise ValueError(f"Unsupported question type: {q_type}")
         
-        # Standard generation without RAG
+        if docs is None:
+            docs = self._retrieve_or_empty(pdf_filename, topic, difficulty, q_type, timings)
+        
+        with stage_timer(timings, "prompt"):
+            prompt = self._build_prompt(pdf_filename, topic, difficulty, q_type, num, docs)
+        
+        context = "\n".join(doc.page_content for doc in docs)
+        cache_key = GenerationCache.make_key(
+            document=pdf_filename,
+            version=self._document_version(pdf_filename),
+            context=hashlib.sha256(context.encode("utf-8")).hexdigest(),
+            template=self.templates[q_type],
+            format=QUESTION_FORMAT_VERSION,
+            model=self.model,
+            params={"topic": topic, "difficulty": difficulty, "q_type": q_type, "num": num}
+        )
+        return prompt, cache_key, self._context_refs(docs)
+
+    def generate_questions_with_rag(self, pdf_filename, topic, difficulty, q_type, num, timings=None, nonce=None, docs=None):
+        """Generate questions using RAG for a specific PDF.
+
+        Returns a list of question records (stem, options, answer, explanation,
+        sources, pages). Results are cached per document version, retrieved
+        context, template, model and parameters. Passing a nonce (e.g. for
+        Regenerate) skips the cache lookup; the fresh result then replaces the
+        cached one. Context already retrieved by the caller can be passed as
+        docs. If timings is a dict, the seconds spent in the retrieve, prompt,
+        cache, llm and parse stages are recorded in it.
+        """
+        with span("generate", document=pdf_filename, q_type=q_type, num=num) as current:
+            prompt, cache_key, refs = self._prepare_generation(pdf_filename, topic, difficulty, q_type, num, timings, docs)
+            
+            content = None
+            if nonce is None:
+                with stage_timer(timings, "cache"):
+                    content = self.generation_cache.get(cache_key)
+            current.set(cached=content is not None)
+            
+            if content is None:
+                try:
+                    with stage_timer(timings, "llm"):
+                        content = self._chat(prompt)
+                except Exception as e:
+                    print("Error generating questions:", e)
+                    return []
+                if content:
+                    self.generation_cache.put(cache_key, content)
+            
+            with stage_timer(timings, "parse"):
+                questions = parse_questions(content, refs)
+            current.set(questions=len(questions))
+            return questions
+
+    def _chat_stream(self, prompt):
+        """Stream the generation model's reply to a single-turn prompt, piece by piece"""
+        status = "error"
+        try:
+            stream = self._backend().chat(
+                model=self.model,
+                messages=[{"role": "user", "content": prompt}],
+                format="json",
+                stream=True,
+                keep_alive=self.models.keep_alive
+            )
+            for part in stream:
+                if part.get("done"):
+                    record_llm_usage(self.model, part)
+                yield part["message"]["content"]
+            status = "ok"
+        finally:
+            LLM_CALLS.inc(model=self.model, status=status)
+
+    def stream_questions_with_rag(self, pdf_filename, topic, difficulty, q_type, num, timings=None, user=None, nonce=None):
+        """Generate questions using RAG, yielding the question records completed so far.
+
+        The last value yielded is the same list generate_questions_with_rag
+        returns, and the same result cache is used. The LLM call waits for a scheduler slot in the given user's
+        queue, and identical requests already streaming share one LLM call. An
+        LLM error is raised to the caller after the questions completed so far
+        have been yielded. If timings is a dict, the retrieve, prompt, cache,
+        first_token (including queue wait) and llm stages are recorded in it.
+        The last two are also observed in the stage metrics directly: a span
+        cannot be held across the yields, since the consumer may resume from
+        other threads.
+        """
+        prompt, cache_key, refs = self._prepare_generation(pdf_filename, topic, difficulty, q_type, num, timings)
+        
+        if nonce is None:
+            with stage_timer(timings, "cache"):
+                cached = self.generation_cache.get(cache_key)
+            if cached is not None:
+                yield parse_questions(cached, refs)
+                return
+        
+        key = ("questions", pdf_filename, topic, difficulty, q_type, num, nonce)
+        pieces = []
+        completed = 0
+        start = time.perf_counter()
         try:
-            response = ollama.chat(model=self.model, messages=[{"role": "user", "content": prompt}])
-            return response["message"]["content"].split('\n')
+            for piece in self.scheduler.stream(key, user, self._chat_stream, prompt):
+                if not pieces:
+                    first_token = time.perf_counter() - start
+                    STAGE_SECONDS.observe(first_token, stage="first_token")
+                    if timings is not None:
+                        timings["first_token"] = first_token
+                pieces.append(piece)
+                # A question can only have been completed by a piece that closes an object or a line
+                if "}" in piece or "\n" in piece:
+                    records = parse_complete_questions("".join(pieces), refs)
+                    if len(records) > completed:
+                        completed = len(records)
+                        yield records
         except Exception as e:
+            # The caller reports the error; a partial reply is neither cached nor parsed
+            STAGE_ERRORS.inc(stage="llm")
             print("Error generating questions:", e)
-            return []
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            STAGE_SECONDS.observe(elapsed, stage="llm")
+            if timings is not None:
+                timings["llm"] = elapsed
+        
+        content = "".join(pieces)
+        if content:
+            self.generation_cache.put(cache_key, content)
+        with stage_timer(timings, "parse"):
+            yield parse_questions(content, refs)
+
+    def generate_questions(self, pdf_filename, topic, difficulty, q_type, num, timings=None, user=None, nonce=None):
+        """Generate questions with RAG for a specific PDF.
+
+        The call goes through the scheduler: it waits its turn in the user's queue,
+        and identical requests already in flight share one LLM call.
+        """
+        key = ("questions", pdf_filename, topic, difficulty, q_type, num, nonce)
+        questions = self.scheduler.run(
+            key, user, self.generate_questions_with_rag,
+            pdf_filename, topic, difficulty, q_type, num, timings=timings, nonce=nonce
+        )
+        # Merged callers share the result, so hand each one its own list
+        return list(questions)
 
-    def generate_questions(self, pdf_filename, topic, difficulty, q_type, num):
-        """Generate questions with RAG for a specific PDF"""
-        return self.generate_questions_with_rag(pdf_filename, topic, difficulty, q_type, num)
+    def generate_question_set(self, pdf_filename, topic, difficulty, mix, timings=None, user=None, nonce=None):
+        """Generate several question types from one retrieval.
+
+        mix maps question types to counts, e.g. {"mcq": 10, "true_false": 5}.
+        Context is retrieved once and shared by all types; the per-type LLM
+        calls then run concurrently through the scheduler. Returns a dict of
+        question type -> list of questions, in the order of mix.
+        """
+        mix = {q_type: int(num) for q_type, num in mix.items() if int(num) > 0}
+        for q_type in mix:
+            if q_type not in self.templates:
+                raise ValueError(f"Unsupported question type: {q_type}")
+        if not mix:
+            return {}
+        
+        start = time.perf_counter()
+        docs = self._retrieve_or_empty(pdf_filename, topic, difficulty, "mixed exam", timings)
+        
+        def generate(q_type, num):
+            # Built on the shared "mixed exam" context, so never merged with a single-type request
+            key = ("question_set", pdf_filename, topic, difficulty, q_type, num, nonce)
+            return self.scheduler.run(
+                key, user, self.generate_questions_with_rag,
+                pdf_filename, topic, difficulty, q_type, num, nonce=nonce, docs=docs
+            )
+        
+        with ThreadPoolExecutor(max_workers=len(mix)) as pool:
+            futures = {q_type: pool.submit(generate, q_type, num) for q_type, num in mix.items()}
+            results = {q_type: list(future.result()) for q_type, future in futures.items()}
+        
+        if timings is not None:
+            timings["total"] = time.perf_counter() - start
+        return results
+
+    @property
+    def question_bank(self):
+        """The topic-based question bank that is not tied to a PDF, as a nested dict"""
+        return self.question_store.get_bank(GLOBAL_BANK)
 
     def add_to_bank(self, topic, difficulty, q_type, questions):
-        self.question_bank.setdefault(topic, {}).setdefault(difficulty, {}).setdefault(q_type, []).extend(questions)
+        self.question_store.add_questions(GLOBAL_BANK, topic, difficulty, q_type, questions)
         print(f"Added {len(questions)} {q_type} questions to bank.")
 
-    def save_question_bank(self, filename="question_bank.json"):
+    def save_question_bank(self, filename="question_bank_export.json"):
+        """Export the topic-based bank to JSON. Questions are already persisted by add_to_bank."""
         with open(filename, "w") as f:
             json.dump(self.question_bank, f, indent=2)
-        print(f"Question bank saved to {filename}")
+        print(f"Question bank exported to {filename}")
 
-    def generate_exam_paper(self, topic, difficulty, num_mcq=5, num_tf=3, num_short=2, num_long=1):
-        exam_paper = {"title": f"{topic} Exam ({difficulty} Level)", "date": datetime.now().strftime("%Y-%m-%d"), "sections": []}
-        
-        for q_type, num in {"mcq": num_mcq, "true_false": num_tf, "short": num_short, "long": num_long}.items():
-            if topic in self.question_bank and difficulty in self.question_bank[topic] and q_type in self.question_bank[topic][difficulty]:
-                questions = random.sample(self.question_bank[topic][difficulty][q_type], min(num, len(self.question_bank[topic][difficulty][q_type])))
-                exam_paper["sections"].append({"type": q_type, "questions": questions})
+    def get_pdf_question_bank(self, pdf_filename):
+        """Get a PDF's saved questions as a nested topic -> difficulty -> type -> [questions] dict"""
+        return self.question_store.get_bank(bank_key(pdf_filename))
+
+    def query_pdf_question_bank(self, pdf_filename, difficulty=None, q_type=None, search=None, page=1, page_size=20,
+                                stale_only=False):
+        """Get one page of a PDF's saved questions matching the filters.
+
+        Returns (rows, total) where rows are (id, topic, difficulty, q_type, question, stale).
+        """
+        page = max(1, int(page))
+        return self.question_store.query_questions(
+            bank_key(pdf_filename), difficulty, q_type, search,
+            offset=(page - 1) * page_size, limit=page_size, stale_only=stale_only
+        )
+
+    def save_questions(self, pdf_filename, topic, difficulty, q_type, questions):
+        """Append questions to a PDF's question bank, skipping near-duplicates.
+
+        Each new question is embedded and compared with the questions of the same
+        type already saved for the PDF. Returns (ids of saved questions, list of
+        questions rejected as duplicates).
+        """
+        document = bank_key(pdf_filename)
+        if self.deduplicator is None:
+            return self.question_store.add_questions(document, topic, difficulty, q_type, questions), []
         
-        return exam_paper
+        with self.deduplicator.lock(document):
+            try:
+                self.deduplicator.sync(document, self.question_store)
+                results = self.deduplicator.check(document, q_type, questions)
+            except Exception as e:
+                # Never lose questions because the embedding model is unavailable
+                print(f"Error checking for duplicate questions: {e}")
+                return self.question_store.add_questions(document, topic, difficulty, q_type, questions), []
+            
+            accepted = [(question, vector) for question, (vector, _, _, duplicate) in zip(questions, results) if not duplicate]
+            duplicates = [question for question, (_, _, _, duplicate) in zip(questions, results) if duplicate]
+            ids = self.question_store.add_questions(document, topic, difficulty, q_type, [question for question, _ in accepted])
+            try:
+                self.deduplicator.add(
+                    document,
+                    [(row_id, q_type, question) for row_id, (question, _) in zip(ids, accepted)],
+                    [vector for _, vector in accepted]
+                )
+                self.deduplicator.mark_synced(document, self.question_store)
+            except Exception as e:
+                # The index is rebuilt from the store on the next sync
+                print(f"Error indexing saved questions: {e}")
+                self.deduplicator.invalidate(document)
+        return ids, duplicates
+
+    def compact_question_bank(self, pdf_filename):
+        """Remove near-duplicate questions already saved for a PDF. Returns how many were removed."""
+        if self.deduplicator is None:
+            return 0
+        return self.deduplicator.compact(bank_key(pdf_filename), self.question_store)
+
+    def build_exams(self, pdf_filename, topic, difficulty, counts, variants=1, exclude_days=None, record=True):
+        """Assemble exam variants from a PDF's question bank.
+
+        counts maps question type to the number of questions. Questions are
+        spread across the document's pages, and questions issued in the last
+        exclude_days days (default: exam_exclude_days) are not reused. With
+        record false the exams are only a preview: their questions are not
+        recorded as issued (see issue_exams). Returns (exams, shortages).
+        """
+        if exclude_days is None:
+            exclude_days = self.exam_exclude_days
+        return self.exam_builder.build(bank_key(pdf_filename), topic, difficulty, counts, variants, exclude_days,
+                                       record=record)
+
+    def issue_exams(self, exams):
+        """Record the questions of previewed exams as issued; returns how many were recorded"""
+        return self.exam_builder.issue(exams)
+
+    def generate_exam_paper(self, topic, difficulty, num_mcq=5, num_tf=3, num_short=2, num_long=1):
+        counts = {"mcq": num_mcq, "true_false": num_tf, "short": num_short, "long": num_long}
+        exams, _ = self.exam_builder.build(GLOBAL_BANK, topic, difficulty, counts, 1, self.exam_exclude_days)
+        return exams[0]
@@ -0,0 +1,55 @@
+import threading
+
+
+class OllamaBackend:
+    """Chat, embeddings and model loading through an Ollama server.
+
+    This is the default backend. Any object with the same chat(),
+    embeddings() and load() methods can be passed to
+    AIQuestionBankGenerator(backends=...) instead, e.g. to send one role's
+    traffic to another server or to an in-process model. The Ollama
+    stand-in server (ollama_standin.py) needs no backend of its own: point
+    an OllamaBackend at it.
+    """
+
+    def __init__(self, host=None):
+        # None uses the client default (OLLAMA_HOST or localhost:11434)
+        self.host = host
+        self._lock = threading.Lock()
+        self._client = None
+
+    def client(self):
+        """The long-lived Ollama client, created on first use"""
+        with self._lock:
+            if self._client is None:
+                # Imported on first use so importing the app stays fast
+                import ollama
+                self._client = ollama.Client(host=self.host)
+            return self._client
+
+    def chat(self, model, messages, stream=False, **options):
+        """An Ollama chat response, or an iterator of response parts when streaming.
+
+        options (format, keep_alive, options, ...) are passed through to /api/chat.
+        """
+        return self.client().chat(model=model, messages=messages, stream=stream, **options)
+
+    def embeddings(self, model):
+        """LangChain embeddings (embed_documents, embed_query) for a model"""
+        from langchain_community.embeddings import OllamaEmbeddings
+        options = {"model": model}
+        if self.host:
+            options["base_url"] = self.host
+        return OllamaEmbeddings(**options)
+
+    def load(self, model, embedding=False, keep_alive=None):
+        """Load a model (if needed) and set how long it stays loaded"""
+        # An empty request loads the model and sets its keep-alive
+        client = self.client()
+        if embedding:
+            if hasattr(client, "embed"):
+                client.embed(model=model, input="", keep_alive=keep_alive)
+            else:
+                client.embeddings(model=model, prompt="", keep_alive=keep_alive)
+        else:
+            client.generate(model=model, prompt="", keep_alive=keep_alive)
@@ -0,0 +1,261 @@
+"""Headless batch question generation over many PDFs.
+
+Reads a JSON manifest of documents x difficulties x question types x counts,
+ingests any document that has not been processed yet, generates the
+questions with bounded concurrency and saves them straight to the question
+bank (near-duplicates are skipped as in the UI). Finished tasks are appended
+to a checkpoint file, so an interrupted run picks up where it stopped.
+
+Each PDF is copied into the uploads directory under its file name, and its
+questions are saved under the topic the UI derives from that name, so they
+show up in the UI and in exams. Only when two different paths share a file
+name do they get a hash of their path appended to keep them apart. A
+manifest "topic" is used in the generation prompt and kept as "prompt_topic"
+in each question.
+
+Manifest example:
+
+    {
+      "defaults": {"difficulties": ["beginner", "advanced"], "types": {"mcq": 10, "true_false": 5}},
+      "documents": [
+        "textbooks/*.pdf",
+        {"path": "notes/networks.pdf", "topic": "Computer Networks", "types": {"short": 5}}
+      ]
+    }
+
+Run:
+
+    python batch_generate.py manifest.json --concurrency 4
+"""
+import argparse
+import filecmp
+import glob
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app import AIQuestionBankGenerator, store_upload
+
+DEFAULT_DIFFICULTIES = ["beginner"]
+DEFAULT_TYPES = {"mcq": 5}
+
+
+def topic_from_filename(filename):
+    """Same topic the UI derives from a PDF filename, so exams can find the questions"""
+    return os.path.splitext(filename)[0].replace('_', ' ')
+
+
+def upload_names(paths):
+    """Map each PDF path to its file name in the uploads directory.
+
+    A PDF keeps its own file name, as when uploaded through the UI. Different
+    paths that share a file name get a hash of their path appended instead
+    of overwriting each other.
+    """
+    by_name = {}
+    for path in paths:
+        by_name.setdefault(os.path.basename(path), set()).add(os.path.realpath(path))
+    names = {}
+    for path in paths:
+        filename = os.path.basename(path)
+        if len(by_name[filename]) > 1:
+            stem, ext = os.path.splitext(filename)
+            digest = hashlib.sha1(os.path.realpath(path).encode("utf-8")).hexdigest()[:8]
+            filename = f"{stem}_{digest}{ext}"
+        names[path] = filename
+    return names
+
+
+def load_manifest(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def expand_tasks(manifest, base_dir="."):
+    """Turn a manifest into a list of task dicts (path, pdf, topic, prompt_topic, difficulty, q_type, num)"""
+    defaults = manifest.get("defaults", {})
+    entries = []
+    for entry in manifest.get("documents", []):
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        pattern = entry["path"]
+        if not os.path.isabs(pattern):
+            pattern = os.path.join(base_dir, pattern)
+        entries.append((entry, sorted(glob.glob(pattern)) or [pattern]))
+    names = upload_names([path for _, paths in entries for path in paths])
+
+    tasks = []
+    seen = set()
+    for entry, paths in entries:
+        difficulties = entry.get("difficulties", defaults.get("difficulties", DEFAULT_DIFFICULTIES))
+        types = entry.get("types", defaults.get("types", DEFAULT_TYPES))
+        for path in paths:
+            pdf_filename = names[path]
+            # Saved under the topic of the original file name; a manifest topic only steers the prompt
+            topic = topic_from_filename(os.path.basename(path))
+            prompt_topic = entry.get("topic") or topic
+            for difficulty in difficulties:
+                for q_type, num in types.items():
+                    task = {"path": path, "pdf": pdf_filename, "topic": topic, "prompt_topic": prompt_topic,
+                            "difficulty": difficulty, "q_type": q_type, "num": int(num)}
+                    key = task_key(task)
+                    if task["num"] > 0 and key not in seen:
+                        seen.add(key)
+                        tasks.append(task)
+    return tasks
+
+
+def task_key(task):
+    return "|".join(str(task[part]) for part in ("pdf", "topic", "difficulty", "q_type", "num"))
+
+
+class Checkpoint:
+    """Append-only JSON-lines record of finished tasks"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    if record.get("status") == "done":
+                        self.done.add(record["key"])
+
+    def record(self, key, status, **details):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(dict(details, key=key, status=status, at=time.time())) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if status == "done":
+                self.done.add(key)
+
+
+def ensure_ingested(generator, path, pdf_filename=None):
+    """Copy a PDF into the uploads directory and process it unless it is already ingested"""
+    pdf_filename = pdf_filename or os.path.basename(path)
+    upload_path = os.path.join(generator.upload_dir, pdf_filename)
+    # Copying an identical file would still change its mtime and invalidate cached generations
+    if not os.path.exists(upload_path) or not filecmp.cmp(path, upload_path, shallow=False):
+        store_upload(path, upload_path)
+    # Unchanged files are recognised by their hash and skipped inside process_document
+    stats = generator.process_document(upload_path)
+    if not stats:
+        raise RuntimeError(f"Could not process {pdf_filename}")
+    return stats
+
+
+def run_batch(generator, tasks, checkpoint, concurrency=4, user="batch", on_result=None):
+    """Run generation tasks with at most `concurrency` in flight.
+
+    Documents are ingested first (also `concurrency` at a time). Tasks already
+    recorded as done in the checkpoint are skipped. on_result(task, record) is
+    called after each task. Returns a summary dict.
+    """
+    pending = [task for task in tasks if task_key(task) not in checkpoint.done]
+    summary = {"tasks": len(tasks), "skipped": len(tasks) - len(pending), "done": 0, "failed": 0,
+               "saved": 0, "duplicates": 0}
+    if not pending:
+        return summary
+
+    uploads = {task["path"]: task["pdf"] for task in pending}
+    failed_documents = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(ensure_ingested, generator, path, uploads[path]): path for path in sorted(uploads)}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error ingesting {futures[future]}: {e}")
+                failed_documents[futures[future]] = str(e)
+
+    def run(task):
+        if task["path"] in failed_documents:
+            raise RuntimeError(failed_documents[task["path"]])
+        start = time.perf_counter()
+        questions = generator.generate_questions(
+            task["pdf"], task["prompt_topic"], task["difficulty"], task["q_type"], task["num"], user=user
+        )
+        if not questions:
+            # Generation errors come back as an empty list; leave the task for the next run
+            raise RuntimeError("no questions were generated")
+        if task["prompt_topic"] != task["topic"]:
+            questions = [dict(question, prompt_topic=task["prompt_topic"]) for question in questions]
+        ids, duplicates = generator.save_questions(
+            task["pdf"], task["topic"], task["difficulty"], task["q_type"], questions
+        )
+        return {"saved": len(ids), "duplicates": len(duplicates), "seconds": time.perf_counter() - start}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(run, task): task for task in pending}
+        for future in as_completed(futures):
+            task = futures[future]
+            try:
+                result = future.result()
+                record = dict(result, status="done")
+                summary["done"] += 1
+                summary["saved"] += result["saved"]
+                summary["duplicates"] += result["duplicates"]
+            except Exception as e:
+                print(f"Error generating {task_key(task)}: {e}")
+                record = {"status": "failed", "error": str(e)}
+                summary["failed"] += 1
+            checkpoint.record(task_key(task), **record)
+            if on_result:
+                on_result(task, record)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSON manifest of documents, difficulties, types and counts")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <manifest>.checkpoint.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=4, help="tasks in flight at once")
+    parser.add_argument("--model", default="qwen2.5:1.5b")
+    parser.add_argument("--embedding-model", default="nomic-embed-text")
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    tasks = expand_tasks(manifest, base_dir=os.path.dirname(os.path.abspath(args.manifest)))
+    checkpoint = Checkpoint(args.checkpoint or args.manifest + ".checkpoint.jsonl")
+
+    # No background ingestion workers: this process ingests what it needs itself
+    generator = AIQuestionBankGenerator(
+        model=args.model,
+        embedding_model=args.embedding_model,
+        max_inflight_llm=args.concurrency,
+        ingest_workers=0
+    )
+
+    total = len(tasks)
+    finished = len([task for task in tasks if task_key(task) in checkpoint.done])
+
+    def on_result(task, record):
+        nonlocal finished
+        finished += 1
+        if record["status"] == "done":
+            outcome = f"saved {record['saved']}, {record['duplicates']} duplicates"
+        else:
+            outcome = record["error"]
+        print(f"[{finished}/{total}] {task['pdf']} {task['difficulty']} {task['q_type']} x{task['num']}: {outcome}")
+
+    start = time.perf_counter()
+    try:
+        summary = run_batch(generator, tasks, checkpoint, args.concurrency, on_result=on_result)
+    finally:
+        generator.close()
+    summary["seconds"] = round(time.perf_counter() - start, 1)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
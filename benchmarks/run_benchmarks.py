@@ -0,0 +1,497 @@
+"""Offline benchmark suite for ingestion, retrieval, generation, the question bank and exams.
+
+Synthetic PDFs are generated, and the generator talks to the Ollama
+stand-in server (ollama_standin.py) with fixed latency, so runs are
+repeatable and need no model. Everything runs in a scratch working
+directory. Each stage reports throughput, p50/p95 latency and peak traced
+memory; results are saved as JSON under benchmarks/results/ and can be
+compared with an earlier run. Start-up is measured in fresh interpreters:
+importing app, building the generator, and launching the web UI until it
+serves its first page and until /ready reports warm-up has finished.
+
+With --sessions N, load stages run N concurrent sessions of generation
+requests through the scheduler, and ingest documents concurrently, while
+the stand-in injects errors (--error-rate) and bounds its parallelism and
+queue (--standin-parallel, --max-queue) like a busy Ollama server.
+
+    python -m benchmarks.run_benchmarks --pages 20,200 --compare latest
+    python -m benchmarks.run_benchmarks --compare-files OLD.json NEW.json
+    python -m benchmarks.run_benchmarks --sessions 300 --standin-parallel 4 --error-rate 0.02
+"""
+import argparse
+import gc
+import glob
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from benchmarks.synthetic_pdf import VOCABULARY, write_pdf
+from ollama_standin import OllamaStandin
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Metrics compared between runs, and whether higher is better
+COMPARED_METRICS = {"throughput": True, "p50_ms": False, "p95_ms": False, "peak_mb": False}
+
+# Run in a fresh interpreter; each prints the seconds taken as its last line
+IMPORT_APP = "import time; start = time.perf_counter(); import app; print(time.perf_counter() - start)"
+BUILD_GENERATOR = """
+import sys, time
+import app
+start = time.perf_counter()
+generator = app.AIQuestionBankGenerator(ollama_host=sys.argv[1], preload_models=False)
+print(time.perf_counter() - start)
+generator.close()
+"""
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20
+
+
+def measure(name, calls, concurrency=1, unit="ops", units=None):
+    """Run zero-argument callables and return the stage's metrics.
+
+    units(result) gives the work done by one call (e.g. pages) for the
+    throughput figure; by default each call counts as one. Calls returning
+    a false value are counted as errors.
+    """
+    latencies = []
+
+    def timed(call):
+        start = time.perf_counter()
+        result = call()
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    gc.collect()
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(timed, calls))
+    else:
+        results = [timed(call) for call in calls]
+    wall = time.perf_counter() - start
+
+    return summarize(
+        name, latencies, wall,
+        errors=sum(1 for result in results if not result),
+        work=sum(units(result) for result in results if result) if units else len(results),
+        unit=unit, concurrency=concurrency,
+        peak_mb=(tracemalloc.get_traced_memory()[1] - baseline) / 2 ** 20 if tracing else None
+    )
+
+
+def summarize(name, latencies, wall, calls=None, errors=0, work=None, unit="ops", concurrency=1, peak_mb=None):
+    """Print and return a stage's metrics from per-call latencies (seconds).
+
+    calls defaults to one per latency; work defaults to one unit per
+    successful call.
+    """
+    calls = len(latencies) if calls is None else calls
+    work = calls - errors if work is None else work
+    stage = {
+        "stage": name,
+        "calls": calls,
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_seconds": wall,
+        "throughput": work / wall if wall > 0 else None,
+        "throughput_unit": f"{unit}/s",
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "p95_ms": _percentile(latencies, 0.95) * 1000 if latencies else None,
+        "peak_mb": peak_mb,
+        "max_rss_mb": _max_rss_mb()
+    }
+    print(format_stage(stage))
+    return stage
+
+
+def _child_seconds(code, cwd, env, *args):
+    """Run Python code in a fresh interpreter and return the seconds it printed, or None on failure"""
+    completed = subprocess.run([sys.executable, "-c", code, *args], cwd=cwd, env=env,
+                               capture_output=True, text=True, timeout=300)
+    if completed.returncode != 0:
+        print(f"Error in start-up benchmark: {completed.stderr.strip()[-500:]}")
+        return None
+    return float(completed.stdout.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _responds(url):
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status == 200
+    except Exception:
+        return False
+
+
+def _serve_times(cwd, env, timeout=120):
+    """Launch the web UI; return seconds until it served its first page and until /ready passed"""
+    ui_port, metrics_port = _free_port(), _free_port()
+    env = dict(env, GRADIO_SERVER_PORT=str(ui_port), METRICS_PORT=str(metrics_port), GRADIO_ANALYTICS_ENABLED="False")
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "enhanced-gradio-interface.py")], cwd=cwd,
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    first_page = ready = None
+    try:
+        while ready is None and process.poll() is None and time.perf_counter() - start < timeout:
+            if first_page is None and _responds(f"http://127.0.0.1:{ui_port}/"):
+                first_page = time.perf_counter() - start
+            if first_page is not None and _responds(f"http://127.0.0.1:{metrics_port}/ready"):
+                ready = time.perf_counter() - start
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    return first_page, ready
+
+
+def measure_startup(runs, ollama_url, cwd):
+    """Start-up stages, each timed in `runs` fresh interpreters"""
+    os.makedirs(cwd, exist_ok=True)
+    env = dict(os.environ, OLLAMA_HOST=ollama_url,
+               PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    stages = []
+    for name, code, args in (("startup_import", IMPORT_APP, ()), ("startup_generator", BUILD_GENERATOR, (ollama_url,))):
+        start = time.perf_counter()
+        seconds = [_child_seconds(code, cwd, env, *args) for _ in range(runs)]
+        stages.append(summarize(name, [s for s in seconds if s is not None], time.perf_counter() - start,
+                                calls=runs, errors=seconds.count(None), unit="starts"))
+
+    if importlib.util.find_spec("gradio") is None:
+        print("Skipping web UI start-up stages: gradio is not installed")
+        return stages
+    start = time.perf_counter()
+    served = [_serve_times(cwd, env) for _ in range(runs)]
+    wall = time.perf_counter() - start
+    for index, name in enumerate(("startup_first_page", "startup_ready")):
+        seconds = [times[index] for times in served]
+        stages.append(summarize(name, [s for s in seconds if s is not None], wall,
+                                calls=runs, errors=seconds.count(None), unit="starts"))
+    return stages
+
+
+def format_stage(stage):
+    def number(value, digits=1):
+        return "-" if value is None else f"{value:.{digits}f}"
+    return (f"{stage['stage']:<20} {stage['calls']:>5} calls  {number(stage['throughput'], 2):>9} {stage['throughput_unit']:<12}"
+            f" p50 {number(stage['p50_ms']):>8} ms  p95 {number(stage['p95_ms']):>8} ms"
+            f"  peak {number(stage['peak_mb'])} MB  errors {stage['errors']}")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run(args):
+    """Run every stage in a scratch directory and return the results dict"""
+    from app import AIQuestionBankGenerator
+
+    page_counts = [int(pages) for pages in args.pages.split(",")]
+    config = {key: value for key, value in vars(args).items()
+              if key not in ("compare", "compare_files", "output", "workdir", "keep")}
+    results = {"started_at": datetime.now().isoformat(timespec="seconds"), "commit": _git_commit(),
+               "python": platform.python_version(), "platform": platform.platform(), "config": config,
+               "stages": []}
+    stages = results["stages"]
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="qbank-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    previous_dir = os.getcwd()
+    if args.tracemalloc:
+        tracemalloc.start()
+    standin = OllamaStandin(chat_latency=args.chat_latency, embed_latency=args.embed_latency,
+                            tokens_per_second=args.tokens_per_second, parallel=args.standin_parallel).start()
+    try:
+        if args.startup_runs:
+            stages.extend(measure_startup(args.startup_runs, standin.url, os.path.join(workdir, "startup")))
+
+        os.chdir(workdir)
+        os.makedirs("source", exist_ok=True)
+        pdfs = [write_pdf(os.path.join("source", f"bench_{pages}p_{i}.pdf"), pages, args.words_per_page, seed=i)
+                for i, pages in enumerate(page_counts)]
+
+        generator = AIQuestionBankGenerator(
+            ollama_host=standin.url,
+            shared_vector_store=args.shared_store,
+            max_inflight_llm=args.concurrency,
+            ingest_workers=0
+        )
+
+        pages_of = dict(zip(pdfs, page_counts))
+        stages.append(measure(
+            "extract", [lambda path=path: generator.extract_text_from_pdf(path) and path for path in pdfs],
+            unit="pages", units=pages_of.get
+        ))
+
+        uploads = []
+        for path in pdfs:
+            upload_path = os.path.join(generator.upload_dir, os.path.basename(path))
+            shutil.copy(path, upload_path)
+            uploads.append(upload_path)
+        stages.append(measure(
+            "ingest", [lambda path=path: generator.process_document(path) for path in uploads],
+            unit="chunks", units=lambda stats: stats["chunks"]
+        ))
+        stages.append(measure(
+            "ingest_unchanged", [lambda path=path: generator.process_document(path) for path in uploads]
+        ))
+
+        names = [os.path.basename(path) for path in uploads]
+        topics = {name: os.path.splitext(name)[0].replace("_", " ") for name in names}
+        queries = [(names[i % len(names)], f"{VOCABULARY[i % len(VOCABULARY)]} {VOCABULARY[(i * 7) % len(VOCABULARY)]}")
+                   for i in range(args.queries)]
+        stages.append(measure(
+            "similarity_search",
+            [lambda name=name, query=query: generator.vector_stores.get(name).similarity_search(query, k=generator.retrieval_k)
+             for name, query in queries]
+        ))
+        stages.append(measure(
+            "hybrid_retrieval",
+            [lambda name=name, query=query: generator._retrieve_context(name, query, "intermediate", "mcq")
+             for name, query in queries]
+        ))
+
+        q_types = ["mcq", "true_false", "short", "long"]
+        requests = [(names[i % len(names)], q_types[i % len(q_types)]) for i in range(args.generations)]
+        generated = []
+
+        def generate(name, q_type, nonce, user=None):
+            # With a user the request goes through the scheduler, as UI requests do
+            if user is None:
+                questions = generator.generate_questions_with_rag(
+                    name, topics[name], "intermediate", q_type, args.questions_per_request, nonce=nonce
+                )
+            else:
+                questions = generator.generate_questions(
+                    name, topics[name], "intermediate", q_type, args.questions_per_request, user=user, nonce=nonce
+                )
+            if nonce is not None and questions:
+                generated.append((name, q_type, questions))
+            return questions
+
+        stages.append(measure(
+            "generate", [lambda name=name, q_type=q_type, i=i: generate(name, q_type, i)
+                         for i, (name, q_type) in enumerate(requests)],
+            unit="questions", units=len
+        ))
+        stages.append(measure(
+            "generate_cached", [lambda name=name, q_type=q_type: generate(name, q_type, None) for name, q_type in requests],
+            unit="questions", units=len
+        ))
+        stages.append(measure(
+            "generate_concurrent",
+            [lambda name=name, q_type=q_type, i=i: generate(name, q_type, f"concurrent-{i}", user=f"user-{i % 3}")
+             for i, (name, q_type) in enumerate(requests)],
+            concurrency=args.concurrency, unit="questions", units=len
+        ))
+
+        stages.append(measure(
+            "bank_save",
+            [lambda name=name, q_type=q_type, questions=questions: generator.save_questions(
+                name, topics[name], "intermediate", q_type, questions)
+             for name, q_type, questions in generated],
+            unit="questions", units=lambda saved: len(saved[0])
+        ))
+        stages.append(measure(
+            "bank_load", [lambda name=name: generator.get_pdf_question_bank(name) for name in names * 5]
+        ))
+        stages.append(measure(
+            "bank_query",
+            [lambda name=name, i=i: generator.query_pdf_question_bank(name, q_type=q_types[i % 4], page=1 + i % 3)
+             for i, name in enumerate(names * 10)]
+        ))
+
+        counts = {"mcq": 5, "true_false": 3, "short": 2, "long": 1}
+        stages.append(measure(
+            "exam_build",
+            [lambda name=name: generator.build_exams(name, topics[name], "intermediate", counts,
+                                                     variants=args.variants, exclude_days=0)[0]
+             for name in names * 5],
+            unit="exams", units=len
+        ))
+
+        if args.sessions:
+            stages.extend(measure_load(args, generator, standin, names, topics))
+
+        results["standin"] = {"requests": dict(standin.requests), "stats": dict(standin.stats)}
+        generator.close()
+    finally:
+        os.chdir(previous_dir)
+        standin.stop()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def measure_load(args, generator, standin, names, topics):
+    """Concurrent sessions against a stand-in that fails and queues requests like a busy server"""
+    q_types = ["mcq", "true_false", "short", "long"]
+    stages = []
+    # Errors and queue limits only apply here, so the other stages stay comparable
+    standin.error_rate, standin.max_queue = args.error_rate, args.max_queue
+    try:
+        # Every session asks for something new, then all repeat a handful of
+        # popular requests, which the cache and in-flight merging absorb
+        stages.append(measure(
+            "load_generate",
+            [lambda i=i: generator.generate_questions(
+                names[i % len(names)], topics[names[i % len(names)]], "intermediate", q_types[i % 4],
+                args.questions_per_request, user=f"session-{i}", nonce=f"load-{i}")
+             for i in range(args.sessions)],
+            concurrency=args.sessions, unit="questions", units=len
+        ))
+        stages.append(measure(
+            "load_generate_popular",
+            [lambda i=i: generator.generate_questions(
+                names[i % len(names)], topics[names[i % len(names)]], "beginner", q_types[i % 4],
+                args.questions_per_request, user=f"session-{i}")
+             for i in range(args.sessions)],
+            concurrency=args.sessions, unit="questions", units=len
+        ))
+
+        documents = [write_pdf(os.path.join(generator.upload_dir, f"load_{i}.pdf"), 5, args.words_per_page, seed=1000 + i)
+                     for i in range(args.load_documents)]
+        stages.append(measure(
+            "load_ingest", [lambda path=path: generator.process_document(path) for path in documents],
+            concurrency=len(documents), unit="chunks", units=lambda stats: stats["chunks"]
+        ))
+    finally:
+        standin.error_rate, standin.max_queue = 0.0, None
+    print(f"Stand-in: {standin.stats['errors']} injected errors, {standin.stats['rejected']} rejected, "
+          f"peak {standin.stats['peak_active']} requests served at once")
+    return stages
+
+
+def save_results(results, directory=RESULTS_DIR):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def latest_results(directory=RESULTS_DIR, exclude=None):
+    paths = [path for path in sorted(glob.glob(os.path.join(directory, "*.json"))) if path != exclude]
+    return paths[-1] if paths else None
+
+
+def compare(old, new):
+    """Print each stage's metrics side by side with the relative change"""
+    old_stages = {stage["stage"]: stage for stage in old["stages"]}
+    print(f"\nComparison with run of {old.get('started_at')} (commit {old.get('commit')})")
+    if old.get("config") != new.get("config"):
+        print("Note: the runs used different settings, so the numbers are not directly comparable")
+    print(f"{'stage':<20} {'metric':<12} {'before':>12} {'after':>12} {'change':>9}")
+    for stage in new["stages"]:
+        before = old_stages.get(stage["stage"])
+        if before is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            a, b = before.get(metric), stage.get(metric)
+            if a is None or b is None:
+                continue
+            change = (b - a) / a * 100 if a else 0.0
+            better = (change > 0) == higher_is_better
+            marker = "" if abs(change) < 5 else (" better" if better else " worse")
+            print(f"{stage['stage']:<20} {metric:<12} {a:>12.2f} {b:>12.2f} {change:>+8.1f}%{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", default="20,100", help="comma-separated page counts, one synthetic PDF each")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=50, help="retrieval queries per stage")
+    parser.add_argument("--generations", type=int, default=12, help="generation requests per stage")
+    parser.add_argument("--questions-per-request", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4, help="parallel requests in generate_concurrent")
+    parser.add_argument("--variants", type=int, default=3, help="variants per exam in exam_build")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="stand-in LLM seconds per request")
+    parser.add_argument("--embed-latency", type=float, default=0.002, help="stand-in embedding seconds per request")
+    parser.add_argument("--tokens-per-second", type=float, help="stand-in generation speed (default: instant)")
+    parser.add_argument("--standin-parallel", type=int, help="requests the stand-in serves at once (default: unbounded)")
+    parser.add_argument("--sessions", type=int, default=0, help="concurrent sessions in the load stages (0 skips them)")
+    parser.add_argument("--load-documents", type=int, default=8, help="documents ingested concurrently in load_ingest")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stand-in requests failing in load stages")
+    parser.add_argument("--max-queue", type=int, help="stand-in queue length in load stages (needs --standin-parallel)")
+    parser.add_argument("--shared-store", action="store_true", help="use the shared vector collection")
+    parser.add_argument("--startup-runs", type=int, default=3, help="fresh interpreters per start-up stage (0 skips them)")
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false",
+                        help="skip peak memory tracing (it slows Python code down)")
+    parser.add_argument("--compare", metavar="RESULTS", help="results file to compare with, or 'latest'")
+    parser.add_argument("--compare-files", nargs=2, metavar=("OLD", "NEW"), help="only compare two results files")
+    parser.add_argument("--output", help="where to write the results (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--workdir", help="scratch directory to run in (kept afterwards)")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary scratch directory")
+    args = parser.parse_args()
+
+    if args.compare_files:
+        with open(args.compare_files[0]) as f:
+            old = json.load(f)
+        with open(args.compare_files[1]) as f:
+            compare(old, json.load(f))
+        return
+
+    baseline = latest_results() if args.compare == "latest" else args.compare
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        path = args.output
+    else:
+        path = save_results(results)
+    print(f"\nResults saved to {path}")
+
+    if args.compare and baseline is None:
+        print("No earlier results to compare with")
+    elif baseline:
+        with open(baseline) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
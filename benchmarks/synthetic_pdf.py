@@ -0,0 +1,71 @@
+"""Synthetic text PDFs of configurable size, written without any PDF library"""
+import random
+
+# Words the generated pages are made of; a few recurring "topic" words give
+# keyword and vector search something to find
+VOCABULARY = """
+algorithm array binary cache compiler concurrency database distributed encryption function graph hash
+heap index interface kernel latency memory network object packet parser pointer process protocol queue
+recursion register runtime scheduler schema search server socket stack storage stream syntax thread
+throughput transaction tree variable vector virtual analysis approach behaviour component condition
+constraint definition design example failure measure method model operation pattern principle property
+requirement resource result sequence structure system technique theory value
+""".split()
+
+FILLER = "the a of and to in is that for with as on by this are be it from at which".split()
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_lines(rng, words_per_page, words_per_line=12):
+    """Random sentences for one page, as lines of text"""
+    words = []
+    while len(words) < words_per_page:
+        sentence = [rng.choice(VOCABULARY if rng.random() < 0.6 else FILLER) for _ in range(rng.randint(6, 16))]
+        sentence[0] = sentence[0].capitalize()
+        sentence[-1] += "."
+        words.extend(sentence)
+    words = words[:words_per_page]
+    return [" ".join(words[i:i + words_per_line]) for i in range(0, len(words), words_per_line)]
+
+
+def write_pdf(path, pages=10, words_per_page=400, seed=0):
+    """Write a PDF of `pages` pages of random text. The same seed gives the same file."""
+    rng = random.Random(seed)
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    page_tree = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for _ in range(pages):
+        lines = page_lines(rng, words_per_page)
+        text = "\n".join(f"({_escape(line)}) Tj T*" for line in lines)
+        stream = f"BT /F1 9 Tf 11 TL 40 800 Td\n{text}\nET".encode("latin-1")
+        content = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R"
+            b" /Resources << /Font << /F1 %d 0 R >> >> >>" % (page_tree, content, font)
+        ))
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % page_tree
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[page_tree - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+    return path
@@ -0,0 +1,167 @@
+import hashlib
+import math
+import threading
+
+from question_parser import question_text
+
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class QuestionDeduplicator:
+    """Near-duplicate detection for saved questions using an embedding ANN index.
+
+    Each document's questions are embedded into their own Chroma (HNSW, cosine)
+    collection, tagged with the question type. A new question whose nearest
+    neighbour of the same type is at least `threshold` similar is treated as a
+    duplicate of it.
+    """
+
+    def __init__(self, embeddings, open_index, threshold=0.92):
+        self.embeddings = embeddings
+        self.open_index = open_index
+        self.threshold = threshold
+
+        # Saving is check-then-insert, so callers hold the document's lock around
+        # both steps; saves for different documents do not wait for each other
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._indexes = {}
+        # document -> bank version the index was last known to match
+        self._synced = {}
+
+    @staticmethod
+    def collection_name(document):
+        # Chroma collection names are restricted, so use a stable hash of the document key
+        return "questions_" + hashlib.sha1(document.encode("utf-8")).hexdigest()[:32]
+
+    def lock(self, document):
+        """The lock that serializes index updates for one document"""
+        with self._locks_guard:
+            if document not in self._locks:
+                self._locks[document] = threading.RLock()
+            return self._locks[document]
+
+    def _index(self, document):
+        if document not in self._indexes:
+            self._indexes[document] = self.open_index(self.collection_name(document))
+        return self._indexes[document]
+
+    def _clear(self, document):
+        index = self._index(document)
+        existing = index._collection.get(include=[])["ids"]
+        if existing:
+            index._collection.delete(ids=existing)
+
+    def invalidate(self, document):
+        """Force the next sync to compare the index with the store again"""
+        self._synced.pop(document, None)
+
+    def mark_synced(self, document, store):
+        """Record that the index matches the store's current version of a document"""
+        self._synced[document] = store.version(document)
+
+    def sync(self, document, store):
+        """Make sure every stored question of a document is indexed.
+
+        Only does work when the bank changed since the last sync (for example
+        when another process saved questions).
+        """
+        with self.lock(document):
+            version = store.version(document)
+            if self._synced.get(document) == version:
+                return
+            rows = store.get_rows(document)
+            index = self._index(document)
+            indexed = set(index._collection.get(include=[])["ids"])
+            if indexed != {str(row_id) for row_id, _, _ in rows}:
+                # Rebuild from the store; vectors come from the shared embedding cache
+                self._clear(document)
+                for start in range(0, len(rows), 256):
+                    self.add(document, rows[start:start + 256])
+            self._synced[document] = version
+
+    def add(self, document, rows, vectors=None):
+        """Index (question id, q_type, question) rows, optionally with precomputed vectors"""
+        if not rows:
+            return
+        texts = [question_text(question) for _, _, question in rows]
+        if vectors is None:
+            vectors = self.embeddings.embed_documents(texts)
+        self._index(document)._collection.upsert(
+            ids=[str(row_id) for row_id, _, _ in rows],
+            embeddings=vectors,
+            documents=texts,
+            metadatas=[{"q_type": q_type} for _, q_type, _ in rows]
+        )
+
+    def _nearest(self, document, q_type, vector):
+        index = self._index(document)
+        if index._collection.count() == 0:
+            return None, 0.0
+        result = index._collection.query(
+            query_embeddings=[vector],
+            n_results=1,
+            where={"q_type": q_type},
+            include=["distances"]
+        )
+        if not result["ids"] or not result["ids"][0]:
+            return None, 0.0
+        # Cosine distance -> similarity
+        return result["ids"][0][0], 1.0 - result["distances"][0][0]
+
+    def check(self, document, q_type, questions):
+        """Check new questions of one type against the index and each other.
+
+        Returns one (vector, matched question id, similarity, is_duplicate) per
+        question. A question that repeats one earlier in the same batch has a
+        matched id of None.
+        """
+        texts = [question_text(question) for question in questions]
+        vectors = self.embeddings.embed_documents(texts) if texts else []
+
+        results = []
+        kept_vectors = []
+        for vector in vectors:
+            match_id, similarity = self._nearest(document, q_type, vector)
+            if similarity < self.threshold:
+                match_id = None
+                similarity = max((_cosine(vector, other) for other in kept_vectors), default=0.0)
+            duplicate = similarity >= self.threshold
+            if not duplicate:
+                kept_vectors.append(vector)
+            results.append((vector, match_id, similarity, duplicate))
+        return results
+
+    def compact(self, document, store):
+        """Remove near-duplicates already in a document's bank, keeping the oldest copy.
+
+        Returns the number of questions removed.
+        """
+        with self.lock(document):
+            rows = store.get_rows(document)
+            self._clear(document)
+
+            # Re-index in insertion order, dropping anything too close to what was kept
+            removed = []
+            for start in range(0, len(rows), 256):
+                by_type = {}
+                for row in rows[start:start + 256]:
+                    by_type.setdefault(row[1], []).append(row)
+                for q_type, type_rows in by_type.items():
+                    results = self.check(document, q_type, [question for _, _, question in type_rows])
+                    kept, kept_vectors = [], []
+                    for row, (vector, _, _, duplicate) in zip(type_rows, results):
+                        if duplicate:
+                            removed.append(row[0])
+                        else:
+                            kept.append(row)
+                            kept_vectors.append(vector)
+                    self.add(document, kept, kept_vectors)
+
+            store.delete_questions(removed)
+            self.mark_synced(document, store)
+            return len(removed)
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from metrics import EMBEDDED_TEXTS, EMBEDDING_CALLS, span
+
+
+class EmbeddingCache:
+    """Persistent chunk-level embedding cache keyed by content hash and model name"""
+
+    def __init__(self, path="cache/embeddings.sqlite"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # One connection shared between threads, guarded by a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " model TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, text):
+        """Build the cache key for a piece of text embedded with a given model"""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Return a dict of key -> vector for the keys that are cached"""
+        found = {}
+        if not keys:
+            return found
+
+        unique_keys = list(dict.fromkeys(keys))
+        with self._lock:
+            # Stay well below SQLite's host parameter limit
+            for start in range(0, len(unique_keys), 500):
+                batch = unique_keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+        return found
+
+    def put_many(self, model, items):
+        """Store (key, vector) pairs for the given model"""
+        rows = [(key, model, len(vector), array("f", vector).tobytes()) for key, vector in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings:
+    """Embeddings wrapper that only sends uncached texts to the underlying model"""
+
+    def __init__(self, embeddings, model, cache):
+        self.embeddings = embeddings
+        self.model = model
+        self.cache = cache
+
+        # Running totals since startup
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_with_stats(self, texts):
+        """Embed texts through the cache and return (vectors, hits, misses)"""
+        texts = list(texts)
+        keys = [EmbeddingCache.make_key(self.model, text) for text in texts]
+        cached = self.cache.get_many(keys)
+
+        # Only embed each distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            EMBEDDING_CALLS.inc(kind="documents")
+            EMBEDDED_TEXTS.inc(len(missing))
+            with span("embed_documents"):
+                new_vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), new_vectors))
+            self.cache.put_many(self.model, computed.items())
+            cached.update(computed)
+
+        hits = len(texts) - len(missing)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(missing)
+
+        return [cached[key] for key in keys], hits, len(missing)
+
+    def embed_documents(self, texts):
+        vectors, _, _ = self.embed_with_stats(texts)
+        return vectors
+
+    def embed_query(self, text):
+        # Queries are rarely repeated verbatim, so they bypass the cache
+        EMBEDDING_CALLS.inc(kind="query")
+        EMBEDDED_TEXTS.inc()
+        with span("embed_query"):
+            return self.embeddings.embed_query(text)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -1,13 +1,94 @@
 import gradio as gr
 import json
 import os
-from app import AIQuestionBankGenerator
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from html import escape
+from app import DEFAULT_EXAM_EXCLUDE_DAYS, UPLOAD_DIR, AIQuestionBankGenerator, store_upload
+from metrics import READY, set_readiness_check, start_metrics_server, traced
 
-# Initialize generator
-generator = AIQuestionBankGenerator()
+# The generator is built on a background thread once the server is listening
+# (see start_generator), so the first page does not wait for the stores,
+# LangChain, Chroma or the models. Handlers get it through get_generator().
+generator = None
+_generator_built = threading.Event()
+_startup = {"state": "starting", "error": None, "started": time.time(), "seconds": {}}
+
+# Build the generator, then warm up recently used document stores
+def start_generator(**options):
+    def build():
+        global generator
+        try:
+            start = time.perf_counter()
+            generator = AIQuestionBankGenerator(**options)
+            _startup["seconds"]["generator"] = time.perf_counter() - start
+            _startup["state"] = "warming up"
+        except Exception as e:
+            print(f"Error starting the question bank generator: {e}")
+            _startup.update(state="failed", error=str(e))
+            return
+        finally:
+            _generator_built.set()
+        
+        start = time.perf_counter()
+        warmed = generator.warm_up()
+        _startup["seconds"]["warm_up"] = time.perf_counter() - start
+        _startup["state"] = "ready"
+        READY.set(1)
+        print(f"Ready after {time.time() - _startup['started']:.2f}s ({warmed} documents warmed up)")
+    
+    thread = threading.Thread(target=build, name="startup", daemon=True)
+    thread.start()
+    return thread
+
+# The generator, waiting for start-up to build it if needed
+def get_generator(timeout=120):
+    if not _generator_built.wait(timeout):
+        raise gr.Error("The app is still starting up, please try again in a moment.")
+    if generator is None:
+        raise gr.Error(f"The app failed to start: {_startup['error']}")
+    return generator
+
+# Start-up state for the /ready endpoint
+def startup_status():
+    status = {"ready": _startup["state"] == "ready", "state": _startup["state"], "error": _startup["error"],
+              "seconds": dict(_startup["seconds"])}
+    if generator is not None:
+        status["models"] = generator.models.status()
+    return status
+
+# Banner shown until start-up has finished and the models are loaded
+def format_startup_status():
+    if _startup["state"] == "failed":
+        return f"**Start-up failed:** {_startup['error']}"
+    if _startup["state"] != "ready":
+        return f"*Starting up ({_startup['state']}): document stores and models are loading...*"
+    loading = [f"{status['model']} ({status['state']})" for status in generator.models.status().values()
+               if status["state"] != "ready"]
+    return f"*Loading models: {', '.join(loading)}*" if loading else ""
 
 # Helper functions to format the display
+def format_question_record(record, q_type):
+    """Render a structured question record (stem, options, answer, explanation, pages)"""
+    formatted = f"<b>Question:</b> {escape(record.get('stem', ''))}"
+    for option in record.get("options", []):
+        formatted += f"<br>{escape(option)}"
+    if record.get("answer"):
+        formatted += f"<br><b>Answer:</b> {escape(record['answer'])}"
+    if record.get("explanation"):
+        label = "Key points" if q_type == "long" else "Explanation"
+        formatted += f"<br><b>{label}:</b> {escape(record['explanation'])}"
+    if record.get("pages"):
+        formatted += f"<br><small>Source pages: {', '.join(str(page) for page in record['pages'])}</small>"
+    return formatted
+
 def format_question(question, q_type):
+    if isinstance(question, dict):
+        return format_question_record(question, q_type)
+    
+    # Legacy banks store each question as a plain line of text
     if not question or question.strip() == "":
         return ""
     
@@ -36,110 +117,151 @@ def format_question(question, q_type):
         
     return formatted.replace("\n", "<br>")
 
-def get_pdf_specific_question_bank(pdf_filename):
-    """Get the PDF-specific question bank if it exists"""
-    # Create filename for the PDF-specific question bank
-    bank_filename = os.path.splitext(pdf_filename)[0] + "_questions.json"
-    bank_path = os.path.join("question_banks", bank_filename)
-    
-    if os.path.exists(bank_path):
-        try:
-            with open(bank_path, "r") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading PDF-specific question bank: {e}")
-    
-    # If file doesn't exist or has an error, return empty dict
-    return {}
-
-def save_pdf_specific_question_bank(pdf_filename, question_bank):
-    """Save a PDF-specific question bank"""
-    # Create directory if it doesn't exist
-    os.makedirs("question_banks", exist_ok=True)
-    
-    # Create filename for the PDF-specific question bank
-    bank_filename = os.path.splitext(pdf_filename)[0] + "_questions.json"
-    bank_path = os.path.join("question_banks", bank_filename)
-    
-    try:
-        with open(bank_path, "w") as f:
-            json.dump(question_bank, f, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error saving PDF-specific question bank: {e}")
-        return False
-
 # Function to get list of uploaded PDF files
 def get_uploaded_pdfs():
-    upload_dir = generator.upload_dir
+    upload_dir = UPLOAD_DIR
     if not os.path.exists(upload_dir):
         return []
     
     pdf_files = [f for f in os.listdir(upload_dir) if f.lower().endswith('.pdf')]
     return pdf_files
 
-# Function to handle document upload
-def upload_document(file):
-    if file is None:
-        return "No file uploaded.", get_uploaded_pdfs()
+# Copy an uploaded file into the uploads directory and return its path.
+# The copy replaces any earlier version atomically, as a job may still be reading it
+def save_upload(file):
+    # For Gradio file uploads, file might be a path or file-like object
+    if isinstance(file, str):
+        return store_upload(file, os.path.join(UPLOAD_DIR, os.path.basename(file)))
     
+    # Try to get the file path if it's a file object
     try:
-        # For Gradio file uploads, file might be a path or file-like object
-        if isinstance(file, str):
-            # If file is already a path
-            file_path = file
-            filename = os.path.basename(file_path)
-            # Copy to uploads directory
-            import shutil
-            dest_path = os.path.join(generator.upload_dir, filename)
-            shutil.copy(file_path, dest_path)
-            file_path = dest_path
-        else:
-            # Try to get the file path if it's a file object
-            try:
-                file_path = file.name
-                filename = os.path.basename(file_path)
-                # Copy to uploads directory
-                import shutil
-                dest_path = os.path.join(generator.upload_dir, filename)
-                shutil.copy(file_path, dest_path)
-                file_path = dest_path
-            except (AttributeError, TypeError):
-                # Fall back to reading the file content
-                try:
-                    filename = os.path.basename(getattr(file, 'name', 'uploaded_file.pdf'))
-                    file_path = os.path.join(generator.upload_dir, filename)
-                    with open(file_path, "wb") as f:
-                        f.write(file.read())
-                except Exception as e:
-                    return f"Failed to save file: {str(e)}", get_uploaded_pdfs()
-        
-        success = generator.process_document(file_path)
-        if success:
-            return f"Successfully processed and vectorized: {os.path.basename(file_path)}", get_uploaded_pdfs()
+        return store_upload(file.name, os.path.join(UPLOAD_DIR, os.path.basename(file.name)))
+    except (AttributeError, TypeError):
+        # Fall back to reading the file content
+        filename = os.path.basename(getattr(file, 'name', 'uploaded_file.pdf'))
+        return store_upload(file, os.path.join(UPLOAD_DIR, filename))
+
+# Function to handle document upload; files are queued for background ingestion
+@traced("ui.upload")
+def upload_document(files):
+    if not files:
+        return "No file uploaded.", get_uploaded_pdfs()
+    if not isinstance(files, list):
+        files = [files]
+    
+    # Waits for start-up, which also creates the uploads directory
+    ingest_jobs = get_generator().ingest_jobs
+    queued, failed = [], []
+    for file in files:
+        try:
+            file_path = save_upload(file)
+            ingest_jobs.submit(file_path)
+            queued.append(os.path.basename(file_path))
+        except Exception as e:
+            failed.append(f"{getattr(file, 'name', file)}: {str(e)}")
+    
+    status = f"Queued {len(queued)} document(s) for processing: {', '.join(queued)}." if queued else ""
+    if failed:
+        status += f" Failed to save: {'; '.join(failed)}"
+    return status.strip(), get_uploaded_pdfs()
+
+def format_duration(seconds):
+    if seconds is None:
+        return ""
+    seconds = int(seconds)
+    return f"{seconds // 60}m {seconds % 60:02d}s" if seconds >= 60 else f"{seconds}s"
+
+# Table of recent ingestion jobs with live progress
+def format_ingest_jobs():
+    if generator is None:
+        return "<p>Starting up...</p>"
+    jobs = generator.ingest_jobs.jobs(limit=20)
+    if not jobs:
+        return "<p>No documents processed yet.</p>"
+    
+    rows = []
+    for job in jobs:
+        progress = job["progress"] or {}
+        pages = f"{progress.get('pages', 0)}/{progress.get('total_pages') or '?'}" if progress else ""
+        chunks = f"{progress.get('chunks_done', 0)}/{progress.get('chunks', 0)}" if progress else ""
+        if job["status"] == "done" and job["stats"]:
+            stats = job["stats"]
+            detail = (f"version {stats['version']}: {stats['added']} chunks added, {stats['unchanged']} unchanged, "
+                      f"{stats['removed']} removed")
+            if stats.get("stale_questions"):
+                detail += f"; {stats['stale_questions']} saved questions flagged"
+        elif job["status"] == "failed":
+            detail = escape(job["error"] or "")
+        elif job["status"] == "running":
+            detail = f"ETA {format_duration(job['eta'])}" if job["eta"] is not None else "starting"
         else:
-            return f"Failed to process document: {os.path.basename(file_path)}", get_uploaded_pdfs()
-    except Exception as e:
-        return f"Error processing document: {str(e)}", get_uploaded_pdfs()
+            detail = "waiting"
+        rows.append(
+            f"<tr><td>{escape(job['document'])}</td><td>{job['status']}</td><td>{pages}</td>"
+            f"<td>{chunks}</td><td>{detail}</td></tr>"
+        )
+    return (
+        "<table><tr><th>Document</th><th>Status</th><th>Pages</th><th>Chunks stored</th><th>Details</th></tr>"
+        + "".join(rows) + "</table>"
+    )
+
+# Identify the browser session so the scheduler can queue each user fairly
+def get_user_id(request):
+    if request is None:
+        return None
+    session_hash = getattr(request, "session_hash", None)
+    if session_hash:
+        return session_hash
+    client = getattr(request, "client", None)
+    return getattr(client, "host", None)
+
+# Summarize the generation queue for the status box
+def format_queue_status():
+    if generator is None:
+        return "Queue: starting up"
+    stats = generator.scheduler.stats()
+    return (
+        f"Queue: {stats['queue_depth']} waiting, {stats['inflight']}/{stats['max_inflight']} running, "
+        f"avg wait {stats['avg_wait']:.1f}s"
+    )
 
 # Extract topic from PDF filename (remove extension and replace underscores with spaces)
 def extract_topic_from_filename(filename):
     return os.path.splitext(filename)[0].replace('_', ' ')
 
-# Generate questions
-def generate_questions(pdf_file, difficulty, q_type, num_questions):
+# Generate questions as a stream, yielding (status, questions) each time a question is completed
+@traced("ui.generate_stream")
+def stream_generated_questions(pdf_file, difficulty, q_type, num_questions, user=None, nonce=None):
     if not pdf_file:
-        return "Please select a PDF first.", []
+        yield "Please select a PDF first.", []
+        return
     
     # Extract topic from the PDF filename
     topic = extract_topic_from_filename(pdf_file)
     
-    # Generate questions
-    questions = generator.generate_questions(pdf_file, topic, difficulty, q_type, int(num_questions))
+    # Show the queue position while waiting for a free LLM slot
+    yield f"Queued. {format_queue_status()}", []
+    
+    timings = {}
+    questions = []
+    stream = get_generator().stream_questions_with_rag(
+        pdf_file, topic, difficulty, q_type, int(num_questions), timings=timings, user=user, nonce=nonce
+    )
+    try:
+        for questions in stream:
+            yield f"Generating {q_type} questions... ({len(questions)} so far)", questions
+    except Exception as e:
+        # Keep what was completed, but do not report it as a finished set
+        yield f"Error generating questions after {len(questions)} {q_type} questions: {e}", questions
+        return
     
-    return f"Generated {len(questions)} {q_type} questions", questions
+    # The final result is identical to the non-streaming path
+    timing_summary = ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items())
+    source = "from cache" if "llm" not in timings else timing_summary
+    yield f"Generated {len(questions)} {q_type} questions ({source}). {format_queue_status()}", questions
 
 # Save generated questions to PDF-specific question bank
+@traced("ui.save")
 def save_questions(pdf_file, difficulty, q_type, questions):
     if not pdf_file or not questions:
         return "No questions to save."
@@ -147,19 +269,66 @@ def save_questions(pdf_file, difficulty, q_type, questions):
     # Extract topic from the PDF filename
     topic = extract_topic_from_filename(pdf_file)
     
-    # Load existing PDF-specific question bank
-    question_bank = get_pdf_specific_question_bank(pdf_file)
+    # Append the new questions to the PDF-specific question bank, skipping near-duplicates
+    try:
+        ids, duplicates = get_generator().save_questions(pdf_file, topic, difficulty, q_type, questions)
+        status = f"Saved {len(ids)} {q_type} questions to {pdf_file} question bank."
+        if duplicates:
+            status += f" Skipped {len(duplicates)} near-duplicates."
+        return status
+    except Exception as e:
+        print(f"Error saving PDF-specific question bank: {e}")
+        return "Failed to save questions."
+
+# Generate a full set of question types from one retrieval
+@traced("ui.generate_set")
+def generate_full_set(pdf_file, difficulty, mcq, tf, short, long, user=None, nonce=None):
+    if not pdf_file:
+        return "Please select a PDF first.", {}
     
-    # Add new questions
-    question_bank.setdefault(topic, {}).setdefault(difficulty, {}).setdefault(q_type, []).extend(questions)
+    # Extract topic from the PDF filename
+    topic = extract_topic_from_filename(pdf_file)
     
-    # Save the updated question bank
-    if save_pdf_specific_question_bank(pdf_file, question_bank):
-        return f"Saved {len(questions)} {q_type} questions to {pdf_file} question bank."
-    else:
-        return "Failed to save questions."
+    mix = {"mcq": mcq, "true_false": tf, "short": short, "long": long}
+    timings = {}
+    question_set = get_generator().generate_question_set(pdf_file, topic, difficulty, mix, timings=timings, user=user, nonce=nonce)
+    
+    counts = ", ".join(f"{len(questions)} {q_type}" for q_type, questions in question_set.items())
+    return f"Generated full set: {counts} ({timings.get('total', 0.0):.2f}s). {format_queue_status()}", question_set
+
+# Save a full question set (question type -> questions) to the PDF-specific question bank
+def save_question_set(pdf_file, difficulty, question_set):
+    if not pdf_file or not question_set:
+        return "No questions to save."
+    
+    statuses = [save_questions(pdf_file, difficulty, q_type, questions) for q_type, questions in question_set.items() if questions]
+    return " ".join(statuses) if statuses else "No questions to save."
+
+# Readable section names for each question type
+def get_type_name(q_type):
+    if q_type == "mcq":
+        return "Multiple Choice Questions"
+    elif q_type == "true_false":
+        return "True/False Questions"
+    elif q_type == "short":
+        return "Short Answer Questions"
+    elif q_type == "long":
+        return "Long Answer Questions"
+    return q_type
+
+# Format and display a full question set, one section per question type
+def format_question_set_display(question_set):
+    if not question_set:
+        return "<p>No questions generated yet.</p>"
+    
+    html = ""
+    for q_type, questions in question_set.items():
+        html += f"<h4>{get_type_name(q_type)} ({len(questions)})</h4>"
+        html += format_questions_display(questions, q_type)
+    return html
 
 # Format and display the questions
+@traced("ui.render_questions")
 def format_questions_display(questions, q_type):
     if not questions:
         return "<p>No questions generated yet.</p>"
@@ -173,249 +342,385 @@ def format_questions_display(questions, q_type):
     
     return html
 
-# Format and display the PDF-specific question bank
-def format_pdf_question_bank(pdf_file):
+# Rendered question fragments for the bank viewer, keyed by question id and
+# stale flag. Saved questions are never edited in place otherwise.
+BANK_PAGE_SIZE = 20
+_rendered_questions = OrderedDict()
+_rendered_questions_max = 5000
+_rendered_questions_lock = threading.Lock()
+
+def render_bank_question(row_id, q_type, question, stale=False):
+    key = (row_id, stale)
+    with _rendered_questions_lock:
+        html = _rendered_questions.get(key)
+        if html is not None:
+            _rendered_questions.move_to_end(key)
+            return html
+    
+    html = format_question(question, q_type)
+    if stale:
+        html = "<small style='color:#b45309;'>Source content changed in a newer version of the document</small><br>" + html
+    with _rendered_questions_lock:
+        _rendered_questions[key] = html
+        while len(_rendered_questions) > _rendered_questions_max:
+            _rendered_questions.popitem(last=False)
+    return html
+
+# Format and display one page of the PDF-specific question bank
+@traced("ui.view_bank")
+def format_pdf_question_bank(pdf_file, difficulty="all", q_type="all", search="", page=1, stale_only=False):
+    """Returns (html, page number actually shown)"""
     if not pdf_file:
-        return "<p>Please select a PDF first.</p>"
+        return "<p>Please select a PDF first.</p>", 1
     
-    question_bank = get_pdf_specific_question_bank(pdf_file)
-    if not question_bank:
-        return f"<p>No questions saved for {pdf_file} yet.</p>"
+    difficulty = None if difficulty in (None, "", "all") else difficulty
+    q_type = None if q_type in (None, "", "all") else q_type
+    search = (search or "").strip() or None
+    page = max(1, int(page or 1))
     
-    html = f"<h2>Question Bank for {pdf_file}</h2>"
+    try:
+        rows, total = get_generator().query_pdf_question_bank(pdf_file, difficulty, q_type, search, page, BANK_PAGE_SIZE, stale_only)
+        pages = max(1, -(-total // BANK_PAGE_SIZE))
+        if page > pages:
+            # Filters changed under the current page; show the last one instead
+            page = pages
+            rows, total = get_generator().query_pdf_question_bank(pdf_file, difficulty, q_type, search, page, BANK_PAGE_SIZE, stale_only)
+    except Exception as e:
+        print(f"Error loading PDF-specific question bank: {e}")
+        return f"<p>Error loading question bank: {escape(str(e))}</p>", 1
     
-    for topic in question_bank:
-        html += f"<h3>Topic: {topic}</h3>"
-        
-        for difficulty in question_bank[topic]:
-            html += f"<h4>Difficulty: {difficulty}</h4>"
-            
-            for q_type in question_bank[topic][difficulty]:
-                if q_type == "mcq":
-                    type_name = "Multiple Choice Questions"
-                elif q_type == "true_false":
-                    type_name = "True/False Questions"
-                elif q_type == "short":
-                    type_name = "Short Answer Questions"
-                elif q_type == "long":
-                    type_name = "Long Answer Questions"
-                else:
-                    type_name = q_type
-                    
-                html += f"<h5>{type_name} ({len(question_bank[topic][difficulty][q_type])} questions)</h5>"
-                
-                html += "<div style='max-height: 400px; overflow-y: auto;'>"
-                for i, question in enumerate(question_bank[topic][difficulty][q_type]):
-                    if question.strip():  # Skip empty questions
-                        html += f"<div style='margin-bottom:15px; padding:10px; border:1px solid #ddd; border-radius:5px;'>"
-                        html += format_question(question, q_type)
-                        html += "</div>"
-                html += "</div>"
+    if total == 0:
+        if difficulty or q_type or search or stale_only:
+            return f"<p>No saved questions for {escape(pdf_file)} match the filters.</p>", 1
+        return f"<p>No questions saved for {escape(pdf_file)} yet.</p>", 1
     
-    return html
+    first = (page - 1) * BANK_PAGE_SIZE + 1
+    parts = [
+        f"<h2>Question Bank for {escape(pdf_file)}</h2>",
+        f"<p>Showing {first}-{first + len(rows) - 1} of {total} questions (page {page} of {pages})</p>",
+        "<div style='max-height: 600px; overflow-y: auto;'>"
+    ]
+    for row_id, topic, row_difficulty, row_q_type, question, stale in rows:
+        parts.append("<div style='margin-bottom:15px; padding:10px; border:1px solid #ddd; border-radius:5px;'>")
+        parts.append(f"<small>{escape(get_type_name(row_q_type))} | {escape(row_difficulty)} | {escape(topic)}</small><br>")
+        parts.append(render_bank_question(row_id, row_q_type, question, stale))
+        parts.append("</div>")
+    parts.append("</div>")
+    return "".join(parts), page
+
+# Exam variants rendered in the Create Exam tab; the rest are only in the JSON
+MAX_RENDERED_VARIANTS = 3
 
 # Define the Gradio interface
-with gr.Blocks() as demo:
-    gr.Markdown("# AI Question Bank Generator with RAG")
-    
-    # State for storing PDF dropdown values and current questions
-    pdf_files = gr.State(get_uploaded_pdfs())
-    current_questions = gr.State([])
-    current_q_type = gr.State("")
-    
-    with gr.Tabs():
-        with gr.TabItem("Upload Documents"):
-            gr.Markdown("## Upload PDF Documents for Context")
-            file_upload = gr.File(label="Upload PDF", file_types=[".pdf"])
-            upload_btn = gr.Button("Process Document")
-            upload_status = gr.Textbox(label="Upload Status")
+def create_app():
+    with gr.Blocks() as demo:
+        gr.Markdown("# AI Question Bank Generator with RAG")
+        
+        # Start-up progress; empty once the stores are warm and the models loaded
+        startup_display = gr.Markdown()
+        demo.load(format_startup_status, inputs=None, outputs=startup_display, every=2)
+    
+        # State for storing PDF dropdown values and current questions
+        pdf_files = gr.State(get_uploaded_pdfs())
+        current_questions = gr.State([])
+        current_q_type = gr.State("")
+    
+        with gr.Tabs():
+            with gr.TabItem("Upload Documents"):
+                gr.Markdown("## Upload PDF Documents for Context")
+                file_upload = gr.File(label="Upload PDFs", file_types=[".pdf"], file_count="multiple")
+                upload_btn = gr.Button("Process Documents")
+                upload_status = gr.Textbox(label="Upload Status")
             
-            upload_btn.click(upload_document, 
-                           inputs=[file_upload],
-                           outputs=[upload_status, pdf_files])
-    
-        with gr.TabItem("Generate Questions"):
-            gr.Markdown("## Generate Questions from Context")
-            with gr.Row():
-                # Use PDF dropdown for selecting the specific document
-                pdf_dropdown = gr.Dropdown(label="Select PDF Document", choices=get_uploaded_pdfs(), interactive=True)
-                difficulty = gr.Dropdown(["beginner", "intermediate", "advanced"], label="Difficulty", value="beginner")
+                # Processing runs in the background; progress refreshes every few seconds
+                ingest_jobs_display = gr.HTML(label="Processing Queue")
             
-            with gr.Row():
-                # Question type dropdown
-                question_type = gr.Dropdown(
-                    ["mcq", "true_false", "short", "long"], 
-                    label="Question Type", 
-                    value="mcq",
-                    info="MCQs, True/False, Short Answer, or Long Answer"
-                )
-                num_questions = gr.Number(label="Number of Questions", value=5, minimum=1, maximum=20)
+                upload_btn.click(upload_document, 
+                               inputs=[file_upload],
+                               outputs=[upload_status, pdf_files])
+                demo.load(format_ingest_jobs, inputs=None, outputs=ingest_jobs_display, every=2)
+    
+            with gr.TabItem("Generate Questions"):
+                gr.Markdown("## Generate Questions from Context")
+                with gr.Row():
+                    # Use PDF dropdown for selecting the specific document
+                    pdf_dropdown = gr.Dropdown(label="Select PDF Document", choices=get_uploaded_pdfs(), interactive=True)
+                    difficulty = gr.Dropdown(["beginner", "intermediate", "advanced"], label="Difficulty", value="beginner")
+            
+                with gr.Row():
+                    # Question type dropdown
+                    question_type = gr.Dropdown(
+                        ["mcq", "true_false", "short", "long"], 
+                        label="Question Type", 
+                        value="mcq",
+                        info="MCQs, True/False, Short Answer, or Long Answer"
+                    )
+                    num_questions = gr.Number(label="Number of Questions", value=5, minimum=1, maximum=20)
                 
-            generate_btn = gr.Button("Generate Questions")
-            status_output = gr.Textbox(label="Status")
+                generate_btn = gr.Button("Generate Questions")
+                status_output = gr.Textbox(label="Status")
+            
+                # Display area for generated questions
+                questions_display = gr.HTML(label="Generated Questions")
             
-            # Display area for generated questions
-            questions_display = gr.HTML(label="Generated Questions")
+                with gr.Row():
+                    save_btn = gr.Button("Save Questions")
+                    regenerate_btn = gr.Button("Regenerate Questions")
             
-            with gr.Row():
-                save_btn = gr.Button("Save Questions")
-                regenerate_btn = gr.Button("Regenerate Questions")
+                # Generate every question type in one go, sharing a single retrieval
+                with gr.Accordion("Generate Full Set", open=False):
+                    with gr.Row():
+                        set_mcq = gr.Number(label="MCQs", value=10, minimum=0)
+                        set_tf = gr.Number(label="True/False", value=5, minimum=0)
+                        set_short = gr.Number(label="Short Answer", value=3, minimum=0)
+                        set_long = gr.Number(label="Long Answer", value=2, minimum=0)
+                    generate_set_btn = gr.Button("Generate Full Set")
             
-            # Update dropdown choices when pdf_files state changes
-            pdf_files.change(lambda x: gr.Dropdown.update(choices=x), inputs=pdf_files, outputs=pdf_dropdown)
+                # Update dropdown choices when pdf_files state changes
+                pdf_files.change(lambda x: gr.Dropdown.update(choices=x), inputs=pdf_files, outputs=pdf_dropdown)
             
-            # Generate questions function
-            def generate_and_display(pdf_file, difficulty, q_type, num):
-                status, questions = generate_questions(pdf_file, difficulty, q_type, num)
-                display_html = format_questions_display(questions, q_type)
-                return status, display_html, questions, q_type
+                # Generate questions function, rendering each question as soon as it is complete
+                def generate_and_display(pdf_file, difficulty, q_type, num, request: gr.Request):
+                    for status, questions in stream_generated_questions(pdf_file, difficulty, q_type, num, user=get_user_id(request)):
+                        display_html = format_questions_display(questions, q_type)
+                        yield status, display_html, questions, q_type
             
-            generate_btn.click(
-                generate_and_display, 
-                inputs=[pdf_dropdown, difficulty, question_type, num_questions],
-                outputs=[status_output, questions_display, current_questions, current_q_type]
-            )
+                generate_btn.click(
+                    generate_and_display, 
+                    inputs=[pdf_dropdown, difficulty, question_type, num_questions],
+                    outputs=[status_output, questions_display, current_questions, current_q_type]
+                )
             
-            # Regenerate with the same parameters
-            def regenerate(pdf_file, difficulty, q_type, num):
-                status, questions = generate_questions(pdf_file, difficulty, q_type, num)
-                display_html = format_questions_display(questions, q_type)
-                return status, display_html, questions, q_type
+                # Regenerate with the same parameters; a fresh nonce bypasses the result cache
+                def regenerate(pdf_file, difficulty, q_type, num, request: gr.Request):
+                    nonce = uuid.uuid4().hex
+                    for status, questions in stream_generated_questions(pdf_file, difficulty, q_type, num, user=get_user_id(request), nonce=nonce):
+                        display_html = format_questions_display(questions, q_type)
+                        yield status, display_html, questions, q_type
                 
-            regenerate_btn.click(
-                regenerate,
-                inputs=[pdf_dropdown, difficulty, question_type, num_questions],
-                outputs=[status_output, questions_display, current_questions, current_q_type]
-            )
+                regenerate_btn.click(
+                    regenerate,
+                    inputs=[pdf_dropdown, difficulty, question_type, num_questions],
+                    outputs=[status_output, questions_display, current_questions, current_q_type]
+                )
             
-            # Save questions function
-            def save_current_questions(pdf_file, difficulty, q_type, questions):
-                save_status = save_questions(pdf_file, difficulty, q_type, questions)
-                return save_status
+                # Generate a full set; the questions state then holds a dict of type -> questions
+                def generate_set_and_display(pdf_file, difficulty, mcq, tf, short, long, request: gr.Request):
+                    status, question_set = generate_full_set(pdf_file, difficulty, mcq, tf, short, long, user=get_user_id(request))
+                    display_html = format_question_set_display(question_set)
+                    return status, display_html, question_set, "set"
+            
+                generate_set_btn.click(
+                    generate_set_and_display,
+                    inputs=[pdf_dropdown, difficulty, set_mcq, set_tf, set_short, set_long],
+                    outputs=[status_output, questions_display, current_questions, current_q_type]
+                )
+            
+                # Save questions function
+                def save_current_questions(pdf_file, difficulty, q_type, questions):
+                    if q_type == "set":
+                        return save_question_set(pdf_file, difficulty, questions)
+                    save_status = save_questions(pdf_file, difficulty, q_type, questions)
+                    return save_status
                 
-            save_btn.click(
-                save_current_questions,
-                inputs=[pdf_dropdown, difficulty, current_q_type, current_questions],
-                outputs=[status_output]
-            )
+                save_btn.click(
+                    save_current_questions,
+                    inputs=[pdf_dropdown, difficulty, current_q_type, current_questions],
+                    outputs=[status_output]
+                )
         
-        with gr.TabItem("View Question Bank"):
-            gr.Markdown("## View PDF-specific Question Banks")
+            with gr.TabItem("View Question Bank"):
+                gr.Markdown("## View PDF-specific Question Banks")
+            
+                # Dropdown to select PDF for viewing its question bank
+                view_pdf_dropdown = gr.Dropdown(label="Select PDF Document", choices=get_uploaded_pdfs(), interactive=True)
             
-            # Dropdown to select PDF for viewing its question bank
-            view_pdf_dropdown = gr.Dropdown(label="Select PDF Document", choices=get_uploaded_pdfs(), interactive=True)
-            view_btn = gr.Button("View Question Bank")
+                # Filters; only the requested page is loaded and rendered
+                with gr.Row():
+                    view_difficulty = gr.Dropdown(["all", "beginner", "intermediate", "advanced"], label="Difficulty", value="all")
+                    view_q_type = gr.Dropdown(["all", "mcq", "true_false", "short", "long"], label="Question Type", value="all")
+                    view_search = gr.Textbox(label="Search Text")
+                    view_stale = gr.Checkbox(label="Only questions whose source changed", value=False)
+                view_btn = gr.Button("View Question Bank")
+            
+                # Display area for PDF-specific question bank
+                bank_display = gr.HTML(label="Question Bank Contents")
+            
+                with gr.Row():
+                    prev_page_btn = gr.Button("Previous Page")
+                    view_page = gr.Number(label="Page", value=1, precision=0)
+                    next_page_btn = gr.Button("Next Page")
+            
+                # Update dropdown choices when pdf_files state changes
+                pdf_files.change(lambda x: gr.Dropdown.update(choices=x), inputs=pdf_files, outputs=view_pdf_dropdown)
+            
+                view_inputs = [view_pdf_dropdown, view_difficulty, view_q_type, view_search]
+            
+                # View PDF-specific question bank, starting from the first page
+                view_btn.click(
+                    lambda pdf_file, difficulty, q_type, search, stale: format_pdf_question_bank(pdf_file, difficulty, q_type, search, 1, stale),
+                    inputs=view_inputs + [view_stale],
+                    outputs=[bank_display, view_page]
+                )
+                view_search.submit(
+                    lambda pdf_file, difficulty, q_type, search, stale: format_pdf_question_bank(pdf_file, difficulty, q_type, search, 1, stale),
+                    inputs=view_inputs + [view_stale],
+                    outputs=[bank_display, view_page]
+                )
+                prev_page_btn.click(
+                    lambda pdf_file, difficulty, q_type, search, page, stale: format_pdf_question_bank(pdf_file, difficulty, q_type, search, max(1, int(page or 1) - 1), stale),
+                    inputs=view_inputs + [view_page, view_stale],
+                    outputs=[bank_display, view_page]
+                )
+                next_page_btn.click(
+                    lambda pdf_file, difficulty, q_type, search, page, stale: format_pdf_question_bank(pdf_file, difficulty, q_type, search, int(page or 1) + 1, stale),
+                    inputs=view_inputs + [view_page, view_stale],
+                    outputs=[bank_display, view_page]
+                )
+                view_page.submit(
+                    format_pdf_question_bank,
+                    inputs=view_inputs + [view_page, view_stale],
+                    outputs=[bank_display, view_page]
+                )
             
-            # Display area for PDF-specific question bank
-            bank_display = gr.HTML(label="Question Bank Contents")
+                # Remove near-duplicate questions that are already in the bank
+                compact_btn = gr.Button("Compact Question Bank")
+                compact_status = gr.Textbox(label="Compact Status")
             
-            # Update dropdown choices when pdf_files state changes
-            pdf_files.change(lambda x: gr.Dropdown.update(choices=x), inputs=pdf_files, outputs=view_pdf_dropdown)
+                def compact_bank(pdf_file, difficulty, q_type, search, page, stale):
+                    if not pdf_file:
+                        return "Please select a PDF first.", "", 1
+                    removed = get_generator().compact_question_bank(pdf_file)
+                    html, page = format_pdf_question_bank(pdf_file, difficulty, q_type, search, page, stale)
+                    return f"Removed {removed} near-duplicate questions from {pdf_file}.", html, page
             
-            # View PDF-specific question bank
-            view_btn.click(
-                format_pdf_question_bank,
-                inputs=[view_pdf_dropdown],
-                outputs=[bank_display]
-            )
+                compact_btn.click(
+                    compact_bank,
+                    inputs=view_inputs + [view_page, view_stale],
+                    outputs=[compact_status, bank_display, view_page]
+                )
             
-        with gr.TabItem("Create Exam"):
-            gr.Markdown("## Create Exam from PDF-specific Question Bank")
+            with gr.TabItem("Create Exam"):
+                gr.Markdown("## Create Exam from PDF-specific Question Bank")
             
-            with gr.Row():
-                # Use PDF dropdown for selecting the specific document
-                exam_pdf_dropdown = gr.Dropdown(label="Select PDF Document", choices=get_uploaded_pdfs(), interactive=True)
-                exam_difficulty = gr.Dropdown(["beginner", "intermediate", "advanced"], label="Difficulty", value="beginner")
+                with gr.Row():
+                    # Use PDF dropdown for selecting the specific document
+                    exam_pdf_dropdown = gr.Dropdown(label="Select PDF Document", choices=get_uploaded_pdfs(), interactive=True)
+                    exam_difficulty = gr.Dropdown(["beginner", "intermediate", "advanced"], label="Difficulty", value="beginner")
             
-            with gr.Row():
-                exam_mcq = gr.Number(label="MCQs", value=5, minimum=0)
-                exam_tf = gr.Number(label="True/False", value=3, minimum=0)
-                exam_short = gr.Number(label="Short Answer", value=2, minimum=0)
-                exam_long = gr.Number(label="Long Answer", value=1, minimum=0)
+                with gr.Row():
+                    exam_mcq = gr.Number(label="MCQs", value=5, minimum=0)
+                    exam_tf = gr.Number(label="True/False", value=3, minimum=0)
+                    exam_short = gr.Number(label="Short Answer", value=2, minimum=0)
+                    exam_long = gr.Number(label="Long Answer", value=1, minimum=0)
                 
-            # Function to create an exam from PDF-specific question bank
-            def create_exam_from_pdf_bank(pdf_file, difficulty, mcq, tf, short, long):
-                if not pdf_file:
-                    return "Please select a PDF first.", ""
+                with gr.Row():
+                    exam_variants = gr.Number(label="Exam Variants", value=1, minimum=1, precision=0)
+                    exam_exclude_days = gr.Number(label="Exclude Questions Issued in Last N Days", value=DEFAULT_EXAM_EXCLUDE_DAYS, minimum=0, precision=0)
                 
-                # Extract topic from the PDF filename
-                topic = extract_topic_from_filename(pdf_file)
+                # Function to create exams from PDF-specific question bank, spread over the document's pages.
+                # Exams are only previews until issued, so re-drawing does not use up the bank
+                @traced("ui.create_exam")
+                def create_exam_from_pdf_bank(pdf_file, difficulty, mcq, tf, short, long, variants, exclude_days):
+                    if not pdf_file:
+                        return "Please select a PDF first.", "", None, ""
                 
-                # Load PDF-specific question bank
-                question_bank = get_pdf_specific_question_bank(pdf_file)
+                    # Extract topic from the PDF filename
+                    topic = extract_topic_from_filename(pdf_file)
                 
-                # Check if there are questions for this topic and difficulty
-                if topic not in question_bank or difficulty not in question_bank[topic]:
-                    return f"No questions found for {topic} at {difficulty} level.", ""
+                    counts = {"mcq": mcq, "true_false": tf, "short": short, "long": long}
+                    try:
+                        exams, shortages = get_generator().build_exams(pdf_file, topic, difficulty, counts, int(variants or 1), int(exclude_days or 0), record=False)
+                    except Exception as e:
+                        print(f"Error creating exam: {e}")
+                        return f"Error creating exam: {str(e)}", "", None, ""
                 
-                # Create exam structure
-                exam = {
-                    "title": f"{topic} Exam ({difficulty} Level)",
-                    "date": datetime.now().strftime("%Y-%m-%d"),
-                    "sections": []
-                }
+                    if not any(section["questions"] for section in exams[0]["sections"]):
+                        return f"No unused questions found for {topic} at {difficulty} level.", "", None, ""
                 
-                # Add questions to exam
-                for q_type, num in {"mcq": mcq, "true_false": tf, "short": short, "long": long}.items():
-                    if q_type in question_bank[topic][difficulty] and num > 0:
-                        available_questions = question_bank[topic][difficulty][q_type]
-                        selected_questions = random.sample(available_questions, min(int(num), len(available_questions)))
-                        exam["sections"].append({"type": q_type, "questions": selected_questions})
+                    # Format exam for display; with many variants only the first few are rendered
+                    formatted_exam = "<hr>".join(format_exam_paper(exam) for exam in exams[:MAX_RENDERED_VARIANTS])
+                    if len(exams) > MAX_RENDERED_VARIANTS:
+                        formatted_exam += f"<p>{len(exams) - MAX_RENDERED_VARIANTS} more variants are in the raw JSON.</p>"
+                    if shortages:
+                        missing = ", ".join(f"{count} {get_type_name(q_type)}" for q_type, count in shortages.items())
+                        formatted_exam = f"<p><b>Not enough unused questions:</b> short by {missing}.</p>" + formatted_exam
                 
-                # Format exam for display
-                formatted_exam = format_exam_paper(exam)
+                    status = "Preview only: click Issue Exam to record these questions as used."
+                    return json.dumps(exams[0] if len(exams) == 1 else exams, indent=2), formatted_exam, exams, status
                 
-                return json.dumps(exam, indent=2), formatted_exam
+                # Record the previewed exams so their questions are excluded from later exams
+                def issue_previewed_exams(exams):
+                    if not exams:
+                        return "Create an exam first.", None
+                    try:
+                        recorded = get_generator().issue_exams(exams)
+                    except Exception as e:
+                        print(f"Error issuing exam: {e}")
+                        return f"Error issuing exam: {str(e)}", exams
+                    # Clear the preview so the same exams are not recorded twice
+                    return f"Issued {len(exams)} exam(s); {recorded} questions recorded as used.", None
                 
-            exam_btn = gr.Button("Create Exam")
-            exam_json = gr.Textbox(label="Raw JSON")
-            formatted_exam = gr.HTML(label="Formatted Exam")
+                previewed_exams = gr.State(None)
+                with gr.Row():
+                    exam_btn = gr.Button("Create Exam")
+                    issue_btn = gr.Button("Issue Exam")
+                exam_status = gr.Textbox(label="Exam Status")
+                exam_json = gr.Textbox(label="Raw JSON")
+                formatted_exam = gr.HTML(label="Formatted Exam")
             
-            # Update dropdown choices when pdf_files state changes
-            pdf_files.change(lambda x: gr.Dropdown.update(choices=x), inputs=pdf_files, outputs=exam_pdf_dropdown)
+                # Update dropdown choices when pdf_files state changes
+                pdf_files.change(lambda x: gr.Dropdown.update(choices=x), inputs=pdf_files, outputs=exam_pdf_dropdown)
             
-            # Format exam paper for display
-            def format_exam_paper(exam_data):
-                try:
-                    if isinstance(exam_data, str):
-                        exam = json.loads(exam_data)
-                    else:
-                        exam = exam_data
+                # Format exam paper for display
+                def format_exam_paper(exam_data):
+                    try:
+                        if isinstance(exam_data, str):
+                            exam = json.loads(exam_data)
+                        else:
+                            exam = exam_data
                         
-                    html = f"<h2>{exam['title']}</h2>"
-                    html += f"<p>Date: {exam['date']}</p><hr>"
+                        html = f"<h2>{exam['title']}</h2>"
+                        html += f"<p>Date: {exam['date']}</p><hr>"
                     
-                    for section_idx, section in enumerate(exam['sections']):
-                        q_type = section['type']
-                        html += f"<h3>Section {section_idx + 1}: "
-                        
-                        if q_type == "mcq":
-                            html += "Multiple Choice Questions</h3>"
-                        elif q_type == "true_false":
-                            html += "True/False Questions</h3>"
-                        elif q_type == "short":
-                            html += "Short Answer Questions</h3>"
-                        elif q_type == "long":
-                            html += "Long Answer Questions</h3>"
-                        
-                        for i, question in enumerate(section['questions']):
-                            html += f"<div style='margin-bottom:15px; padding:10px; border:1px solid #ddd; border-radius:5px;'>"
-                            html += format_question(question, q_type)
-                            html += "</div>"
+                        for section_idx, section in enumerate(exam['sections']):
+                            q_type = section['type']
+                            html += f"<h3>Section {section_idx + 1}: {get_type_name(q_type)}</h3>"
+
+                            for i, question in enumerate(section['questions']):
+                                html += f"<div style='margin-bottom:15px; padding:10px; border:1px solid #ddd; border-radius:5px;'>"
+                                html += format_question(question, q_type)
+                                html += "</div>"
                             
-                    return html
-                except Exception as e:
-                    return f"<p>Error formatting exam: {str(e)}</p><pre>{exam_data}</pre>"
+                        return html
+                    except Exception as e:
+                        return f"<p>Error formatting exam: {str(e)}</p><pre>{exam_data}</pre>"
             
-            exam_btn.click(
-                create_exam_from_pdf_bank,
-                inputs=[exam_pdf_dropdown, exam_difficulty, exam_mcq, exam_tf, exam_short, exam_long],
-                outputs=[exam_json, formatted_exam]
-            )
+                exam_btn.click(
+                    create_exam_from_pdf_bank,
+                    inputs=[exam_pdf_dropdown, exam_difficulty, exam_mcq, exam_tf, exam_short, exam_long, exam_variants, exam_exclude_days],
+                    outputs=[exam_json, formatted_exam, previewed_exams, exam_status]
+                )
+                issue_btn.click(issue_previewed_exams, inputs=previewed_exams, outputs=[exam_status, previewed_exams])
+    
+    return demo
 
-# Import missing dependencies
-from datetime import datetime
-import random
+# Serve the page first, then build the generator and warm up in the background
+def main():
+    demo = create_app()
+    
+    # The queue is required for streaming handlers. LLM concurrency is bounded
+    # separately by the generator's scheduler, so handlers mostly wait there.
+    demo.queue(concurrency_count=8, max_size=64)
+    
+    # Prometheus metrics at /metrics and start-up readiness at /ready when METRICS_PORT is set
+    set_readiness_check(startup_status)
+    start_metrics_server()
+    
+    demo.launch(prevent_thread_lock=True)
+    print(f"Serving after {time.time() - _startup['started']:.2f}s")
+    start_generator()
+    demo.block_thread()
 
-# Launch the app
-demo.launch()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import time
+import uuid
+from datetime import datetime
+
+# Stratum for questions without page metadata (e.g. imported from the old JSON banks)
+UNKNOWN_STRATUM = -1
+
+
+def page_strata(questions, sections=4):
+    """Assign each question to one of `sections` equal page bands of the document.
+
+    A question belongs to the band of its first source page. Questions with no
+    pages go into UNKNOWN_STRATUM.
+    """
+    import numpy as np
+    first_pages = [min(q["pages"]) if isinstance(q, dict) and q.get("pages") else None for q in questions]
+    known = [page for page in first_pages if page is not None]
+    if not known:
+        return np.full(len(questions), UNKNOWN_STRATUM, dtype=np.int64)
+    low, high = min(known), max(known)
+    width = max(1, -(-(high - low + 1) // max(1, sections)))
+    return np.array(
+        [UNKNOWN_STRATUM if page is None else (page - low) // width for page in first_pages],
+        dtype=np.int64
+    )
+
+
+def allocate(sizes, total):
+    """Split `total` picks across strata as evenly as their sizes allow.
+
+    Small strata are taken whole and the rest share an equal level, so every
+    section of the document gets a share before any gets two. Returns
+    (counts, eligible, remainder): the even share per stratum, a mask of the
+    strata that can take one more, and how many of them must take one more.
+    """
+    import numpy as np
+    sizes = np.asarray(sizes, dtype=np.int64)
+    total = min(int(total), int(sizes.sum()))
+    level = 0
+    while level < sizes.max(initial=0) and np.minimum(sizes, level + 1).sum() <= total:
+        level += 1
+    counts = np.minimum(sizes, level)
+    return counts, sizes > counts, total - int(counts.sum())
+
+
+def draw_variants(strata, counts, eligible, remainder, variants, rng, max_retries=10):
+    """Draw `variants` stratified samples in one vectorized pass.
+
+    strata labels each candidate; counts, eligible and remainder come from
+    allocate() for the distinct labels in sorted order, and every variant
+    gives its `remainder` extra picks to randomly chosen eligible strata.
+    Each row gets independent random keys; sorting by (stratum, key) groups
+    every stratum in a random order, so taking the first n of each group is a
+    stratified sample without replacement. Returns a (variants, picks) array
+    of candidate indexes. Duplicate variants are redrawn a few times.
+    """
+    # Imported on first use so importing the app stays fast
+    import numpy as np
+    labels, sizes = np.unique(strata, return_counts=True)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    # Stratum of each sorted position, and its rank inside that stratum
+    sorted_stratum = np.repeat(np.arange(len(labels)), sizes)
+    rank_in_stratum = np.arange(len(strata)) - starts[sorted_stratum]
+    rank = np.searchsorted(labels, strata).astype(np.float64)
+    extra_strata = np.flatnonzero(eligible)
+    picks_per_row = int(counts.sum()) + remainder
+
+    def draw(n):
+        # Keys in [0, 1) never cross into the next stratum's rank
+        order = np.argsort(rank + rng.random((n, len(strata))), axis=1, kind="stable")
+        row_counts = np.tile(counts, (n, 1))
+        if remainder:
+            chosen = np.argsort(rng.random((n, len(extra_strata))), axis=1)[:, :remainder]
+            np.add.at(row_counts, (np.arange(n)[:, None], extra_strata[chosen]), 1)
+        mask = rank_in_stratum[None, :] < row_counts[:, sorted_stratum]
+        return order[mask].reshape(n, picks_per_row)
+
+    picks = draw(variants)
+    if variants < 2 or picks_per_row == 0:
+        return picks
+
+    # Variants should differ as sets of questions, as far as the bank allows
+    possible = _combinations(sizes, counts, variants) if not remainder else variants
+    for _ in range(max_retries):
+        _, first = np.unique(np.sort(picks, axis=1), axis=0, return_index=True)
+        if len(first) >= min(variants, possible):
+            break
+        repeated = np.setdiff1d(np.arange(variants), first)
+        picks[repeated] = draw(len(repeated))
+    return picks
+
+
+def _combinations(sizes, counts, cap):
+    """Number of distinct stratified samples, capped at `cap`"""
+    total = 1
+    for size, count in zip(sizes, counts):
+        ways = 1
+        for i in range(int(count)):
+            ways = ways * (int(size) - i) // (i + 1)
+        total *= ways
+        if total >= cap:
+            return cap
+    return total
+
+
+class ExamBuilder:
+    """Assembles exams from a question store, stratified by document coverage.
+
+    Questions are spread over page bands of the source document using their
+    page metadata, questions issued in recent exams or whose sources were
+    removed from the document are excluded, and any number of variants is
+    drawn at once.
+    """
+
+    def __init__(self, store, sections=4, seed=None):
+        self.store = store
+        self.sections = sections
+        self.seed = seed
+        self._rng = None
+
+    @property
+    def rng(self):
+        """Random generator for drawing variants, created on first use"""
+        if self._rng is None:
+            import numpy as np
+            self._rng = np.random.default_rng(self.seed)
+        return self._rng
+
+    def build(self, document, topic, difficulty, counts, variants=1, exclude_days=30,
+              title=None, record=True):
+        """Build `variants` exams with counts[q_type] questions of each type.
+
+        Questions issued within the last exclude_days days (0 or None: no
+        exclusion) are not used. Each section lists the bank ids of its
+        questions. When record is true the chosen questions are recorded as
+        issued; otherwise the exams are a preview that issue() can record later. Returns (exams, shortages) where shortages maps
+        q_type to how many requested questions were not available.
+        """
+        import numpy as np
+        variants = max(1, int(variants))
+        excluded = set()
+        if exclude_days:
+            excluded = self.store.issued_since(document, time.time() - exclude_days * 24 * 3600)
+
+        title = title or f"{topic} Exam ({difficulty} Level)"
+        date = datetime.now().strftime("%Y-%m-%d")
+        exams = [{"id": uuid.uuid4().hex, "title": title if variants == 1 else f"{title} - Variant {i + 1}",
+                  "date": date, "sections": []} for i in range(variants)]
+        shortages = {}
+
+        for q_type, wanted in counts.items():
+            wanted = int(wanted or 0)
+            if wanted <= 0:
+                continue
+            available = self.store.get_questions(document, topic, difficulty, q_type, include_stale=False)
+            rows = [(row_id, question) for row_id, question in available if row_id not in excluded]
+            if len(rows) < wanted:
+                shortages[q_type] = wanted - len(rows)
+            if not rows:
+                continue
+
+            questions = [question for _, question in rows]
+            strata = page_strata(questions, self.sections)
+            labels, sizes = np.unique(strata, return_counts=True)
+            # Spread picks over the known page bands first; questions without
+            # page metadata only fill what the bands cannot
+            known = labels != UNKNOWN_STRATUM
+            per_stratum = np.zeros(len(sizes), dtype=np.int64)
+            eligible = np.zeros(len(sizes), dtype=bool)
+            per_stratum[known], eligible[known], remainder = allocate(sizes[known], wanted)
+            per_stratum[~known] = np.minimum(sizes[~known], wanted - per_stratum[known].sum() - remainder)
+            picks = draw_variants(strata, per_stratum, eligible, remainder, variants, self.rng)
+            for exam, row in zip(exams, picks):
+                exam["sections"].append({"type": q_type, "questions": [questions[i] for i in row],
+                                         "ids": [rows[i][0] for i in row]})
+
+        if record:
+            self.issue(exams)
+        return exams, shortages
+
+    def issue(self, exams):
+        """Record the questions of built exams as issued; returns how many were recorded"""
+        recorded = 0
+        for exam in exams:
+            ids = [row_id for section in exam["sections"] for row_id in section.get("ids", [])]
+            if ids:
+                self.store.record_issued(exam["id"], ids)
+                recorded += len(ids)
+        return recorded
@@ -0,0 +1,207 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def estimate_eta(progress, elapsed):
+    """Seconds left for a job, extrapolated from its progress so far (None if unknown).
+
+    The total number of chunks is estimated from the chunks found per page
+    extracted so far.
+    """
+    pages, total_pages = progress.get("pages") or 0, progress.get("total_pages")
+    chunks, chunks_done = progress.get("chunks") or 0, progress.get("chunks_done") or 0
+    if not pages or not total_pages or not chunks or elapsed <= 0:
+        return None
+    expected_chunks = max(chunks, chunks / pages * total_pages)
+    fraction = chunks_done / expected_chunks
+    if fraction <= 0:
+        return None
+    return max(0.0, elapsed * (1 - fraction) / fraction)
+
+
+class IngestJobQueue:
+    """Persistent queue of document ingestion jobs run by a background worker pool.
+
+    Jobs live in SQLite, so queued work survives a restart; jobs that were
+    running when the process stopped are queued again (so only one process
+    should use a jobs database at a time). Different documents are ingested
+    in parallel, but never two jobs for the same document.
+    process(file_path, on_progress) does the work and returns a stats dict,
+    or a false value on failure.
+    """
+
+    def __init__(self, process, path="cache/ingest_jobs.sqlite", workers=2, progress_interval=1.0):
+        self.process = process
+        self.path = path
+        self.progress_interval = progress_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " file_path TEXT NOT NULL,"
+            " document TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " progress TEXT,"
+            " stats TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+        # Whatever was running when the process stopped starts over
+        self._conn.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING))
+        self._conn.commit()
+
+        # Live progress of running jobs; written to the database at most every progress_interval
+        self._progress = {}
+        self._wake = threading.Condition(self._lock)
+        self._stopping = False
+        self._workers = [
+            threading.Thread(target=self._work, name=f"ingest-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, file_path):
+        """Queue a document for ingestion and return the job id.
+
+        A document that is already queued is not queued twice; its waiting job
+        will read the latest file when it starts.
+        """
+        document = os.path.basename(file_path)
+        with self._wake:
+            row = self._conn.execute(
+                "SELECT id FROM jobs WHERE document = ? AND status = ?", (document, QUEUED)
+            ).fetchone()
+            if row is not None:
+                return row[0]
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (file_path, document, status, created_at) VALUES (?, ?, ?, ?)",
+                (file_path, document, QUEUED, time.time())
+            )
+            self._conn.commit()
+            self._wake.notify()
+            return cursor.lastrowid
+
+    def _claim(self):
+        """Mark the oldest queued job whose document is not being ingested as running"""
+        row = self._conn.execute(
+            "SELECT id, file_path FROM jobs WHERE status = ? AND document NOT IN"
+            " (SELECT document FROM jobs WHERE status = ?) ORDER BY id LIMIT 1",
+            (QUEUED, RUNNING)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        self._conn.execute("UPDATE jobs SET status = ?, started_at = ? WHERE id = ?", (RUNNING, now, row[0]))
+        self._conn.commit()
+        self._progress[row[0]] = ({}, now, 0.0)
+        return row
+
+    def _work(self):
+        while True:
+            with self._wake:
+                job = self._claim()
+                while job is None and not self._stopping:
+                    self._wake.wait()
+                    job = self._claim()
+                if job is None:
+                    return
+            job_id, file_path = job
+
+            def on_progress(progress, job_id=job_id):
+                self._report(job_id, progress)
+
+            try:
+                stats = self.process(file_path, on_progress)
+                error = None if stats else "Document could not be processed (no extractable text?)"
+            except Exception as e:
+                print(f"Error ingesting {file_path}: {e}")
+                stats, error = None, str(e)
+            self._finish(job_id, stats, error)
+
+    def _report(self, job_id, progress):
+        with self._lock:
+            _, started_at, written_at = self._progress.get(job_id, ({}, time.time(), 0.0))
+            now = time.time()
+            if now - written_at >= self.progress_interval:
+                self._conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+                self._conn.commit()
+                written_at = now
+            self._progress[job_id] = (progress, started_at, written_at)
+
+    def _finish(self, job_id, stats, error):
+        with self._wake:
+            progress = self._progress.pop(job_id, ({}, None, 0.0))[0]
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, progress = ?, stats = ?, error = ?, finished_at = ? WHERE id = ?",
+                (FAILED if error else DONE, json.dumps(progress), json.dumps(stats) if stats else None,
+                 error, time.time(), job_id)
+            )
+            self._conn.commit()
+            # A job for the same document may have been waiting on this one
+            self._wake.notify_all()
+
+    def jobs(self, limit=50):
+        """Most recent jobs, newest first, as dicts with live progress and ETA for running ones"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, document, status, progress, stats, error, created_at, started_at, finished_at"
+                " FROM jobs ORDER BY id DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+            live = {job_id: (progress, started_at) for job_id, (progress, started_at, _) in self._progress.items()}
+
+        now = time.time()
+        jobs = []
+        for job_id, document, status, progress, stats, error, created_at, started_at, finished_at in rows:
+            progress = json.loads(progress) if progress else {}
+            eta = None
+            if job_id in live:
+                progress = live[job_id][0] or progress
+                eta = estimate_eta(progress, now - live[job_id][1])
+            jobs.append({
+                "id": job_id,
+                "document": document,
+                "status": status,
+                "progress": progress,
+                "eta": eta,
+                "stats": json.loads(stats) if stats else None,
+                "error": error,
+                "created_at": created_at,
+                "started_at": started_at,
+                "finished_at": finished_at
+            })
+        return jobs
+
+    def pending(self):
+        """Number of jobs queued or running"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchone()[0]
+
+    def close(self):
+        """Stop the workers after their current jobs"""
+        with self._wake:
+            self._stopping = True
+            self._wake.notify_all()
+        for worker in self._workers:
+            worker.join()
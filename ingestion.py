@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+
+def _pdf_reader(file):
+    # PyPDF2 is imported on first use so importing the app stays fast
+    import PyPDF2
+    return PyPDF2.PdfReader(file)
+
+
+def _extract_page_range(pdf_path, start, stop):
+    """Extract the text of pages [start, stop). Runs in a worker process."""
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = _pdf_reader(file)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+@contextmanager
+def pdf_snapshot(pdf_path):
+    """Yield the path of a private copy of a PDF, deleted afterwards.
+
+    A new upload may replace the original while it is being read; workers
+    that reopen the copy by path all see the same version.
+    """
+    fd, snapshot_path = tempfile.mkstemp(suffix=".pdf", prefix="ingest-")
+    try:
+        with os.fdopen(fd, "wb") as snapshot, open(pdf_path, "rb") as source:
+            shutil.copyfileobj(source, snapshot)
+        yield snapshot_path
+    finally:
+        os.remove(snapshot_path)
+
+
+def count_pdf_pages(pdf_path):
+    """Number of pages in a PDF (reads only the page tree)"""
+    with open(pdf_path, 'rb') as file:
+        return len(_pdf_reader(file).pages)
+
+
+def iter_pdf_pages(pdf_path, workers=4, parallel_min_pages=50, pages_per_task=10):
+    """Yield (page_number, text) for each page of a PDF, in page order, starting at 1.
+
+    Small PDFs are read in-process. PDFs with at least parallel_min_pages pages are
+    split into page ranges and extracted on a process pool, with only a bounded
+    number of ranges in flight so memory stays flat.
+    """
+    with open(pdf_path, 'rb') as file:
+        pdf_reader = _pdf_reader(file)
+        num_pages = len(pdf_reader.pages)
+
+        if workers <= 1 or num_pages < parallel_min_pages:
+            for page_num in range(num_pages):
+                yield page_num + 1, pdf_reader.pages[page_num].extract_text() or ""
+            return
+
+    ranges = [(start, min(start + pages_per_task, num_pages)) for start in range(0, num_pages, pages_per_task)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        next_range = 0
+        try:
+            while next_range < len(ranges) or in_flight:
+                # Keep a couple of ranges queued per worker, then yield in order
+                while next_range < len(ranges) and len(in_flight) < workers * 2:
+                    start, stop = ranges[next_range]
+                    in_flight.append((start, pool.submit(_extract_page_range, pdf_path, start, stop)))
+                    next_range += 1
+                start, future = in_flight.popleft()
+                for offset, text in enumerate(future.result()):
+                    yield start + offset + 1, text
+        finally:
+            for _, future in in_flight:
+                future.cancel()
+
+
+class EmbeddingPipeline:
+    """Embed chunks in batches on a bounded worker pool and write each batch as it finishes"""
+
+    def __init__(self, embeddings, batch_size=32, max_workers=4, max_retries=3, retry_delay=1.0):
+        self.embeddings = embeddings
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        # Backpressure: never hold more than this many batches in memory at once
+        self.max_pending = self.max_workers * 2
+
+    def _batches(self, chunks):
+        batch = []
+        for chunk in chunks:
+            batch.append(chunk)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _embed_batch(self, batch):
+        """Embed one batch, retrying with exponential backoff. Runs on a worker thread."""
+        texts = [text for _, text, _ in batch]
+        attempt = 0
+        while True:
+            try:
+                vectors, hits, misses = self.embeddings.embed_with_stats(texts)
+                return batch, vectors, hits, misses, attempt
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                print(f"Embedding batch failed ({e}), retry {attempt}/{self.max_retries}")
+                time.sleep(self.retry_delay * (2 ** (attempt - 1)))
+
+    def _write_done(self, done, write_batch, stats, on_progress):
+        for future in done:
+            # Re-raises if the batch still failed after all retries
+            batch, vectors, hits, misses, retries = future.result()
+            ids = [chunk_id for chunk_id, _, _ in batch]
+            texts = [text for _, text, _ in batch]
+            metadatas = [metadata for _, _, metadata in batch]
+            write_batch(ids, texts, vectors, metadatas)
+
+            stats["chunks"] += len(batch)
+            stats["batches"] += 1
+            stats["cache_hits"] += hits
+            stats["cache_misses"] += misses
+            stats["retries"] += retries
+            if on_progress:
+                on_progress(dict(stats))
+
+    def run(self, chunks, write_batch, on_progress=None):
+        """Embed an iterable of (chunk_id, text, metadata) tuples.
+
+        write_batch(ids, texts, vectors, metadatas) is always called from the calling
+        thread, so one run never writes concurrently with itself. Several runs (e.g.
+        ingestion workers filling the shared collection) can still write to one store
+        at once; DocumentVectors serializes those writes per collection. Batches written
+        before a failure stay written.
+        """
+        stats = {"chunks": 0, "batches": 0, "cache_hits": 0, "cache_misses": 0, "retries": 0}
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            try:
+                for batch in self._batches(chunks):
+                    if len(pending) >= self.max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self._write_done(done, write_batch, stats, on_progress)
+                    pending.add(pool.submit(self._embed_batch, batch))
+
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._write_done(done, write_batch, stats, on_progress)
+            except Exception:
+                for future in pending:
+                    future.cancel()
+                raise
+        return stats
@@ -0,0 +1,351 @@
+import bisect
+import functools
+import inspect
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency buckets in seconds, from a cache lookup up to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """Value per label set that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram:
+    """Observations per label set, counted in cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}  # label key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {key: list(counts) for key, counts in self._values.items()}
+        samples = []
+        for key, counts in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((self.name + "_bucket", key + (("le", _format_value(bound)),), cumulative))
+            samples.append((self.name + "_sum", key, counts[-1]))
+            samples.append((self.name + "_count", key, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """Named metrics plus collectors that report current values at scrape time.
+
+    A collector is a function returning (name, kind, help, labels, value)
+    tuples; it is how components that already keep their own statistics
+    (caches, scheduler, job queue) are exported without double counting.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def _get_or_create(self, cls, name, help, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            return metric
+
+    def counter(self, name, help):
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name, help):
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def unregister_collector(self, collector):
+        with self._lock:
+            if collector in self._collectors:
+                self._collectors.remove(collector)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        families = {}
+        for metric in metrics:
+            families[metric.name] = (metric.kind, metric.help, metric.samples())
+        for collector in collectors:
+            try:
+                for name, kind, help, labels, value in collector():
+                    families.setdefault(name, (kind, help, []))[2].append((name, _label_key(labels), value))
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+
+        lines = []
+        for name in sorted(families):
+            kind, help, samples = families[name]
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, key, value in samples:
+                lines.append(f"{sample_name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram("qbank_stage_seconds", "Time spent per stage (span) in seconds")
+STAGE_ERRORS = REGISTRY.counter("qbank_stage_errors_total", "Spans that ended with an exception")
+LLM_CALLS = REGISTRY.counter("qbank_llm_calls_total", "LLM calls by model and outcome")
+LLM_TOKENS = REGISTRY.counter("qbank_llm_tokens_total", "LLM tokens by model and kind (prompt or completion)")
+EMBEDDING_CALLS = REGISTRY.counter("qbank_embedding_calls_total", "Calls to the embedding model by kind")
+EMBEDDED_TEXTS = REGISTRY.counter("qbank_embedded_texts_total", "Texts sent to the embedding model")
+READY = REGISTRY.gauge("qbank_ready", "1 once start-up (including warm-up) has finished")
+
+
+# -- tracing -------------------------------------------------------------
+
+# Spans are always timed into STAGE_SECONDS, which costs a few microseconds.
+# Only a sampled fraction of traces is written to the structured log.
+_sample_rate = float(os.environ.get("METRICS_SAMPLE_RATE", "0.01"))
+_trace_log = logging.getLogger("qbank.trace")
+_trace_log.propagate = False
+_current_span = ContextVar("qbank_current_span", default=None)
+_random = random.Random()
+
+
+def configure(sample_rate=None, log_path=None):
+    """Set the trace sampling rate (0 to 1) and where sampled spans are logged.
+
+    log_path "-" logs to stderr; None keeps the current setting. Defaults
+    come from the METRICS_SAMPLE_RATE and METRICS_LOG environment variables.
+    """
+    global _sample_rate
+    if sample_rate is not None:
+        _sample_rate = max(0.0, min(1.0, float(sample_rate)))
+    if log_path is not None:
+        for handler in list(_trace_log.handlers):
+            _trace_log.removeHandler(handler)
+            handler.close()
+        handler = logging.StreamHandler() if log_path == "-" else logging.FileHandler(log_path)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _trace_log.addHandler(handler)
+        _trace_log.setLevel(logging.INFO)
+
+
+if os.environ.get("METRICS_LOG"):
+    configure(log_path=os.environ["METRICS_LOG"])
+
+
+class _Span:
+    __slots__ = ("name", "parent", "trace_id", "span_id", "parent_id", "sampled", "attributes")
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        if parent is None:
+            self.trace_id = None
+            self.parent_id = None
+            self.sampled = bool(_trace_log.handlers) and _random.random() < _sample_rate
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.sampled = parent.sampled
+        self.span_id = None
+        if self.sampled:
+            self.trace_id = self.trace_id or uuid.uuid4().hex
+            self.span_id = uuid.uuid4().hex[:16]
+
+    def set(self, **attributes):
+        """Add attributes to the logged span (ignored when the trace is not sampled)"""
+        if self.sampled:
+            self.attributes.update(attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a block as stage `name`; nested spans in the same thread form one trace.
+
+    Yields the span, whose set(**attributes) adds fields to the log record.
+    """
+    current = _Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    error = None
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # A span held across a generator's yield can end in another context
+            _current_span.set(current.parent)
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        if error is not None:
+            STAGE_ERRORS.inc(stage=name)
+        if current.sampled:
+            record = {"ts": time.time(), "trace_id": current.trace_id, "span_id": current.span_id,
+                      "parent_id": current.parent_id, "span": name, "duration_ms": round(elapsed * 1000, 3)}
+            record.update(current.attributes)
+            if error is not None:
+                record["error"] = repr(error)
+            _trace_log.info(json.dumps(record, default=str))
+
+
+def traced(name):
+    """Decorator form of span().
+
+    Generator functions are timed until exhausted but not traced, since
+    their consumer may resume them from other threads.
+    """
+    def decorate(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    yield from fn(*args, **kwargs)
+                finally:
+                    STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with span(name):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# -- HTTP endpoint -------------------------------------------------------
+
+# Returns a dict with at least "ready" (bool); served as JSON at /ready
+_readiness_check = None
+
+
+def set_readiness_check(check):
+    """Report readiness at /ready from check(), a function returning {"ready": bool, ...}"""
+    global _readiness_check
+    _readiness_check = check
+
+
+def start_metrics_server(port=None, host="0.0.0.0", registry=REGISTRY):
+    """Serve registry.render() at /metrics on a daemon thread.
+
+    /ready answers 200 once the readiness check passes and 503 before,
+    for load balancers and start-up probes. port defaults to the
+    METRICS_PORT environment variable; returns the server, or None when
+    no port is configured.
+    """
+    port = port if port is not None else os.environ.get("METRICS_PORT")
+    if port is None or port == "":
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/ready":
+                status = _readiness_check() if _readiness_check is not None else {"ready": True}
+                body = json.dumps(status, default=str).encode("utf-8")
+                self.send_response(200 if status.get("ready") else 503)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            if path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -0,0 +1,201 @@
+"""Merge the per-PDF vector stores under vectordb/ into one shared collection.
+
+Stored embeddings are copied as they are, so nothing is re-embedded. Each
+chunk gets its PDF's name as "source" metadata. Run it again at any time:
+chunks are upserted, so documents already migrated are just overwritten.
+The shared collection is specific to an embedding model; pass the model
+the per-PDF stores were embedded with as --embedding-model. Collections of
+earlier embedding models are listed after migrating, and --prune deletes them.
+
+    python migrate_vector_stores.py                 # migrate vectordb/ -> vectordb_shared/
+    python migrate_vector_stores.py --benchmark     # then compare both layouts
+    python migrate_vector_stores.py --skip-migrate --prune   # delete other models' collections
+
+Start the generator with AIQuestionBankGenerator(shared_vector_store=True) to
+use the shared collection.
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+from langchain_community.vectorstores import Chroma
+
+from vector_store_registry import DocumentVectors, SharedVectorStore, VectorStoreRegistry, shared_collection_name
+
+DEFAULT_EMBEDDING_MODEL = "nomic-embed-text"
+
+
+def _open_store(persist_directory, collection_name=None):
+    kwargs = {"persist_directory": persist_directory}
+    if collection_name:
+        kwargs["collection_name"] = collection_name
+    return Chroma(**kwargs)
+
+
+def _iter_batches(collection, batch_size, include):
+    offset = 0
+    while True:
+        batch = collection.get(include=include, limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            return
+        yield batch
+        offset += len(batch["ids"])
+
+
+def migrate(source_dir="vectordb", target_dir="vectordb_shared", batch_size=500,
+            embedding_model=DEFAULT_EMBEDDING_MODEL):
+    """Copy every per-PDF store into the shared collection. Returns {pdf: chunks copied}."""
+    registry = VectorStoreRegistry(source_dir, _open_store, max_open=1)
+    target = _open_store(target_dir, shared_collection_name(embedding_model))
+    copied = {}
+    for name in registry.names():
+        try:
+            source = registry.get(name).store
+            shared = DocumentVectors(target, source=name)
+            count = 0
+            for batch in _iter_batches(source._collection, batch_size, ["embeddings", "documents", "metadatas"]):
+                shared.upsert(batch["ids"], batch["documents"], batch["embeddings"], batch["metadatas"])
+                count += len(batch["ids"])
+            copied[name] = count
+            print(f"Migrated {count} chunks from {name}")
+        except Exception as e:
+            print(f"Error migrating vector store {name}: {e}")
+        finally:
+            registry.close(name)
+    return copied
+
+
+def prune(target_dir="vectordb_shared", embedding_model=DEFAULT_EMBEDDING_MODEL, delete=False):
+    """List (or with delete, drop) shared collections of embedding models other than embedding_model"""
+    shared = SharedVectorStore(target_dir, lambda directory: _open_store(directory, shared_collection_name(embedding_model)))
+    if delete:
+        names = shared.drop_other_collections()
+        for name in names:
+            print(f"Deleted shared collection {name}")
+    else:
+        names = shared.other_collections()
+        for name in names:
+            print(f"Shared collection {name} belongs to another embedding model (delete it with --prune)")
+    return names
+
+
+def _open_files():
+    # Linux only; elsewhere the count is not reported
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _measure(label, open_stores, make_query, queries):
+    """Open a layout's stores, then time `queries` calls of the query built for them"""
+    files_before, rss_before = _open_files(), _rss_bytes()
+    start = time.perf_counter()
+    stores = open_stores()
+    open_seconds = time.perf_counter() - start
+
+    query = make_query(stores)
+    latencies = [query() for _ in range(queries)]
+    files_after, rss_after = _open_files(), _rss_bytes()
+    result = {
+        "layout": label,
+        "open_seconds": open_seconds,
+        "query_p50_ms": statistics.median(latencies) * 1000,
+        "query_p95_ms": _percentile(latencies, 0.95) * 1000,
+        "open_files": None if files_before is None else files_after - files_before,
+        "rss_mb": None if rss_before is None else (rss_after - rss_before) / 2 ** 20
+    }
+    print(", ".join(f"{key}={value:.3f}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in result.items()))
+    return result
+
+
+def benchmark(source_dir="vectordb", target_dir="vectordb_shared", queries=50, k=3, seed=0,
+              embedding_model=DEFAULT_EMBEDDING_MODEL):
+    """Compare opening every document and per-document queries in both layouts.
+
+    Query vectors are stored chunk embeddings, so no embedding model is needed.
+    The per-PDF layout is measured first. Run with --skip-migrate in a fresh
+    process to get cold open times for the shared store as well.
+    """
+    rng = random.Random(seed)
+    names = VectorStoreRegistry(source_dir, _open_store).names()
+    if not names:
+        print(f"No per-PDF vector stores found in {source_dir}")
+        return []
+    probes = []
+
+    def per_pdf_query(stores):
+        # One stored embedding per document to query with
+        for name, store in stores.items():
+            sample = store._collection.get(include=["embeddings"], limit=1)
+            if sample["ids"]:
+                probes.append((name, list(sample["embeddings"][0])))
+        if not probes:
+            raise ValueError("the vector stores are empty")
+
+        def query():
+            name, vector = rng.choice(probes)
+            start = time.perf_counter()
+            stores[name]._collection.query(query_embeddings=[vector], n_results=k)
+            return time.perf_counter() - start
+        return query
+
+    def shared_query(store):
+        def query():
+            name, vector = rng.choice(probes)
+            start = time.perf_counter()
+            store._collection.query(query_embeddings=[vector], n_results=k, where={"source": name})
+            return time.perf_counter() - start
+        return query
+
+    try:
+        results = [_measure(
+            "per_pdf",
+            lambda: {name: _open_store(os.path.join(source_dir, name)) for name in names},
+            per_pdf_query,
+            queries
+        )]
+    except ValueError as e:
+        print(f"Error benchmarking vector stores: {e}")
+        return []
+    collection_name = shared_collection_name(embedding_model)
+    results.append(_measure("shared", lambda: _open_store(target_dir, collection_name), shared_query, queries))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="vectordb", help="directory of per-PDF stores")
+    parser.add_argument("--target", default="vectordb_shared", help="directory of the shared store")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--embedding-model", default=DEFAULT_EMBEDDING_MODEL,
+                        help="model the per-PDF stores were embedded with")
+    parser.add_argument("--benchmark", action="store_true", help="compare both layouts after migrating")
+    parser.add_argument("--queries", type=int, default=50, help="queries per layout in the benchmark")
+    parser.add_argument("--skip-migrate", action="store_true", help="only run the benchmark")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete shared collections of other embedding models")
+    args = parser.parse_args()
+
+    if not args.skip_migrate:
+        copied = migrate(args.source, args.target, args.batch_size, args.embedding_model)
+        print(f"Migrated {sum(copied.values())} chunks from {len(copied)} documents into {args.target}")
+    prune(args.target, args.embedding_model, delete=args.prune)
+    if args.benchmark:
+        benchmark(args.source, args.target, args.queries, embedding_model=args.embedding_model)
@@ -0,0 +1,118 @@
+import threading
+import time
+from backends import OllamaBackend
+
+# Roles the generator sends traffic for
+GENERATION = "generation"
+EMBEDDING = "embedding"
+
+
+class ModelPool:
+    """Keeps the generation and embedding models resident in Ollama and routes calls to them.
+
+    Each role has its own model and, optionally, its own Ollama host (or its
+    own backend, see backends.py), so ingestion (embedding) and generation
+    traffic can go to different servers.
+    preload() loads every model in the background and then touches each one
+    again every refresh_interval seconds with the pool's keep_alive, so
+    neither kind of request pays the cold-load latency. Ollama resets a
+    model's keep-alive to its own default (5 minutes) on requests that do
+    not pass one, so refresh_interval should stay below that.
+    """
+
+    def __init__(self, models, hosts=None, keep_alive="30m", refresh_interval=240, backends=None):
+        self.models = dict(models)  # role -> model name
+        self.hosts = dict(hosts or {})  # role -> Ollama host, None for the client default
+        self.keep_alive = keep_alive
+        self.refresh_interval = refresh_interval
+
+        # role -> backend; roles without one given share an OllamaBackend per host
+        self.backends = dict(backends or {})
+        per_host = {}
+        for role in self.models:
+            if self.backends.get(role) is None:
+                host = self.hosts.get(role)
+                if host not in per_host:
+                    per_host[host] = OllamaBackend(host)
+                self.backends[role] = per_host[host]
+
+        self._lock = threading.Lock()
+        self._status = {role: {"model": model, "host": self.hosts.get(role), "state": "cold",
+                               "load_seconds": None, "loaded_at": None, "error": None}
+                        for role, model in self.models.items()}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def model(self, role):
+        return self.models[role]
+
+    def host(self, role):
+        return self.hosts.get(role)
+
+    def backend(self, role):
+        """The backend serving a role"""
+        return self.backends[role]
+
+    def _targets(self):
+        """(roles, model) for each distinct model and backend to keep loaded"""
+        targets = {}
+        for role, model in self.models.items():
+            targets.setdefault((id(self.backends[role]), model), []).append(role)
+        return [(roles, model) for (_, model), roles in targets.items()]
+
+    def _touch(self, roles, model):
+        embedding = EMBEDDING in roles and GENERATION not in roles
+        self.backend(roles[0]).load(model, embedding=embedding, keep_alive=self.keep_alive)
+
+    def warm(self):
+        """Load (or keep loaded) every model now; returns True if all are ready"""
+        ready = True
+        for roles, model in self._targets():
+            with self._lock:
+                first = self._status[roles[0]]["state"] != "ready"
+                if first:
+                    for role in roles:
+                        self._status[role]["state"] = "loading"
+            start = time.perf_counter()
+            try:
+                self._touch(roles, model)
+                update = {"state": "ready", "loaded_at": time.time(), "error": None}
+                if first:
+                    update["load_seconds"] = time.perf_counter() - start
+            except Exception as e:
+                print(f"Error loading model {model}: {e}")
+                update = {"state": "error", "error": str(e)}
+                ready = False
+            with self._lock:
+                for role in roles:
+                    self._status[role].update(update)
+        return ready
+
+    def _run(self):
+        while True:
+            self.warm()
+            if self._stop.wait(self.refresh_interval):
+                return
+
+    def preload(self):
+        """Start loading the models and keeping them warm on a background thread"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="model-pool", daemon=True)
+        self._thread.start()
+
+    def status(self):
+        """Per-role snapshot of model, host, state (cold, loading, ready, error) and load time"""
+        with self._lock:
+            return {role: dict(status) for role, status in self._status.items()}
+
+    def ready(self, role=None):
+        with self._lock:
+            roles = [role] if role else list(self._status)
+            return all(self._status[r]["state"] == "ready" for r in roles)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
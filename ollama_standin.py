@@ -0,0 +1,290 @@
+"""Lightweight stand-in for an Ollama server, for load testing and offline use.
+
+Serves the parts of the Ollama HTTP API the app uses: /api/chat (plain and
+streamed), /api/embed and /api/embeddings, /api/generate (model loading
+only), /api/tags and /api/version. Embeddings are deterministic hashed
+bags of words, so similar texts get similar vectors; chat replies are canned
+JSON questions in the format question_parser expects, built from the words
+of the prompt's context passages. No model or GPU is needed.
+
+Latency, generation speed, parallelism, queue length and an error rate are
+configurable, so the scheduler, caches and ingestion pipeline can be
+stress-tested under conditions close to a loaded real server:
+
+    python ollama_standin.py --port 11434 --chat-latency 0.5 --tokens-per-second 40 --parallel 4 --error-rate 0.01
+
+Run it on Ollama's default port, or point the app at it with
+AIQuestionBankGenerator(ollama_host="http://127.0.0.1:11500").
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WORD = re.compile(r"[a-z]{4,}")
+_REQUESTED = re.compile(r"Generate (\d+) ([a-z/ ]+?) questions", re.IGNORECASE)
+_CONTEXT = re.compile(r"Context information from [^\n]*:\n(.*?)\n\s*Task:", re.DOTALL)
+_PASSAGE = re.compile(r"^\s*\[(\d+)\]", re.MULTILINE)
+
+
+def embed_text(text, dim=256):
+    """Unit-length hashed bag-of-words vector"""
+    vector = [0.0] * dim
+    for word in _WORD.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dim
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def canned_questions(prompt, serial):
+    """Questions for a generation prompt, varied by prompt and serial number.
+
+    Question words come from the prompt's context passages when it has any,
+    and each question cites one of those passages.
+    """
+    match = _REQUESTED.search(prompt)
+    num = int(match.group(1)) if match else 3
+    kind = match.group(2).lower() if match else ""
+    context = _CONTEXT.search(prompt)
+    passages = len(_PASSAGE.findall(context.group(1))) if context else 0
+    rng = random.Random(f"{serial}:{prompt}")
+    words = _WORD.findall((context.group(1) if context else prompt).lower()) or ["topic"]
+    questions = []
+    for i in range(num):
+        subject = " ".join(rng.choice(words) for _ in range(8))
+        question = {"question": f"Which statement about {subject} is correct?",
+                    "explanation": f"Follows from the passage on {subject}."}
+        if passages:
+            question["sources"] = [rng.randint(1, passages)]
+        if "multiple" in kind:
+            question["options"] = [f"{rng.choice(words)} {rng.choice(words)}" for _ in range(4)]
+            question["answer"] = question["options"][0]
+        elif "true" in kind:
+            question["answer"] = rng.choice(["True", "False"])
+        else:
+            question["answer"] = f"It depends on {rng.choice(words)}."
+        questions.append(question)
+    return json.dumps({"questions": questions})
+
+
+class OllamaStandin:
+    """Threaded Ollama stand-in server; use start()/stop() or as a context manager.
+
+    chat_latency and embed_latency are fixed seconds per request (time to
+    first token, for chat); tokens_per_second, if set, adds generation time
+    for the reply, spread over the streamed parts. parallel bounds the
+    requests served at once like OLLAMA_NUM_PARALLEL (None: unbounded), and
+    with max_queue more waiting requests than that are rejected with 503 as
+    Ollama does. A fraction error_rate of chat and embedding requests fail
+    with 500. The same seed gives the same errors for the same request order.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, chat_latency=0.5, embed_latency=0.01, dim=256,
+                 tokens_per_second=None, parallel=None, max_queue=None, error_rate=0.0, seed=0):
+        self.chat_latency = chat_latency
+        self.embed_latency = embed_latency
+        self.dim = dim
+        self.tokens_per_second = tokens_per_second
+        self.max_queue = max_queue
+        self.error_rate = error_rate
+        self.requests = {"chat": 0, "embed": 0, "load": 0}
+        self.stats = {"errors": 0, "rejected": 0, "waiting": 0, "active": 0, "peak_active": 0}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._slots = threading.BoundedSemaphore(parallel) if parallel else None
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+            return self.requests[kind]
+
+    def _admit(self):
+        """Wait for a free slot; returns False if the queue is full"""
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.max_queue is not None and self.stats["waiting"] >= self.max_queue:
+                    self.stats["rejected"] += 1
+                    return False
+                self.stats["waiting"] += 1
+            self._slots.acquire()
+            with self._lock:
+                self.stats["waiting"] -= 1
+        with self._lock:
+            self.stats["active"] += 1
+            self.stats["peak_active"] = max(self.stats["peak_active"], self.stats["active"])
+        return True
+
+    def _release(self):
+        with self._lock:
+            self.stats["active"] -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def _fails(self):
+        with self._lock:
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            if failed:
+                self.stats["errors"] += 1
+            return failed
+
+    def _generation_seconds(self, content):
+        return len(content.split()) / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, lines, seconds_per_line):
+                # NDJSON in chunked encoding, one part at a time as it is "generated"
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for line in lines:
+                    if seconds_per_line:
+                        time.sleep(seconds_per_line)
+                    data = (json.dumps(line) + "\n").encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send(200, {"models": []})
+                elif self.path == "/api/version":
+                    self._send(200, {"version": "0.0.0-standin"})
+                else:
+                    self._send(200, b"Ollama is running", "text/plain")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._send(400, {"error": "invalid JSON"})
+                    return
+
+                if self.path == "/api/generate":
+                    # Only used to load models (empty prompt), so no text is generated
+                    server._count("load")
+                    self._send(200, {"model": request.get("model"), "created_at": "1970-01-01T00:00:00Z",
+                                     "response": "", "done": True, "done_reason": "load"})
+                    return
+                if self.path not in ("/api/chat", "/api/embed", "/api/embeddings"):
+                    self._send(404, {"error": f"unknown endpoint {self.path}"})
+                    return
+
+                if not server._admit():
+                    self._send(503, {"error": "server busy, please try again. maximum pending requests exceeded"})
+                    return
+                try:
+                    if server._fails():
+                        self._send(500, {"error": "stand-in injected error"})
+                    elif self.path == "/api/chat":
+                        self._chat(request)
+                    else:
+                        self._embed(request)
+                finally:
+                    server._release()
+
+            def _embed(self, request):
+                server._count("embed")
+                time.sleep(server.embed_latency)
+                if self.path == "/api/embeddings":
+                    self._send(200, {"embedding": embed_text(request.get("prompt", ""), server.dim)})
+                    return
+                inputs = request.get("input", "")
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                self._send(200, {"model": request.get("model"),
+                                 "embeddings": [embed_text(text, server.dim) for text in inputs]})
+
+            def _chat(self, request):
+                serial = server._count("chat")
+                prompt = "\n".join(message.get("content", "") for message in request.get("messages", []))
+                time.sleep(server.chat_latency)
+                content = canned_questions(prompt, serial)
+                generation = server._generation_seconds(content)
+                reply = {"model": request.get("model"), "created_at": "1970-01-01T00:00:00Z",
+                         "message": {"role": "assistant", "content": content}, "done": True,
+                         "done_reason": "stop", "prompt_eval_count": len(prompt.split()),
+                         "eval_count": len(content.split())}
+                if request.get("stream", True):
+                    # The content in a few pieces, then an empty final message
+                    pieces = [content[i:i + 200] for i in range(0, len(content), 200)]
+                    lines = [dict(reply, message={"role": "assistant", "content": piece}, done=False)
+                             for piece in pieces]
+                    lines.append(dict(reply, message={"role": "assistant", "content": ""}))
+                    self._stream(lines, generation / len(pieces) if pieces else 0.0)
+                else:
+                    time.sleep(generation)
+                    self._send(200, reply)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ollama-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="seconds per chat request before the reply")
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="seconds per embedding request")
+    parser.add_argument("--tokens-per-second", type=float, help="generation speed of chat replies (default: instant)")
+    parser.add_argument("--parallel", type=int, help="requests served at once (default: unbounded)")
+    parser.add_argument("--max-queue", type=int, help="waiting requests before new ones get 503 (needs --parallel)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with 500")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    standin = OllamaStandin(args.host, args.port, args.chat_latency, args.embed_latency,
+                            tokens_per_second=args.tokens_per_second, parallel=args.parallel,
+                            max_queue=args.max_queue, error_rate=args.error_rate, seed=args.seed)
+    print(f"Ollama stand-in listening on {standin.url}")
+    try:
+        standin._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,237 @@
+import json
+import re
+
+# Bump when the prompt format or record layout changes, so cached replies are not reused
+QUESTION_FORMAT_VERSION = 1
+
+# Appended to every generation prompt; Ollama is also asked for JSON output
+JSON_FORMAT_INSTRUCTIONS = """
+Respond only with JSON in exactly this form:
+{"questions": [{"question": "...", "options": ["...", "...", "...", "..."], "answer": "...", "explanation": "...", "sources": [1]}]}
+Use "options" only for multiple choice questions. For true/false questions the answer is "True" or "False".
+For long answer questions put the key points in "explanation". "sources" lists the numbers of the context passages the question is based on.
+"""
+
+_QUESTION_START = re.compile(r"^\s*(?:[#*]+\s*)?(?:Q(?:uestion)?\s*)?\d+\s*[\.\):]", re.IGNORECASE)
+_OPTION = re.compile(r"^\s*(?:[-*]\s*)?(?:\*\*)?(?:Option\s+)?\(?([A-Da-d])(?:\*\*)?[\)\.:\]](?:\*\*)?\s*:?\s*(.+)$")
+_ANSWER = re.compile(r"^\s*(?:[-*]\s*)?(?:\*\*)?(?:Correct\s+|Short\s+Answer\s+|Model\s+)?Answer(?:\*\*)?\s*:?\s*(?:\*\*)?\s*(.*)$", re.IGNORECASE)
+_EXPLANATION = re.compile(r"^\s*(?:[-*]\s*)?(?:\*\*)?(?:Explanation|Key\s+Points)(?:\*\*)?\s*:?\s*(?:\*\*)?\s*(.*)$", re.IGNORECASE)
+_STEM_PREFIX = re.compile(r"^\s*(?:[#*]+\s*)?(?:Q(?:uestion)?\s*)?\d*\s*[\.\):]?\s*(?:\*\*)?\s*(?:Question(?:\*\*)?\s*:)?(?:\*\*)?\s*", re.IGNORECASE)
+_TRAILING_TRUE_FALSE = re.compile(r"\s*(?:[-–]\s*|\()(True|False)\)?\s*$", re.IGNORECASE)
+
+
+def _clean(value):
+    return re.sub(r"\*\*", "", str(value)).strip()
+
+
+def make_record(stem, options=None, answer="", explanation="", sources=None, pages=None):
+    """Build a compact question record, leaving out empty optional fields"""
+    record = {"stem": _clean(stem)}
+    if options:
+        record["options"] = [_clean(option) for option in options]
+    if answer is not None and answer != "":
+        # JSON replies may give true/false answers as booleans
+        if isinstance(answer, bool):
+            answer = "True" if answer else "False"
+        record["answer"] = _clean(answer)
+    if explanation:
+        record["explanation"] = _clean(explanation)
+    if sources:
+        record["sources"] = list(sources)
+    if pages:
+        record["pages"] = sorted(set(pages))
+    return record
+
+
+def _resolve_sources(numbers, context):
+    """Map 1-based passage numbers to (chunk ids, pages). Numbers that match no passage are ignored.
+
+    A question whose sources cannot be resolved cites nothing, rather than
+    every passage: stale flagging and exam page strata rely on sources.
+    """
+    if not context:
+        return [], []
+    picked = []
+    for number in numbers or []:
+        try:
+            index = int(number) - 1
+        except (TypeError, ValueError):
+            continue
+        if 0 <= index < len(context) and context[index] not in picked:
+            picked.append(context[index])
+    return [chunk_id for chunk_id, _ in picked], [page for _, page in picked if page is not None]
+
+
+def _record_from_json(item, context):
+    if isinstance(item, str):
+        return make_record(item) if item.strip() else None
+    if not isinstance(item, dict):
+        return None
+    stem = item.get("question") or item.get("stem") or item.get("statement") or ""
+    if not str(stem).strip():
+        return None
+    options = item.get("options") or item.get("choices") or []
+    if isinstance(options, dict):
+        options = [f"{key}: {value}" for key, value in options.items()]
+    explanation = item.get("explanation") or item.get("key_points") or ""
+    if isinstance(explanation, list):
+        explanation = "; ".join(str(point) for point in explanation)
+    sources, pages = _resolve_sources(item.get("sources"), context)
+    return make_record(stem, options, item.get("answer", ""), explanation, sources, pages)
+
+
+def _json_items(text):
+    """Return the list of question items in a JSON reply, or None if it is not JSON"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("\n") + 1:] if "\n" in text else text
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text[start:])
+    except ValueError:
+        return None
+    if isinstance(data, dict):
+        data = data.get("questions", [data] if ("question" in data or "stem" in data) else [])
+    return data if isinstance(data, list) else None
+
+
+def _text_blocks(text):
+    """Split a free-text reply into one block of lines per question"""
+    blocks = []
+    current = []
+    after_blank = False
+    for line in text.split("\n"):
+        if not line.strip():
+            after_blank = True
+            continue
+        # After a blank line, an answered question ends unless an explanation follows
+        if (after_blank and current and any(_ANSWER.match(l) for l in current)
+                and not _EXPLANATION.match(line)):
+            blocks.append(current)
+            current = []
+        after_blank = False
+        if _QUESTION_START.match(line) and current and not _OPTION.match(line):
+            blocks.append(current)
+            current = []
+        current.append(line)
+    if current:
+        blocks.append(current)
+    return blocks
+
+
+def _record_from_block(lines):
+    stem_lines, options, answer, explanation = [], [], [], []
+    target = stem_lines
+    for line in lines:
+        option = _OPTION.match(line)
+        answer_match = _ANSWER.match(line)
+        explanation_match = _EXPLANATION.match(line)
+        if answer_match:
+            target = answer
+            if answer_match.group(1).strip():
+                answer.append(answer_match.group(1))
+        elif explanation_match:
+            target = explanation
+            if explanation_match.group(1).strip():
+                explanation.append(explanation_match.group(1))
+        elif option and (target is stem_lines or target is options):
+            options.append(f"{option.group(1).upper()}: {option.group(2)}")
+            target = options
+        elif target is options:
+            options[-1] += " " + line.strip()
+        else:
+            target.append(line.strip())
+
+    stem = " ".join(_STEM_PREFIX.sub("", line, count=1) if i == 0 else line for i, line in enumerate(stem_lines))
+    if not stem.strip():
+        return None
+    # Preambles such as "Here are 5 questions:" are not questions
+    if not options and not answer and stem.rstrip().endswith(":"):
+        return None
+    # True/false answers are often appended to the statement, e.g. "... - True"
+    if not answer:
+        trailing = _TRAILING_TRUE_FALSE.search(stem)
+        if trailing:
+            answer = [trailing.group(1).capitalize()]
+            stem = stem[:trailing.start()]
+    # Free text does not say which passages a question came from
+    return make_record(stem, options, " ".join(answer), " ".join(explanation))
+
+
+def parse_questions(text, context=None):
+    """Turn an LLM reply into a list of question records.
+
+    JSON replies are read directly; anything else goes through a tolerant
+    free-text parser. context is the list of (chunk_id, page) for the numbered
+    passages in the prompt, used to resolve the sources a JSON question cites.
+    """
+    if not text or not text.strip():
+        return []
+    items = _json_items(text)
+    if items is not None:
+        records = [_record_from_json(item, context) for item in items]
+    else:
+        records = [_record_from_block(block) for block in _text_blocks(text)]
+    return [record for record in records if record]
+
+
+def parse_complete_questions(partial_text, context=None):
+    """Parse the questions that are already complete in a reply that is still streaming"""
+    stripped = partial_text.lstrip()
+    if stripped.startswith("{") or stripped.startswith("[") or stripped.startswith("```"):
+        items = []
+        for raw in _complete_json_objects(partial_text):
+            try:
+                items.append(json.loads(raw))
+            except ValueError:
+                continue
+        records = [_record_from_json(item, context) for item in items]
+    else:
+        # The last block may still be growing
+        records = [_record_from_block(block) for block in _text_blocks(partial_text)[:-1]]
+    return [record for record in records if record]
+
+
+def _complete_json_objects(text):
+    """Yield the source of each complete object inside the top-level "questions" array"""
+    array_start = text.find("[")
+    if array_start < 0:
+        return
+    depth = 0
+    in_string = False
+    escaped = False
+    object_start = None
+    for i in range(array_start + 1, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char == "{":
+            if depth == 0:
+                object_start = i
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0 and object_start is not None:
+                yield text[object_start:i + 1]
+                object_start = None
+        elif char == "]" and depth == 0:
+            return
+
+
+def question_text(question):
+    """Plain text of a question record (or a legacy question string), for embedding and search"""
+    if isinstance(question, dict):
+        parts = [question.get("stem", "")] + question.get("options", [])
+        return "\n".join(part for part in parts if part)
+    return str(question).strip()
@@ -0,0 +1,404 @@
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from question_parser import question_text
+
+# Document key used for the topic-based bank that is not tied to a PDF
+GLOBAL_BANK = ""
+
+
+def bank_key(pdf_filename):
+    """Key a PDF's questions are stored under (its filename without extension)"""
+    return os.path.splitext(pdf_filename)[0] if pdf_filename else GLOBAL_BANK
+
+
+def _sources(question):
+    """Chunk ids a question record cites (legacy string questions cite none)"""
+    return question.get("sources", []) if isinstance(question, dict) else []
+
+
+def _search_text(payload):
+    """Case-folded question text of a stored payload, used for text search in SQL"""
+    return question_text(json.loads(payload)).casefold()
+
+
+class QuestionStore:
+    """Embedded SQLite question bank with indexed, append-only storage.
+
+    Each question is one row keyed by document, topic, difficulty and type, so
+    saving appends rows instead of rewriting the whole bank, and views and exam
+    requests only read the rows they need. Writes are transactional and safe
+    to run from several threads or processes at once.
+    """
+
+    def __init__(self, path="question_banks/questions.sqlite", legacy_dir="question_banks",
+                 legacy_global_bank="question_bank.json", cache_max_bytes=64 * 1024 * 1024):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # SQLite connections are per thread; WAL lets readers and one writer run together
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(
+                "CREATE TABLE IF NOT EXISTS questions ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " document TEXT NOT NULL,"
+                " topic TEXT NOT NULL,"
+                " difficulty TEXT NOT NULL,"
+                " q_type TEXT NOT NULL,"
+                " payload TEXT NOT NULL,"
+                " created_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS idx_questions_lookup"
+                " ON questions (document, topic, difficulty, q_type);"
+                "CREATE INDEX IF NOT EXISTS idx_questions_filter"
+                " ON questions (document, q_type, difficulty, id);"
+                "CREATE TABLE IF NOT EXISTS migrations ("
+                " name TEXT PRIMARY KEY,"
+                " migrated_at REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS bank_versions ("
+                " document TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS issued_questions ("
+                " question_id INTEGER NOT NULL,"
+                " exam_id TEXT NOT NULL,"
+                " issued_at REAL NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS idx_issued_questions"
+                " ON issued_questions (question_id, issued_at);"
+                "CREATE TABLE IF NOT EXISTS question_sources ("
+                " question_id INTEGER NOT NULL,"
+                " chunk_id TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS idx_question_sources_chunk"
+                " ON question_sources (chunk_id);"
+                "CREATE INDEX IF NOT EXISTS idx_question_sources_question"
+                " ON question_sources (question_id);"
+                "CREATE TABLE IF NOT EXISTS document_versions ("
+                " document TEXT NOT NULL,"
+                " version INTEGER NOT NULL,"
+                " file_hash TEXT NOT NULL,"
+                " chunks INTEGER NOT NULL,"
+                " added INTEGER NOT NULL,"
+                " removed INTEGER NOT NULL,"
+                " ingested_at REAL NOT NULL,"
+                " PRIMARY KEY (document, version));"
+            )
+            # Questions whose source chunks were removed by a document update
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(questions)")]
+            if "stale" not in columns:
+                conn.execute("ALTER TABLE questions ADD COLUMN stale INTEGER NOT NULL DEFAULT 0")
+            # Embedding model each version was stored with; NULL for versions recorded before it was tracked
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(document_versions)")]
+            if "embedding_model" not in columns:
+                conn.execute("ALTER TABLE document_versions ADD COLUMN embedding_model TEXT")
+        
+        # Process-wide cache of loaded banks: document -> (version, size, bank)
+        self.cache_max_bytes = cache_max_bytes
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_lock = threading.Lock()
+
+        self.migrate_json_banks(legacy_dir, legacy_global_bank)
+        self._backfill_question_sources()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.create_function("search_text", 1, _search_text, deterministic=True)
+            self._local.conn = conn
+        return conn
+
+    def migrate_json_banks(self, legacy_dir="question_banks", legacy_global_bank="question_bank.json"):
+        """One-time import of the old *_questions.json files and question_bank.json"""
+        sources = [(path, os.path.basename(path)[:-len("_questions.json")])
+                   for path in sorted(glob.glob(os.path.join(legacy_dir, "*_questions.json")))]
+        if legacy_global_bank:
+            sources.append((legacy_global_bank, GLOBAL_BANK))
+
+        for path, document in sources:
+            name = os.path.abspath(path)
+            if not os.path.exists(path) or os.path.getsize(path) == 0:
+                continue
+            conn = self._connection()
+            if conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+                continue
+            try:
+                with open(path, "r") as f:
+                    bank = json.load(f)
+            except Exception as e:
+                print(f"Error migrating question bank {path}: {e}")
+                continue
+
+            rows = []
+            now = time.time()
+            for topic, difficulties in bank.items():
+                for difficulty, types in difficulties.items():
+                    for q_type, questions in types.items():
+                        for question in questions:
+                            if isinstance(question, str) and not question.strip():
+                                continue
+                            rows.append((document, topic, difficulty, q_type, json.dumps(question), now))
+
+            # Rows and the migration marker commit together, so a crash cannot import twice
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+                    continue
+                conn.executemany(
+                    "INSERT INTO questions (document, topic, difficulty, q_type, payload, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                conn.execute("INSERT INTO migrations (name, migrated_at) VALUES (?, ?)", (name, now))
+                self._bump_version(conn, document)
+            self._invalidate(document)
+            print(f"Migrated {len(rows)} questions from {path}")
+
+    def _backfill_question_sources(self):
+        """One-time linking of questions saved before source tracking to their chunks"""
+        name = "question_sources"
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM migrations WHERE name = ?", (name,)).fetchone():
+                return
+            rows = conn.execute("SELECT id, payload FROM questions WHERE id NOT IN (SELECT question_id FROM question_sources)")
+            links = [(row_id, source) for row_id, payload in rows for source in _sources(json.loads(payload))]
+            conn.executemany("INSERT INTO question_sources (question_id, chunk_id) VALUES (?, ?)", links)
+            conn.execute("INSERT INTO migrations (name, migrated_at) VALUES (?, ?)", (name, time.time()))
+
+    def add_questions(self, document, topic, difficulty, q_type, questions):
+        """Append questions in one transaction and return their row ids"""
+        now = time.time()
+        conn = self._connection()
+        ids = []
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for question in questions:
+                cursor = conn.execute(
+                    "INSERT INTO questions (document, topic, difficulty, q_type, payload, created_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (document, topic, difficulty, q_type, json.dumps(question), now)
+                )
+                ids.append(cursor.lastrowid)
+                conn.executemany(
+                    "INSERT INTO question_sources (question_id, chunk_id) VALUES (?, ?)",
+                    [(cursor.lastrowid, source) for source in _sources(question)]
+                )
+            self._bump_version(conn, document)
+        self._invalidate(document)
+        return ids
+
+    def flag_stale(self, document, removed_chunk_ids):
+        """Flag a document's questions that cite any of the removed chunks. Returns how many were flagged."""
+        removed_chunk_ids = list(removed_chunk_ids)
+        if not removed_chunk_ids:
+            return 0
+        conn = self._connection()
+        flagged = 0
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for start in range(0, len(removed_chunk_ids), 500):
+                batch = removed_chunk_ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                flagged += conn.execute(
+                    "UPDATE questions SET stale = 1 WHERE document = ? AND stale = 0 AND id IN ("
+                    f" SELECT question_id FROM question_sources WHERE chunk_id IN ({placeholders}))",
+                    [document] + batch
+                ).rowcount
+            if flagged:
+                self._bump_version(conn, document)
+        if flagged:
+            self._invalidate(document)
+        return flagged
+
+    def document_version(self, document):
+        """Latest recorded ingestion of a document as a dict, or None if it was never ingested"""
+        row = self._connection().execute(
+            "SELECT version, file_hash, chunks, added, removed, ingested_at, embedding_model FROM document_versions"
+            " WHERE document = ? ORDER BY version DESC LIMIT 1",
+            (document,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("version", "file_hash", "chunks", "added", "removed", "ingested_at", "embedding_model"), row))
+
+    def record_document_version(self, document, file_hash, chunks, added, removed, embedding_model=None):
+        """Record a completed ingestion of a document and return its new version number"""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute(
+                "SELECT COALESCE(MAX(version), 0) + 1 FROM document_versions WHERE document = ?", (document,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO document_versions"
+                " (document, version, file_hash, chunks, added, removed, ingested_at, embedding_model)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (document, version, file_hash, chunks, added, removed, time.time(), embedding_model)
+            )
+        return version
+
+    def get_questions(self, document, topic=None, difficulty=None, q_type=None, include_stale=True):
+        """Return (id, question) pairs matching the given filters, oldest first"""
+        clauses = ["document = ?"]
+        params = [document]
+        for column, value in (("topic", topic), ("difficulty", difficulty), ("q_type", q_type)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if not include_stale:
+            clauses.append("stale = 0")
+        rows = self._connection().execute(
+            f"SELECT id, payload FROM questions WHERE {' AND '.join(clauses)} ORDER BY id",
+            params
+        ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def query_questions(self, document, difficulty=None, q_type=None, search=None, offset=0, limit=20,
+                        stale_only=False):
+        """Return one page of a document's questions and the total number of matches.
+
+        Rows are (id, topic, difficulty, q_type, question, stale), oldest first.
+        search is a case-insensitive substring match on the question text.
+        """
+        clauses = ["document = ?"]
+        params = [document]
+        for column, value in (("difficulty", difficulty), ("q_type", q_type)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if stale_only:
+            clauses.append("stale = 1")
+        if search:
+            clauses.append("instr(search_text(payload), ?) > 0")
+            params.append(search.casefold())
+        where = " AND ".join(clauses)
+
+        conn = self._connection()
+        total = conn.execute(f"SELECT COUNT(*) FROM questions WHERE {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT id, topic, difficulty, q_type, payload, stale FROM questions WHERE {where}"
+            " ORDER BY id LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [(row_id, topic, diff, qt, json.loads(payload), bool(stale))
+                for row_id, topic, diff, qt, payload, stale in rows], total
+
+    def get_rows(self, document):
+        """Return (id, q_type, question) for every question of a document, oldest first"""
+        rows = self._connection().execute(
+            "SELECT id, q_type, payload FROM questions WHERE document = ? ORDER BY id",
+            (document,)
+        ).fetchall()
+        return [(row_id, q_type, json.loads(payload)) for row_id, q_type, payload in rows]
+
+    def _bump_version(self, conn, document):
+        """Mark a document's bank as changed (inside the writing transaction)"""
+        conn.execute(
+            "INSERT INTO bank_versions (document, version) VALUES (?, 1)"
+            " ON CONFLICT(document) DO UPDATE SET version = version + 1",
+            (document,)
+        )
+
+    def version(self, document):
+        """Counter that changes every time a document's bank is written"""
+        row = self._connection().execute(
+            "SELECT version FROM bank_versions WHERE document = ?", (document,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _invalidate(self, document):
+        """Write-through invalidation of a cached bank"""
+        with self._cache_lock:
+            entry = self._cache.pop(document, None)
+            if entry is not None:
+                self._cache_bytes -= entry[1]
+
+    def get_bank(self, document):
+        """Return a document's questions as the nested topic -> difficulty -> type -> [questions] dict.
+
+        Banks are served from an in-memory LRU cache. A cached bank is reused only
+        while the document's version in the database is unchanged, which also
+        catches writes from other processes. Treat the result as read-only.
+        """
+        version = self.version(document)
+        with self._cache_lock:
+            entry = self._cache.get(document)
+            if entry is not None and entry[0] == version:
+                self._cache.move_to_end(document)
+                return entry[2]
+
+        bank = {}
+        size = 0
+        rows = self._connection().execute(
+            "SELECT topic, difficulty, q_type, payload FROM questions WHERE document = ? ORDER BY id",
+            (document,)
+        )
+        for topic, difficulty, q_type, payload in rows:
+            size += len(payload)
+            bank.setdefault(topic, {}).setdefault(difficulty, {}).setdefault(q_type, []).append(json.loads(payload))
+
+        with self._cache_lock:
+            old = self._cache.pop(document, None)
+            if old is not None:
+                self._cache_bytes -= old[1]
+            # Banks bigger than the whole budget are not cached at all
+            if size <= self.cache_max_bytes:
+                self._cache[document] = (version, size, bank)
+                self._cache_bytes += size
+                while self._cache_bytes > self.cache_max_bytes:
+                    _, (_, evicted_size, _) = self._cache.popitem(last=False)
+                    self._cache_bytes -= evicted_size
+        return bank
+
+    def record_issued(self, exam_id, question_ids):
+        """Remember that questions were used in an exam"""
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT INTO issued_questions (question_id, exam_id, issued_at) VALUES (?, ?, ?)",
+                [(question_id, exam_id, now) for question_id in question_ids]
+            )
+
+    def issued_since(self, document, since):
+        """Ids of a document's questions issued in an exam at or after the given time"""
+        rows = self._connection().execute(
+            "SELECT DISTINCT i.question_id FROM issued_questions i"
+            " JOIN questions q ON q.id = i.question_id"
+            " WHERE q.document = ? AND i.issued_at >= ?",
+            (document, since)
+        )
+        return {row[0] for row in rows}
+
+    def delete_questions(self, ids):
+        """Delete questions by row id"""
+        ids = list(ids)
+        if not ids:
+            return
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            documents = set()
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                documents.update(row[0] for row in conn.execute(
+                    f"SELECT DISTINCT document FROM questions WHERE id IN ({placeholders})", batch
+                ))
+            conn.executemany("DELETE FROM questions WHERE id = ?", [(row_id,) for row_id in ids])
+            conn.executemany("DELETE FROM issued_questions WHERE question_id = ?", [(row_id,) for row_id in ids])
+            conn.executemany("DELETE FROM question_sources WHERE question_id = ?", [(row_id,) for row_id in ids])
+            for document in documents:
+                self._bump_version(conn, document)
+        for document in documents:
+            self._invalidate(document)
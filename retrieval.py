@@ -0,0 +1,200 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# Common words that carry no topic information
+STOPWORDS = frozenset("""
+a about an and are as at be been but by can could do does for from has have how i if in into is it its
+may more most no not of on or our should so such than that the their them then there these they this
+those to was we were what when where which while who will with would you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords and single characters"""
+    return [token for token in _TOKEN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+class KeywordIndex:
+    """BM25 inverted index over the chunks of one document"""
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, ids=None, texts=None, metadatas=None, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = []
+        self.texts = []
+        self.metadatas = []
+        self.lengths = []
+        self.postings = {}  # term -> [[chunk index, term frequency], ...]
+        # Ids already indexed, kept alongside self.ids so adding a chunk is O(1)
+        self._known = set()
+        if ids:
+            self.add(ids, texts, metadatas)
+
+    def add(self, ids, texts, metadatas=None):
+        """Add chunks; ids already in the index are skipped"""
+        metadatas = metadatas or [{} for _ in ids]
+        for chunk_key, text, metadata in zip(ids, texts, metadatas):
+            if chunk_key in self._known:
+                continue
+            self._known.add(chunk_key)
+            index = len(self.ids)
+            tokens = tokenize(text)
+            self.ids.append(chunk_key)
+            self.texts.append(text)
+            self.metadatas.append(metadata or {})
+            self.lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                self.postings.setdefault(term, []).append([index, count])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, k=10):
+        """Return up to k (chunk index, BM25 score) pairs, best first"""
+        if not self.ids:
+            return []
+        n = len(self.ids)
+        avg_length = sum(self.lengths) / n or 1.0
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, count in postings:
+                norm = count + self.k1 * (1 - self.b + self.b * self.lengths[index] / avg_length)
+                scores[index] = scores.get(index, 0.0) + idf * count * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def to_dict(self):
+        return {
+            "version": self.FORMAT_VERSION,
+            "ids": self.ids,
+            "texts": self.texts,
+            "metadatas": self.metadatas,
+            "lengths": self.lengths,
+            "postings": self.postings
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.ids = data["ids"]
+        index.texts = data["texts"]
+        index.metadatas = data["metadatas"]
+        index.lengths = data["lengths"]
+        index.postings = data["postings"]
+        index._known = set(index.ids)
+        return index
+
+
+class KeywordIndexStore:
+    """Persistent per-document keyword indexes, loaded lazily and kept in an LRU"""
+
+    def __init__(self, directory="keyword_index", max_open=8):
+        self.directory = directory
+        self.max_open = max(1, max_open)
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._open = OrderedDict()
+
+    def path(self, name):
+        return os.path.join(self.directory, name + ".json")
+
+    def _remember(self, name, index):
+        self._open[name] = index
+        self._open.move_to_end(name)
+        while len(self._open) > self.max_open:
+            self._open.popitem(last=False)
+
+    def get(self, name):
+        """Return the index for a document, or None if it was never built"""
+        with self._lock:
+            index = self._open.get(name)
+            if index is not None:
+                self._open.move_to_end(name)
+                return index
+
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"Error loading keyword index {path}: {e}")
+            return None
+        if data.get("version") != KeywordIndex.FORMAT_VERSION:
+            return None
+        index = KeywordIndex.from_dict(data)
+        with self._lock:
+            self._remember(name, index)
+        return index
+
+    def save(self, name, index):
+        """Persist an index (atomically replacing any previous one) and keep it loaded"""
+        path = self.path(name)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index.to_dict(), f)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._remember(name, index)
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def hybrid_search(keyword_query, keyword_index, vector_hits, k=3, fetch_k=20, mmr_lambda=0.7, rrf_k=60):
+    """Fuse BM25 and vector rankings and pick k diverse chunks.
+
+    keyword_query is searched in the BM25 index; vector_hits is a best-first
+    list of (chunk id, text, metadata) from the vector store. Both rankings
+    are combined with reciprocal rank fusion, then maximal marginal relevance
+    (token Jaccard overlap as the similarity) trades relevance against
+    repeating chunks already picked; mmr_lambda=1 disables the diversity term.
+    Returns a list of (chunk id, text, metadata).
+    """
+    candidates = {}
+    fused = {}
+
+    for rank, (chunk_key, text, metadata) in enumerate(vector_hits[:fetch_k]):
+        candidates[chunk_key] = (text, metadata)
+        fused[chunk_key] = fused.get(chunk_key, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+    if keyword_index is not None:
+        for rank, (index, _) in enumerate(keyword_index.search(keyword_query, fetch_k)):
+            chunk_key = keyword_index.ids[index]
+            candidates.setdefault(chunk_key, (keyword_index.texts[index], keyword_index.metadatas[index]))
+            fused[chunk_key] = fused.get(chunk_key, 0.0) + 1.0 / (rrf_k + rank + 1)
+
+    if not fused:
+        return []
+    top = max(fused.values())
+    relevance = {chunk_key: score / top for chunk_key, score in fused.items()}
+    tokens = {chunk_key: set(tokenize(text)) for chunk_key, (text, _) in candidates.items()}
+
+    selected = []
+    remaining = sorted(fused, key=fused.get, reverse=True)
+    while remaining and len(selected) < k:
+        best, best_score = None, None
+        for chunk_key in remaining:
+            redundancy = max((_jaccard(tokens[chunk_key], tokens[other]) for other in selected), default=0.0)
+            score = mmr_lambda * relevance[chunk_key] - (1 - mmr_lambda) * redundancy
+            if best_score is None or score > best_score:
+                best, best_score = chunk_key, score
+        selected.append(best)
+        remaining.remove(best)
+
+    return [(chunk_key, candidates[chunk_key][0], candidates[chunk_key][1]) for chunk_key in selected]
@@ -0,0 +1,201 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class _SharedStream:
+    """Items produced by one streaming call, replayed to every merged subscriber"""
+
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.cond = threading.Condition()
+
+
+class GenerationScheduler:
+    """Asyncio-based admission control for LLM calls.
+
+    At most max_inflight calls run at once. Waiting calls are queued per user and
+    admitted round-robin across users, so one user clicking Generate repeatedly
+    cannot starve the others. Identical requests that are already queued or
+    running are merged into a single call.
+    """
+
+    def __init__(self, max_inflight=2):
+        self.max_inflight = max(1, max_inflight)
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="generation-scheduler", daemon=True)
+        self._thread.start()
+
+        # Only touched from the event loop thread
+        self._queues = OrderedDict()  # user -> deque of waiter futures
+        self._inflight = 0
+        self._pending = {}  # request key -> task, for merging identical requests
+
+        # request key -> _SharedStream, for merging identical streaming requests
+        self._streams = {}
+        self._streams_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._queued = 0
+        self._merged = 0
+        self._completed = 0
+        self._admitted = 0
+        self._total_wait = 0.0
+        self._last_wait = 0.0
+
+    # -- event loop side -------------------------------------------------
+
+    def _dispatch(self):
+        # Hand out free slots round-robin, one waiter per user per turn
+        while self._inflight < self.max_inflight and self._queues:
+            user, waiters = self._queues.popitem(last=False)
+            waiter = waiters.popleft()
+            if waiters:
+                self._queues[user] = waiters
+            if waiter.cancelled():
+                continue
+            self._inflight += 1
+            waiter.set_result(None)
+
+    def _release(self):
+        self._inflight -= 1
+        self._dispatch()
+
+    async def _admit(self, user):
+        waiter = self._loop.create_future()
+        self._queues.setdefault(user, deque()).append(waiter)
+        with self._stats_lock:
+            self._queued += 1
+        enqueued_at = time.perf_counter()
+        try:
+            self._dispatch()
+            await waiter
+        finally:
+            with self._stats_lock:
+                self._queued -= 1
+        wait = time.perf_counter() - enqueued_at
+        with self._stats_lock:
+            self._admitted += 1
+            self._total_wait += wait
+            self._last_wait = wait
+
+    async def _execute(self, user, fn, args, kwargs):
+        await self._admit(user)
+        try:
+            return await self._loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+        finally:
+            with self._stats_lock:
+                self._completed += 1
+            self._release()
+
+    async def _submit(self, key, user, fn, args, kwargs):
+        task = self._pending.get(key) if key is not None else None
+        if task is not None:
+            with self._stats_lock:
+                self._merged += 1
+        else:
+            task = self._loop.create_task(self._execute(user, fn, args, kwargs))
+            if key is not None:
+                self._pending[key] = task
+                task.add_done_callback(lambda _: self._pending.pop(key, None))
+        # Shield so one caller going away does not cancel a call others are waiting on
+        return await asyncio.shield(task)
+
+    # -- caller side -----------------------------------------------------
+
+    def run(self, key, user, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once a slot is free and return its result.
+
+        Calls with the same non-None key that overlap share one execution.
+        Blocks the calling thread.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._submit(key, user, fn, args, kwargs), self._loop)
+        return future.result()
+
+    @contextmanager
+    def slot(self, user):
+        """Hold one in-flight slot for the duration of the block (e.g. a streaming call)"""
+        asyncio.run_coroutine_threadsafe(self._admit(user), self._loop).result()
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                self._completed += 1
+            self._loop.call_soon_threadsafe(self._release)
+
+    def stream(self, key, user, fn, *args, **kwargs):
+        """Iterate over fn(*args, **kwargs) once a slot is free.
+
+        Streaming calls with the same non-None key that overlap share one
+        execution: later subscribers first get the items already produced, then
+        follow along live.
+        """
+        with self._streams_lock:
+            shared = self._streams.get(key) if key is not None else None
+            owner = shared is None
+            if owner:
+                shared = _SharedStream()
+                if key is not None:
+                    self._streams[key] = shared
+            else:
+                with self._stats_lock:
+                    self._merged += 1
+
+        if owner:
+            threading.Thread(
+                target=self._produce,
+                args=(key, shared, user, fn, args, kwargs),
+                name="generation-stream",
+                daemon=True
+            ).start()
+
+        index = 0
+        while True:
+            with shared.cond:
+                while index >= len(shared.items) and not shared.done:
+                    shared.cond.wait()
+                items = shared.items[index:]
+                index += len(items)
+                finished = shared.done and index >= len(shared.items)
+            for item in items:
+                yield item
+            if finished:
+                if shared.error is not None:
+                    raise shared.error
+                return
+
+    def _produce(self, key, shared, user, fn, args, kwargs):
+        try:
+            with self.slot(user):
+                for item in fn(*args, **kwargs):
+                    with shared.cond:
+                        shared.items.append(item)
+                        shared.cond.notify_all()
+        except Exception as e:
+            shared.error = e
+        finally:
+            if key is not None:
+                with self._streams_lock:
+                    if self._streams.get(key) is shared:
+                        del self._streams[key]
+            with shared.cond:
+                shared.done = True
+                shared.cond.notify_all()
+
+    def stats(self):
+        """Snapshot of queue depth, in-flight calls and wait times"""
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queued,
+                "inflight": self._inflight,
+                "max_inflight": self.max_inflight,
+                "merged": self._merged,
+                "completed": self._completed,
+                "last_wait": self._last_wait,
+                "avg_wait": self._total_wait / self._admitted if self._admitted else 0.0
+            }
@@ -0,0 +1,87 @@
+import json
+import os
+
+from batch_generate import Checkpoint, expand_tasks, run_batch, task_key
+
+
+class FakeGenerator:
+    """Generator double that records what the batch runner asks of it"""
+
+    def __init__(self, upload_dir, fail=()):
+        self.upload_dir = upload_dir
+        self.fail = set(fail)
+        self.generated = []
+        self.saved = []
+
+    def process_document(self, path):
+        return {"chunks": 1}
+
+    def generate_questions(self, pdf, topic, difficulty, q_type, num, user=None):
+        self.generated.append((pdf, topic, difficulty, q_type))
+        if (pdf, q_type) in self.fail:
+            return []
+        return [{"stem": f"{topic} {q_type} {i}?"} for i in range(num)]
+
+    def save_questions(self, pdf, topic, difficulty, q_type, questions):
+        self.saved.append((pdf, topic, q_type, questions))
+        return list(range(len(questions))), []
+
+
+def write_pdfs(tmp_path, *names):
+    for name in names:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"%PDF " + name.encode())
+
+
+def test_expand_tasks_keeps_file_names_and_topics(tmp_path):
+    write_pdfs(tmp_path, "a/notes.pdf", "b/notes.pdf", "cell_biology.pdf")
+    manifest = {"documents": ["a/*.pdf", {"path": "b/notes.pdf", "topic": "Networks"}, "cell_biology.pdf"],
+                "defaults": {"types": {"mcq": 2}}}
+    tasks = expand_tasks(manifest, str(tmp_path))
+
+    assert [task["topic"] for task in tasks] == ["notes", "notes", "cell biology"]
+    assert [task["prompt_topic"] for task in tasks] == ["notes", "Networks", "cell biology"]
+    # Only the colliding file names get a path hash
+    assert tasks[2]["pdf"] == "cell_biology.pdf"
+    assert tasks[0]["pdf"] != tasks[1]["pdf"]
+    assert all(task["pdf"].startswith("notes_") for task in tasks[:2])
+
+
+def test_checkpoint_ignores_a_truncated_last_line(tmp_path):
+    path = tmp_path / "run.checkpoint.jsonl"
+    checkpoint = Checkpoint(str(path))
+    checkpoint.record("one", "done")
+    checkpoint.record("two", "failed", error="boom")
+    with open(path, "a") as f:
+        f.write('{"key": "three", "stat')
+
+    assert Checkpoint(str(path)).done == {"one"}
+
+
+def test_run_batch_resumes_from_checkpoint(tmp_path):
+    write_pdfs(tmp_path, "intro.pdf")
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    manifest = {"documents": [{"path": "intro.pdf", "topic": "Intro to Nets", "types": {"mcq": 2, "short": 1}}]}
+    tasks = expand_tasks(manifest, str(tmp_path))
+    checkpoint_path = str(tmp_path / "run.checkpoint.jsonl")
+
+    generator = FakeGenerator(str(uploads), fail={("intro.pdf", "short")})
+    summary = run_batch(generator, tasks, Checkpoint(checkpoint_path), concurrency=2)
+    assert (summary["done"], summary["failed"], summary["saved"]) == (1, 1, 2)
+    assert os.path.exists(uploads / "intro.pdf")
+    # Questions go under the file's topic and remember the prompt topic
+    pdf, topic, q_type, questions = generator.saved[0]
+    assert (pdf, topic, q_type) == ("intro.pdf", "intro", "mcq")
+    assert questions[0]["prompt_topic"] == "Intro to Nets"
+
+    # A second run only retries the failed task
+    generator = FakeGenerator(str(uploads))
+    summary = run_batch(generator, tasks, Checkpoint(checkpoint_path), concurrency=2)
+    assert (summary["skipped"], summary["done"]) == (1, 1)
+    assert generator.generated == [("intro.pdf", "Intro to Nets", "beginner", "short")]
+    with open(checkpoint_path) as f:
+        statuses = [json.loads(line)["status"] for line in f]
+    assert sorted(statuses) == ["done", "done", "failed"]
+    assert task_key(tasks[0]) in Checkpoint(checkpoint_path).done
@@ -0,0 +1,95 @@
+import math
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from dedup import QuestionDeduplicator
+from question_store import QuestionStore
+
+pytest.importorskip("langchain_community")
+pytest.importorskip("chromadb")
+
+from app import AIQuestionBankGenerator, open_chroma, release_chroma  # noqa: E402
+
+
+def unit(angle):
+    return [math.cos(angle), math.sin(angle)]
+
+
+class FakeEmbeddings:
+    """Each question stem maps to a fixed 2-d vector, so similarities are known exactly"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+
+@pytest.fixture
+def make_deduplicator(tmp_path):
+    stores = []
+
+    def make(vectors, threshold=0.92):
+        def open_index(collection_name):
+            store = open_chroma(collection_name=collection_name, persist_directory=str(tmp_path / "index"),
+                                embedding_function=None, collection_metadata={"hnsw:space": "cosine"})
+            stores.append(store)
+            return store
+        return QuestionDeduplicator(FakeEmbeddings(vectors), open_index, threshold=threshold)
+
+    yield make
+    for store in stores:
+        release_chroma(store)
+
+
+def test_threshold_decides_near_duplicates(make_deduplicator):
+    # cos(0.3) ~ 0.955 is above the threshold, cos(0.7) ~ 0.765 is below it
+    deduplicator = make_deduplicator({"A?": unit(0.0), "Close?": unit(0.3), "Far?": unit(0.7)})
+    deduplicator.add("doc", [(1, "mcq", {"stem": "A?"})])
+
+    results = deduplicator.check("doc", "mcq", [{"stem": "Close?"}, {"stem": "Far?"}])
+    assert [(match_id, duplicate) for _, match_id, _, duplicate in results] == [("1", True), (None, False)]
+    assert results[0][2] == pytest.approx(math.cos(0.3), abs=1e-4)
+
+    # Other question types are not compared
+    _, match_id, _, duplicate = deduplicator.check("doc", "short", [{"stem": "Close?"}])[0]
+    assert (match_id, duplicate) == (None, False)
+
+
+def test_repeats_within_a_batch_are_duplicates(make_deduplicator):
+    deduplicator = make_deduplicator({"A?": unit(0.0), "Also A?": unit(0.1)})
+    results = deduplicator.check("doc", "mcq", [{"stem": "A?"}, {"stem": "Also A?"}])
+    assert [(match_id, duplicate) for _, match_id, _, duplicate in results] == [(None, False), (None, True)]
+
+
+def test_rejected_duplicate_is_not_saved(tmp_path, make_deduplicator):
+    store = QuestionStore(str(tmp_path / "questions.sqlite"), legacy_dir=str(tmp_path / "legacy"))
+    generator = SimpleNamespace(
+        question_store=store,
+        deduplicator=make_deduplicator({"A?": unit(0.0), "Close?": unit(0.2), "Far?": unit(1.0)})
+    )
+
+    ids, duplicates = AIQuestionBankGenerator.save_questions(generator, "doc.pdf", "Doc", "beginner", "mcq",
+                                                             [{"stem": "A?"}])
+    assert len(ids) == 1 and duplicates == []
+
+    ids, duplicates = AIQuestionBankGenerator.save_questions(generator, "doc.pdf", "Doc", "beginner", "mcq",
+                                                             [{"stem": "Close?"}, {"stem": "Far?"}])
+    assert len(ids) == 1
+    assert duplicates == [{"stem": "Close?"}]
+    assert [question["stem"] for _, question in store.get_questions("doc")] == ["A?", "Far?"]
+
+
+def test_documents_are_locked_separately(make_deduplicator):
+    deduplicator = make_deduplicator({})
+    assert deduplicator.lock("a") is deduplicator.lock("a")
+
+    # Holding one document's lock does not block another document
+    acquired = []
+    with deduplicator.lock("a"):
+        thread = threading.Thread(target=lambda: acquired.append(deduplicator.lock("b").acquire(timeout=5)))
+        thread.start()
+        thread.join()
+    assert acquired == [True]
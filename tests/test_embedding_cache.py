@@ -0,0 +1,64 @@
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings:
+    """Embeddings double that returns a vector derived from each text and counts calls"""
+
+    def __init__(self, offset=0.0):
+        self.offset = offset
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)) + self.offset, 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)) + self.offset, 0.5]
+
+
+def test_hits_and_misses(tmp_path):
+    model = CountingEmbeddings()
+    embeddings = CachedEmbeddings(model, "model-a", EmbeddingCache(str(tmp_path / "embeddings.sqlite")))
+
+    vectors, hits, misses = embeddings.embed_with_stats(["alpha", "beta", "alpha"])
+    assert vectors == [[5.0, 0.5], [4.0, 0.5], [5.0, 0.5]]
+    # A text repeated within one batch is embedded once
+    assert (hits, misses) == (1, 2)
+    assert model.embedded == ["alpha", "beta"]
+
+    vectors, hits, misses = embeddings.embed_with_stats(["beta", "gamma"])
+    assert vectors == [[4.0, 0.5], [5.0, 0.5]]
+    assert (hits, misses) == (1, 1)
+    assert model.embedded == ["alpha", "beta", "gamma"]
+    assert embeddings.stats() == {"hits": 2, "misses": 3}
+
+
+def test_vectors_are_keyed_by_model(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    CachedEmbeddings(CountingEmbeddings(), "model-a", cache).embed_documents(["alpha"])
+
+    other_model = CountingEmbeddings(offset=100.0)
+    vectors, hits, misses = CachedEmbeddings(other_model, "model-b", cache).embed_with_stats(["alpha"])
+    assert vectors == [[105.0, 0.5]]
+    assert (hits, misses) == (0, 1)
+    assert EmbeddingCache.make_key("model-a", "alpha") != EmbeddingCache.make_key("model-b", "alpha")
+
+
+def test_cache_persists_across_reopen(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path)
+    CachedEmbeddings(CountingEmbeddings(), "model-a", cache).embed_documents(["alpha", "beta"])
+    cache.close()
+
+    model = CountingEmbeddings(offset=100.0)
+    vectors, hits, misses = CachedEmbeddings(model, "model-a", EmbeddingCache(path)).embed_with_stats(["beta"])
+    assert vectors == [[4.0, 0.5]]
+    assert (hits, misses) == (1, 0)
+    assert model.embedded == []
+
+
+def test_get_many_returns_only_cached_keys(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite"))
+    cache.put_many("model-a", [("k1", [0.25, 1.0])])
+    assert cache.get_many(["k1", "k2", "k1"]) == {"k1": [0.25, 1.0]}
+    assert cache.get_many([]) == {}
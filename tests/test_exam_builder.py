@@ -0,0 +1,63 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from exam_builder import UNKNOWN_STRATUM, ExamBuilder, allocate, draw_variants, page_strata
+from question_store import QuestionStore
+
+
+def test_page_strata():
+    questions = [{"pages": [1]}, {"pages": [5, 2]}, {"pages": [8]}, {}, "legacy question"]
+    assert page_strata(questions, sections=4).tolist() == [0, 0, 3, UNKNOWN_STRATUM, UNKNOWN_STRATUM]
+
+
+def test_allocate_spreads_picks_evenly():
+    counts, eligible, remainder = allocate([1, 5, 5], 6)
+    assert counts.tolist() == [1, 2, 2]
+    assert eligible.tolist() == [False, True, True]
+    assert remainder == 1
+
+
+def test_draw_variants_is_stratified():
+    strata = np.array([0, 1, 0, 2, 1, 2, 0, 1, 2, 2])
+    counts, eligible, remainder = allocate([3, 3, 4], 5)
+    picks = draw_variants(strata, counts, eligible, remainder, 20, np.random.default_rng(0))
+    assert picks.shape == (20, 5)
+    for row in picks:
+        assert len(set(row.tolist())) == 5
+        per_stratum = np.bincount(strata[row], minlength=3)
+        # Two strata get two picks and the other one; every stratum is covered
+        assert sorted(per_stratum.tolist()) == [1, 2, 2]
+
+
+def test_draw_variants_differ_when_possible():
+    strata = np.zeros(6, dtype=np.int64)
+    picks = draw_variants(strata, np.array([2]), np.array([False]), 0, 10, np.random.default_rng(1))
+    assert len({tuple(sorted(row.tolist())) for row in picks}) == 10
+
+
+def test_draw_variants_with_more_variants_than_combinations():
+    strata = np.zeros(3, dtype=np.int64)
+    picks = draw_variants(strata, np.array([2]), np.array([False]), 0, 5, np.random.default_rng(2))
+    assert len({tuple(sorted(row.tolist())) for row in picks}) == 3
+
+
+def test_preview_then_issue(tmp_path):
+    store = QuestionStore(str(tmp_path / "questions.sqlite"), legacy_dir=str(tmp_path / "legacy"))
+    ids = store.add_questions("doc", "Nets", "beginner", "mcq",
+                              [{"stem": f"Q{i}?", "pages": [i + 1]} for i in range(8)])
+    builder = ExamBuilder(store, seed=0)
+
+    exams, shortages = builder.build("doc", "Nets", "beginner", {"mcq": 4}, record=False)
+    assert shortages == {}
+    section = exams[0]["sections"][0]
+    assert len(section["questions"]) == 4 and set(section["ids"]) <= set(ids)
+    assert store.issued_since("doc", 0) == set()
+
+    assert builder.issue(exams) == 4
+    assert store.issued_since("doc", 0) == set(section["ids"])
+
+    # Issued questions are excluded; only four unused ones are left
+    exams, shortages = builder.build("doc", "Nets", "beginner", {"mcq": 5})
+    assert shortages == {"mcq": 1}
+    assert not set(exams[0]["sections"][0]["ids"]) & set(section["ids"])
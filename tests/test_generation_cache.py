@@ -0,0 +1,59 @@
+import generation_cache
+from generation_cache import GenerationCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_cache(tmp_path, monkeypatch, **options):
+    clock = Clock()
+    monkeypatch.setattr(generation_cache.time, "time", clock)
+    return GenerationCache(str(tmp_path / "generations.sqlite"), **options), clock
+
+
+def test_put_and_get(tmp_path, monkeypatch):
+    cache, _ = make_cache(tmp_path, monkeypatch)
+    assert cache.get("missing") is None
+    cache.put("key", [{"stem": "Q?"}])
+    assert cache.get("key") == [{"stem": "Q?"}]
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_make_key_ignores_argument_order():
+    assert GenerationCache.make_key(topic="a", num=3) == GenerationCache.make_key(num=3, topic="a")
+    assert GenerationCache.make_key(topic="a", num=3) != GenerationCache.make_key(topic="a", num=4)
+
+
+def test_expired_entries_are_misses(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch, ttl_seconds=60)
+    cache.put("key", "value")
+    clock.now += 61
+    assert cache.get("key") is None
+    # Expired rows are deleted, not just hidden
+    clock.now -= 61
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    cache, clock = make_cache(tmp_path, monkeypatch, ttl_seconds=None, max_entries=2)
+    cache.put("a", 1)
+    clock.now += 1
+    cache.put("b", 2)
+    clock.now += 1
+    assert cache.get("a") == 1
+    clock.now += 1
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_cache_persists_across_instances(tmp_path, monkeypatch):
+    cache, _ = make_cache(tmp_path, monkeypatch)
+    cache.put("key", {"questions": []})
+    assert GenerationCache(cache.path).get("key") == {"questions": []}
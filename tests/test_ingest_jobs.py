@@ -0,0 +1,103 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from ingest_jobs import DONE, FAILED, QUEUED, RUNNING, IngestJobQueue, estimate_eta
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def statuses(queue):
+    return {job["id"]: job["status"] for job in queue.jobs()}
+
+
+def test_jobs_record_stats_and_errors(tmp_path):
+    def process(file_path, on_progress):
+        on_progress({"pages": 1, "total_pages": 1})
+        if "broken" in file_path:
+            raise ValueError("bad PDF")
+        return {"chunks": 3} if "empty" not in file_path else None
+
+    queue = IngestJobQueue(process, path=str(tmp_path / "jobs.sqlite"), progress_interval=0)
+    try:
+        done = queue.submit("uploads/a.pdf")
+        broken = queue.submit("uploads/broken.pdf")
+        empty = queue.submit("uploads/empty.pdf")
+        wait_for(lambda: queue.pending() == 0)
+        jobs = {job["id"]: job for job in queue.jobs()}
+    finally:
+        queue.close()
+
+    assert jobs[done]["status"] == DONE
+    assert jobs[done]["stats"] == {"chunks": 3}
+    assert jobs[done]["progress"] == {"pages": 1, "total_pages": 1}
+    assert (jobs[broken]["status"], jobs[broken]["error"]) == (FAILED, "bad PDF")
+    assert jobs[empty]["status"] == FAILED
+
+
+def test_one_document_is_never_ingested_twice_at_once(tmp_path):
+    release = threading.Event()
+    running = []
+    overlaps = []
+
+    def process(file_path, on_progress):
+        if file_path in running:
+            overlaps.append(file_path)
+        running.append(file_path)
+        release.wait(5)
+        running.remove(file_path)
+        return {"chunks": 1}
+
+    queue = IngestJobQueue(process, path=str(tmp_path / "jobs.sqlite"), workers=3)
+    try:
+        first = queue.submit("uploads/a.pdf")
+        wait_for(lambda: statuses(queue)[first] == RUNNING)
+        # Waits for the running job; a second submit joins the one already queued
+        second = queue.submit("uploads/a.pdf")
+        assert queue.submit("uploads/a.pdf") == second
+        other = queue.submit("uploads/b.pdf")
+        wait_for(lambda: statuses(queue)[other] == RUNNING)
+        assert statuses(queue)[second] == QUEUED
+
+        release.set()
+        wait_for(lambda: queue.pending() == 0)
+    finally:
+        release.set()
+        queue.close()
+    assert overlaps == []
+    assert set(statuses(queue).values()) == {DONE}
+
+
+def test_running_jobs_are_requeued_after_a_restart(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    queue = IngestJobQueue(lambda file_path, on_progress: {"chunks": 1}, path=path, workers=1)
+    queue.close()
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO jobs (file_path, document, status, created_at) VALUES (?, ?, ?, ?)",
+                 ("uploads/a.pdf", "a.pdf", RUNNING, time.time()))
+    conn.commit()
+    conn.close()
+
+    processed = []
+    queue = IngestJobQueue(lambda file_path, on_progress: processed.append(file_path) or {"chunks": 1},
+                           path=path, workers=1)
+    try:
+        wait_for(lambda: queue.pending() == 0)
+    finally:
+        queue.close()
+    assert processed == ["uploads/a.pdf"]
+
+
+def test_estimate_eta():
+    # 10 of 40 pages gave 20 chunks, so about 80 in total; 20 done in 10s leaves 30s
+    progress = {"pages": 10, "total_pages": 40, "chunks": 20, "chunks_done": 20}
+    assert estimate_eta(progress, 10) == pytest.approx(30)
+    assert estimate_eta({"pages": 0, "total_pages": 40}, 10) is None
+    assert estimate_eta(dict(progress, chunks_done=0), 10) is None
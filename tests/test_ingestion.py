@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+
+import pytest
+
+from benchmarks.synthetic_pdf import write_pdf
+from ingestion import EmbeddingPipeline, iter_pdf_pages, pdf_snapshot
+
+
+def test_snapshot_keeps_the_version_it_copied(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(b"old version")
+    with pdf_snapshot(str(path)) as snapshot:
+        replacement = tmp_path / "new.pdf"
+        replacement.write_bytes(b"new version")
+        os.replace(replacement, path)
+        with open(snapshot, "rb") as f:
+            assert f.read() == b"old version"
+    assert not os.path.exists(snapshot)
+
+
+def test_parallel_extraction_matches_sequential(tmp_path):
+    pytest.importorskip("PyPDF2")
+    path = str(tmp_path / "doc.pdf")
+    write_pdf(path, pages=12, words_per_page=40, seed=3)
+    sequential = list(iter_pdf_pages(path, workers=1))
+    with pdf_snapshot(path) as snapshot:
+        parallel = list(iter_pdf_pages(snapshot, workers=2, parallel_min_pages=1, pages_per_task=5))
+    assert [number for number, _ in parallel] == list(range(1, 13))
+    assert parallel == sequential
+
+
+class FlakyEmbeddings:
+    """Fails the first `failures` calls, then returns one-element vectors and tracks concurrency"""
+
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def embed_with_stats(self, texts):
+        with self._lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                raise ConnectionError("embedding server unavailable")
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return [[float(len(text))] for text in texts], 0, len(texts)
+
+
+def make_chunks(count):
+    return ((f"c{i}", f"text {i}", {"page": i}) for i in range(count))
+
+
+def test_pipeline_retries_failed_batches():
+    embeddings = FlakyEmbeddings(failures=2)
+    written = []
+    pipeline = EmbeddingPipeline(embeddings, batch_size=4, max_workers=1, retry_delay=0)
+    stats = pipeline.run(make_chunks(6), lambda ids, *rest: written.extend(ids))
+    assert written == [f"c{i}" for i in range(6)]
+    assert stats == {"chunks": 6, "batches": 2, "cache_hits": 0, "cache_misses": 6, "retries": 2}
+
+
+def test_pipeline_gives_up_after_max_retries():
+    pipeline = EmbeddingPipeline(FlakyEmbeddings(failures=10), batch_size=4, max_workers=1,
+                                 max_retries=2, retry_delay=0)
+    with pytest.raises(ConnectionError):
+        pipeline.run(make_chunks(4), lambda *batch: None)
+
+
+def test_pipeline_bounds_batches_in_memory():
+    embeddings = FlakyEmbeddings(delay=0.01)
+    pipeline = EmbeddingPipeline(embeddings, batch_size=1, max_workers=2)
+    produced = []
+    written = []
+
+    def chunks():
+        for chunk in make_chunks(20):
+            produced.append(chunk[0])
+            # Batches read from the source but not yet written stay within the bound
+            assert len(produced) - len(written) <= pipeline.max_pending + 1
+            yield chunk
+
+    stats = pipeline.run(chunks(), lambda ids, *rest: written.extend(ids))
+    assert stats["chunks"] == 20
+    assert sorted(written) == sorted(produced)
+    assert embeddings.max_active <= pipeline.max_workers
@@ -0,0 +1,83 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+import metrics
+from metrics import MetricsRegistry, start_metrics_server
+
+
+def test_render_counters_gauges_and_histograms():
+    registry = MetricsRegistry()
+    calls = registry.counter("calls_total", "Calls")
+    calls.inc(model="a")
+    calls.inc(2, model="a")
+    calls.inc(model='say "hi"\n')
+    registry.gauge("ready", "Ready").set(1)
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5.0)
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP calls_total Calls", "# TYPE calls_total counter"]
+    assert 'calls_total{model="a"} 3' in lines
+    assert 'calls_total{model="say \\"hi\\"\\n"} 1' in lines
+    assert "# TYPE ready gauge" in lines and "ready 1" in lines
+    assert "# TYPE latency_seconds histogram" in lines
+    assert [line for line in lines if line.startswith("latency_seconds")] == [
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+    ]
+
+
+def test_collectors_are_rendered_until_unregistered():
+    registry = MetricsRegistry()
+
+    def collector():
+        return [("cache_entries", "gauge", "Cached entries", {"cache": "embeddings"}, 7)]
+
+    def broken():
+        raise RuntimeError("collector failed")
+
+    registry.register_collector(collector)
+    registry.register_collector(broken)
+    text = registry.render()
+    assert "# TYPE cache_entries gauge" in text
+    assert 'cache_entries{cache="embeddings"} 7' in text
+
+    registry.unregister_collector(collector)
+    registry.unregister_collector(collector)
+    assert "cache_entries" not in registry.render()
+
+
+def test_metrics_server_serves_metrics_and_readiness():
+    registry = MetricsRegistry()
+    registry.counter("calls_total", "Calls").inc()
+    state = {"ready": False}
+    server = start_metrics_server(port=0, host="127.0.0.1", registry=registry)
+    metrics.set_readiness_check(lambda: dict(state))
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert "calls_total 1" in response.read().decode("utf-8")
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/ready")
+        assert error.value.code == 503
+        state["ready"] = True
+        with urllib.request.urlopen(url + "/ready") as response:
+            assert json.loads(response.read()) == {"ready": True}
+    finally:
+        metrics.set_readiness_check(None)
+        server.shutdown()
+        server.server_close()
+
+
+def test_metrics_server_needs_a_port(monkeypatch):
+    monkeypatch.delenv("METRICS_PORT", raising=False)
+    assert start_metrics_server() is None
@@ -0,0 +1,46 @@
+from model_pool import EMBEDDING, GENERATION, ModelPool
+
+
+class FakeBackend:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.loads = []
+
+    def load(self, model, embedding=False, keep_alive=None):
+        self.loads.append((model, embedding, keep_alive))
+        if self.fail:
+            raise ConnectionError("server unavailable")
+
+
+def test_warm_loads_each_model_with_keep_alive():
+    generation, embedding = FakeBackend(), FakeBackend()
+    pool = ModelPool({GENERATION: "qwen", EMBEDDING: "nomic"}, keep_alive="1h",
+                     backends={GENERATION: generation, EMBEDDING: embedding})
+    assert not pool.ready()
+
+    assert pool.warm()
+    assert generation.loads == [("qwen", False, "1h")]
+    assert embedding.loads == [("nomic", True, "1h")]
+    assert pool.ready()
+    assert pool.status()[GENERATION]["load_seconds"] is not None
+
+    # Refreshes pass keep_alive again so Ollama does not fall back to its default
+    pool.warm()
+    assert generation.loads[-1] == ("qwen", False, "1h")
+
+
+def test_roles_sharing_a_model_and_backend_load_it_once():
+    backend = FakeBackend()
+    pool = ModelPool({GENERATION: "same", EMBEDDING: "same"}, backends={GENERATION: backend, EMBEDDING: backend})
+    pool.warm()
+    assert backend.loads == [("same", False, "30m")]
+
+
+def test_load_errors_are_reported_per_role():
+    pool = ModelPool({GENERATION: "qwen", EMBEDDING: "nomic"},
+                     backends={GENERATION: FakeBackend(), EMBEDDING: FakeBackend(fail=True)})
+    assert not pool.warm()
+    status = pool.status()
+    assert status[GENERATION]["state"] == "ready"
+    assert (status[EMBEDDING]["state"], status[EMBEDDING]["error"]) == ("error", "server unavailable")
+    assert pool.ready(GENERATION) and not pool.ready()
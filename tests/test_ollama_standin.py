@@ -0,0 +1,73 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from ollama_standin import OllamaStandin, embed_text
+from question_parser import parse_questions
+
+PROMPT = """Context information from networks.pdf:
+[1] Routers forward packets between networks using routing tables.
+[2] Switches learn addresses of hosts attached to their ports.
+
+Task: Generate 2 multiple choice questions about networks."""
+
+
+def post(server, path, body):
+    request = urllib.request.Request(server.url + path, data=json.dumps(body).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return [json.loads(line) for line in response.read().decode("utf-8").splitlines() if line]
+
+
+def test_embeddings_are_deterministic_unit_vectors():
+    text = "routers forward packets"
+    with OllamaStandin(embed_latency=0, dim=64) as server:
+        [reply] = post(server, "/api/embed", {"model": "nomic", "input": [text, text]})
+        [legacy] = post(server, "/api/embeddings", {"model": "nomic", "prompt": text})
+    first, second = reply["embeddings"]
+    assert first == second == legacy["embedding"] == embed_text(text, 64)
+    assert sum(value * value for value in first) == pytest.approx(1.0)
+    assert server.requests["embed"] == 2
+
+
+def test_chat_replies_parse_as_cited_questions():
+    with OllamaStandin(chat_latency=0) as server:
+        [reply] = post(server, "/api/chat", {"model": "qwen", "stream": False,
+                                             "messages": [{"role": "user", "content": PROMPT}]})
+        streamed = post(server, "/api/chat", {"model": "qwen", "messages": [{"role": "user", "content": PROMPT}]})
+
+    questions = parse_questions(reply["message"]["content"], context=[("c1", 1), ("c2", 2)])
+    assert len(questions) == 2
+    assert all(len(question["options"]) == 4 and question["sources"] for question in questions)
+
+    assert streamed[-1]["done"] and not any(line["done"] for line in streamed[:-1])
+    assert len(parse_questions("".join(line["message"]["content"] for line in streamed))) == 2
+
+
+def test_error_rate_fails_requests():
+    with OllamaStandin(embed_latency=0, error_rate=1.0) as server:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post(server, "/api/embed", {"model": "nomic", "input": "text"})
+    assert error.value.code == 500
+    assert server.stats["errors"] == 1
+
+
+def test_full_queue_rejects_requests():
+    with OllamaStandin(chat_latency=0.5, parallel=1, max_queue=0) as server:
+        body = {"model": "qwen", "stream": False, "messages": [{"role": "user", "content": PROMPT}]}
+        busy = threading.Thread(target=post, args=(server, "/api/chat", body))
+        busy.start()
+        deadline = time.time() + 5
+        while server.stats["active"] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post(server, "/api/chat", body)
+        busy.join()
+    assert error.value.code == 503
+    assert server.stats["rejected"] == 1
+    assert server.stats["peak_active"] == 1
@@ -0,0 +1,79 @@
+from question_parser import make_record, parse_complete_questions, parse_questions, question_text
+
+
+def test_json_reply():
+    text = '{"questions": [{"question": "What is 2+2?", "options": ["3", "4", "5", "6"], "answer": "4", "sources": [2]}]}'
+    records = parse_questions(text, [("a", 1), ("b", 3)])
+    assert records == [{"stem": "What is 2+2?", "options": ["3", "4", "5", "6"], "answer": "4",
+                        "sources": ["b"], "pages": [3]}]
+
+
+def test_json_boolean_false_answer_is_kept():
+    records = parse_questions('{"questions":[{"question":"The sky is green","answer":false}]}')
+    assert records == [{"stem": "The sky is green", "answer": "False"}]
+
+
+def test_json_zero_answer_is_kept():
+    assert make_record("Pick one", ["a", "b"], 0)["answer"] == "0"
+    assert "answer" not in make_record("Pick one", answer="")
+
+
+def test_unresolved_sources_cite_nothing():
+    context = [("a", 2), ("b", None)]
+    records = parse_questions('[{"question": "Q?", "sources": [9]}, {"question": "R?"}]', context)
+    assert records == [{"stem": "Q?"}, {"stem": "R?"}]
+    records = parse_questions('[{"question": "Q?", "sources": [9, "x", 1]}]', context)
+    assert (records[0]["sources"], records[0]["pages"]) == (["a"], [2])
+
+
+def test_free_text_reply_cites_nothing():
+    assert parse_questions("1. What is a cache?\nAnswer: A store", [("a", 2)]) == [
+        {"stem": "What is a cache?", "answer": "A store"}
+    ]
+
+
+def test_free_text_reply():
+    text = """Here are 2 questions:
+
+1. What does a cache store?
+A) Results
+B) Threads
+C) Sockets
+D) Files
+Answer: A
+
+2. Caches never expire - False
+"""
+    records = parse_questions(text)
+    assert records == [
+        {"stem": "What does a cache store?", "options": ["A: Results", "B: Threads", "C: Sockets", "D: Files"],
+         "answer": "A"},
+        {"stem": "Caches never expire", "answer": "False"},
+    ]
+
+
+def test_explanation_after_blank_line_stays_with_its_question():
+    text = """1. Why are chunks hashed?
+Answer: To reuse embeddings.
+
+Explanation: Identical text gets the same vector.
+
+2. What is BM25?
+Answer: A ranking function.
+
+Key Points: term frequency, document length.
+"""
+    records = parse_questions(text)
+    assert [record["stem"] for record in records] == ["Why are chunks hashed?", "What is BM25?"]
+    assert records[0]["explanation"] == "Identical text gets the same vector."
+    assert records[1]["explanation"] == "term frequency, document length."
+
+
+def test_complete_questions_of_a_streaming_reply():
+    partial = '{"questions": [{"question": "One?", "answer": "1"}, {"question": "Tw'
+    assert parse_complete_questions(partial) == [{"stem": "One?", "answer": "1"}]
+
+
+def test_question_text():
+    assert question_text({"stem": "Q?", "options": ["A: x", "B: y"]}) == "Q?\nA: x\nB: y"
+    assert question_text("  legacy question  ") == "legacy question"
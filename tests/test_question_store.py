@@ -0,0 +1,87 @@
+from question_store import GLOBAL_BANK, QuestionStore, bank_key
+
+
+def make_store(tmp_path):
+    return QuestionStore(str(tmp_path / "questions.sqlite"), legacy_dir=str(tmp_path / "legacy"))
+
+
+def test_bank_key():
+    assert bank_key("networks.pdf") == "networks"
+    assert bank_key(None) == GLOBAL_BANK
+
+
+def test_add_and_filter_questions(tmp_path):
+    store = make_store(tmp_path)
+    first = store.add_questions("doc", "Nets", "beginner", "mcq", [{"stem": "A?"}, {"stem": "B?"}])
+    other = store.add_questions("doc", "Nets", "advanced", "short", [{"stem": "C?"}])
+    store.add_questions("other", "Nets", "beginner", "mcq", [{"stem": "D?"}])
+
+    assert store.get_questions("doc", difficulty="beginner", q_type="mcq") == [
+        (first[0], {"stem": "A?"}), (first[1], {"stem": "B?"})
+    ]
+    assert [row_id for row_id, _ in store.get_questions("doc")] == first + other
+    assert [row[0] for row in store.get_rows("doc")] == first + other
+
+
+def test_bank_cache_sees_new_questions(tmp_path):
+    store = make_store(tmp_path)
+    store.add_questions("doc", "Nets", "beginner", "mcq", [{"stem": "A?"}])
+    assert store.get_bank("doc") == {"Nets": {"beginner": {"mcq": [{"stem": "A?"}]}}}
+    store.add_questions("doc", "Nets", "beginner", "mcq", [{"stem": "B?"}])
+    assert store.get_bank("doc")["Nets"]["beginner"]["mcq"] == [{"stem": "A?"}, {"stem": "B?"}]
+
+
+def test_query_questions_search_and_paging(tmp_path):
+    store = make_store(tmp_path)
+    store.add_questions("doc", "Nets", "beginner", "mcq",
+                        [{"stem": f"What is Routing rule {i}?"} for i in range(5)] + [{"stem": "Other?"}])
+    rows, total = store.query_questions("doc", search="routing", offset=2, limit=2)
+    assert total == 5
+    assert [row[4]["stem"] for row in rows] == ["What is Routing rule 2?", "What is Routing rule 3?"]
+
+
+def test_stale_questions_are_flagged_by_source(tmp_path):
+    store = make_store(tmp_path)
+    kept, stale = store.add_questions("doc", "Nets", "beginner", "mcq",
+                                      [{"stem": "A?", "sources": ["c1"]}, {"stem": "B?", "sources": ["c2"]}])
+    assert store.flag_stale("doc", ["c2"]) == 1
+    assert [row_id for row_id, _ in store.get_questions("doc", include_stale=False)] == [kept]
+    rows, total = store.query_questions("doc", stale_only=True)
+    assert total == 1 and rows[0][0] == stale
+
+
+def test_issued_questions(tmp_path):
+    store = make_store(tmp_path)
+    ids = store.add_questions("doc", "Nets", "beginner", "mcq", [{"stem": "A?"}, {"stem": "B?"}])
+    store.record_issued("exam-1", ids[:1])
+    assert store.issued_since("doc", 0) == {ids[0]}
+    assert store.issued_since("other", 0) == set()
+
+    store.delete_questions(ids[:1])
+    assert store.issued_since("doc", 0) == set()
+    assert [row_id for row_id, _ in store.get_questions("doc")] == ids[1:]
+
+
+def test_document_versions(tmp_path):
+    store = make_store(tmp_path)
+    assert store.document_version("doc") is None
+    assert store.record_document_version("doc", "hash1", 10, 10, 0, embedding_model="m1") == 1
+    assert store.record_document_version("doc", "hash2", 12, 3, 1, embedding_model="m2") == 2
+    latest = store.document_version("doc")
+    assert (latest["version"], latest["file_hash"], latest["embedding_model"]) == (2, "hash2", "m2")
+
+
+def test_flag_stale_marks_questions_citing_removed_chunks(tmp_path):
+    store = make_store(tmp_path)
+    ids = store.add_questions("doc", "Nets", "beginner", "mcq", [
+        {"stem": "A?", "sources": ["c1"]}, {"stem": "B?", "sources": ["c2", "c3"]}, {"stem": "C?"}
+    ])
+    store.add_questions("other", "Nets", "beginner", "mcq", [{"stem": "D?", "sources": ["c3"]}])
+
+    assert store.flag_stale("doc", ["c3", "c9"]) == 1
+    assert store.flag_stale("doc", ["c3"]) == 0
+    rows, total = store.query_questions("doc", stale_only=True)
+    assert total == 1 and rows[0][0] == ids[1] and rows[0][5] is True
+    assert [row_id for row_id, _ in store.get_questions("doc", include_stale=False)] == [ids[0], ids[2]]
+    # Other documents citing the same chunk are left alone
+    assert store.query_questions("other", stale_only=True)[1] == 0
@@ -0,0 +1,62 @@
+import pytest
+
+from benchmarks.synthetic_pdf import write_pdf
+from ollama_standin import OllamaStandin
+
+pytest.importorskip("langchain")
+pytest.importorskip("langchain_community")
+pytest.importorskip("chromadb")
+pytest.importorskip("ollama")
+pytest.importorskip("PyPDF2")
+
+from app import AIQuestionBankGenerator  # noqa: E402
+
+
+@pytest.fixture
+def generator(tmp_path, monkeypatch):
+    # The generator keeps its stores in the working directory
+    monkeypatch.chdir(tmp_path)
+    with OllamaStandin(chat_latency=0, embed_latency=0) as server:
+        generator = AIQuestionBankGenerator(ollama_host=server.url, ingest_workers=0, preload_models=False)
+        yield generator
+        generator.close()
+
+
+def test_reingest_removes_dropped_chunks_and_flags_their_questions(generator):
+    path = "uploads/doc.pdf"
+    write_pdf(path, pages=6, words_per_page=300, seed=1)
+    first = generator.process_document(path)
+    assert first["added"] == first["chunks"] and first["version"] == 1
+
+    pages = {chunk_key: metadata["page"]
+             for chunk_key, metadata in generator.vector_stores.get("doc.pdf").get_metadatas().items()}
+    kept = next(chunk_key for chunk_key, page in pages.items() if page == 1)
+    dropped = next(chunk_key for chunk_key, page in pages.items() if page == 6)
+    ids = generator.question_store.add_questions("doc", "doc", "beginner", "short", [
+        {"stem": "Kept?", "sources": [kept]},
+        {"stem": "Dropped?", "sources": [dropped, kept]},
+    ])
+
+    # The same seed with fewer pages: the first four pages are unchanged
+    write_pdf(path, pages=4, words_per_page=300, seed=1)
+    second = generator.process_document(path)
+
+    remaining = generator.vector_stores.get("doc.pdf").get_metadatas()
+    assert second["added"] == 0
+    assert second["removed"] == sum(1 for page in pages.values() if page > 4)
+    assert second["chunks"] == len(remaining) == first["chunks"] - second["removed"]
+    assert dropped not in remaining and kept in remaining
+    assert second["stale_questions"] == 1 and second["version"] == 2
+
+    rows, total = generator.question_store.query_questions("doc", stale_only=True)
+    assert total == 1 and rows[0][0] == ids[1]
+    assert [row_id for row_id, _ in generator.question_store.get_questions("doc", include_stale=False)] == ids[:1]
+
+
+def test_unchanged_upload_is_skipped(generator):
+    path = "uploads/doc.pdf"
+    write_pdf(path, pages=2, words_per_page=300, seed=1)
+    first = generator.process_document(path)
+    again = generator.process_document(path)
+    assert again == {"chunks": first["chunks"], "added": 0, "unchanged": first["chunks"], "removed": 0,
+                     "moved": 0, "cache_hits": 0, "cache_misses": 0, "stale_questions": 0, "version": 1}
@@ -0,0 +1,19 @@
+from retrieval import KeywordIndex, tokenize
+
+
+def test_tokenize_drops_stopwords_and_single_characters():
+    assert tokenize("What is a B-tree in the database?") == ["tree", "database"]
+
+
+def test_add_skips_known_ids():
+    index = KeywordIndex(["a"], ["routing tables"])
+    for _ in range(3):
+        index.add(["a", "b"], ["routing tables", "packet switching"])
+    assert index.ids == ["a", "b"]
+
+
+def test_loaded_index_skips_known_ids():
+    index = KeywordIndex.from_dict(KeywordIndex(["a"], ["routing tables"]).to_dict())
+    index.add(["a", "b"], ["routing tables", "packet switching"])
+    assert index.ids == ["a", "b"]
+    assert index.search("packet")[0][0] == 1
@@ -0,0 +1,119 @@
+import gc
+
+import pytest
+
+from vector_store_registry import SharedVectorStore, VectorStoreRegistry, shared_collection_name
+
+
+class FakeStore:
+    def __init__(self, directory):
+        self.directory = directory
+
+
+def make_registry(tmp_path, names, sizes=None, **options):
+    for name in names:
+        directory = tmp_path / name
+        directory.mkdir()
+        (directory / "index.bin").write_bytes(b"x" * (sizes or {}).get(name, 10))
+    opened, released = [], []
+
+    def open_store(directory):
+        opened.append(directory)
+        return FakeStore(directory)
+
+    registry = VectorStoreRegistry(str(tmp_path), open_store, release_store=released.append, **options)
+    return registry, opened, released
+
+
+def test_least_recently_used_store_is_evicted(tmp_path):
+    registry, opened, released = make_registry(tmp_path, ["a", "b", "c"], max_open=2)
+    registry.get("a")
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+    assert [store.directory for store in released] == [str(tmp_path / "b")]
+    assert registry.get("missing") is None
+    assert len(opened) == 3
+
+
+def test_byte_budget_evicts_stores(tmp_path):
+    registry, _, released = make_registry(tmp_path, ["a", "b", "c"], sizes={"a": 600, "b": 300, "c": 300},
+                                          max_open=8, max_open_bytes=1000)
+    registry.get("a")
+    registry.get("b")
+    assert released == []
+    registry.get("c")
+    assert [store.directory for store in released] == [str(tmp_path / "a")]
+
+
+def test_dropped_store_still_in_use_is_handed_back(tmp_path):
+    registry, opened, released = make_registry(tmp_path, ["a", "b"], max_open=1)
+    held = registry.get("a").store
+    registry.get("b")
+    assert released == [held]
+
+    # A search still holds the evicted store, so the same one is reused
+    assert registry.get("a").store is held
+    assert len(opened) == 2
+
+    # Once nothing references it, the next get opens a new store
+    registry.get("b")
+    del held
+    released.clear()
+    gc.collect()
+    assert registry.get("a").store.directory == str(tmp_path / "a")
+    assert len(opened) == 3
+
+
+def test_release_chroma_frees_the_cached_client(tmp_path):
+    pytest.importorskip("langchain_community")
+    pytest.importorskip("chromadb")
+    from app import open_chroma, release_chroma
+
+    store = open_chroma(persist_directory=str(tmp_path / "store"), embedding_function=None)
+    identifier = store._client._identifier
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+    except ImportError:
+        from chromadb.api.client import SharedSystemClient
+    systems = getattr(SharedSystemClient, "_identifier_to_system", None) or SharedSystemClient._identifer_to_system
+    assert identifier in systems
+    release_chroma(store)
+    assert identifier not in systems
+
+
+def test_shared_reset_removes_a_document_from_other_models(tmp_path):
+    pytest.importorskip("langchain_community")
+    pytest.importorskip("chromadb")
+    from app import open_chroma, release_chroma
+
+    directory = str(tmp_path / "shared")
+    stores = []
+
+    def open_shared(model):
+        def open_store(persist_directory):
+            store = open_chroma(persist_directory=persist_directory, collection_name=shared_collection_name(model),
+                                embedding_function=None)
+            stores.append(store)
+            return store
+        return SharedVectorStore(directory, open_store)
+
+    try:
+        old = open_shared("old-model")
+        for name in ("a.pdf", "b.pdf"):
+            old.get(name).upsert(["c1"], ["text"], [[0.1, 0.2, 0.3]], [{"page": 1}])
+        new = open_shared("new-model")
+        new.get("a.pdf").upsert(["c1"], ["text"], [[0.3, 0.2, 0.1]], [{"page": 1}])
+        assert new.other_collections() == [shared_collection_name("old-model")]
+
+        new.reset("a.pdf")
+        assert new.get("a.pdf").ids() == []
+        assert old.get("a.pdf").ids() == [] and old.get("b.pdf").ids() == ["c1"]
+        assert new.other_collections() == [shared_collection_name("old-model")]
+
+        # Removing the last document of the old model drops its collection
+        new.reset("b.pdf")
+        assert new.other_collections() == []
+    finally:
+        for store in stores:
+            release_chroma(store)
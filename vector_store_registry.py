@@ -0,0 +1,369 @@
+import hashlib
+import os
+import threading
+import weakref
+from collections import OrderedDict
+
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# Collection that holds every document when the shared layout is used
+SHARED_COLLECTION = "documents"
+
+
+def embedding_model_tag(embedding_model):
+    """Short tag for an embedding model that is valid in Chroma collection names"""
+    return hashlib.sha1(embedding_model.encode("utf-8")).hexdigest()[:12]
+
+
+def shared_collection_name(embedding_model=None):
+    """Shared collection for an embedding model.
+
+    A collection only holds vectors of one dimension, so every embedding
+    model gets its own; documents move over as they are re-embedded.
+    """
+    if not embedding_model:
+        return SHARED_COLLECTION
+    return f"{SHARED_COLLECTION}_{embedding_model_tag(embedding_model)}"
+
+
+# One write lock per open store (collection), shared by every view of it
+_write_locks = weakref.WeakKeyDictionary()
+_write_locks_lock = threading.Lock()
+
+
+def _write_lock(store):
+    """Lock serializing writes to a store; several ingestions may write to one collection at once"""
+    with _write_locks_lock:
+        lock = _write_locks.get(store)
+        if lock is None:
+            lock = _write_locks[store] = threading.Lock()
+        return lock
+
+
+class DocumentVectors:
+    """One document's chunks inside a Chroma store.
+
+    With a source, the store is shared between documents: chunks carry the
+    source in their metadata, searches are filtered on it, and chunk ids are
+    prefixed with it so identical text in two documents does not collide.
+    """
+
+    def __init__(self, store, source=None):
+        self.store = store
+        self.source = source
+
+    def _store_id(self, chunk_key):
+        return f"{self.source}/{chunk_key}" if self.source is not None else chunk_key
+
+    def _chunk_id(self, store_id):
+        return store_id[len(self.source) + 1:] if self.source is not None else store_id
+
+    def _where(self, where=None):
+        if self.source is None:
+            return where
+        if not where:
+            return {"source": self.source}
+        return {"$and": [{"source": self.source}, where]}
+
+    def upsert(self, ids, texts, vectors, metadatas):
+        """Write chunks with precomputed embeddings and persist them"""
+        if self.source is not None:
+            metadatas = [dict(metadata or {}, source=self.source) for metadata in metadatas]
+        with _write_lock(self.store):
+            self.store._collection.upsert(
+                ids=[self._store_id(chunk_key) for chunk_key in ids],
+                embeddings=vectors,
+                documents=texts,
+                metadatas=metadatas
+            )
+            if hasattr(self.store, 'persist'):
+                self.store.persist()
+
+    def get_chunks(self):
+        """Return (ids, texts, metadatas) of every chunk of the document"""
+        result = self.store._collection.get(where=self._where(), include=["documents", "metadatas"])
+        return [self._chunk_id(store_id) for store_id in result["ids"]], result["documents"], result["metadatas"]
+
+    def get_metadatas(self):
+        """Return {chunk id: metadata} for every chunk of the document"""
+        result = self.store._collection.get(where=self._where(), include=["metadatas"])
+        return {self._chunk_id(store_id): metadata or {} for store_id, metadata in zip(result["ids"], result["metadatas"])}
+
+    def update_metadatas(self, ids, metadatas):
+        """Replace the metadata of existing chunks (e.g. a chunk that moved to another page)"""
+        ids = list(ids)
+        if not ids:
+            return
+        if self.source is not None:
+            metadatas = [dict(metadata or {}, source=self.source) for metadata in metadatas]
+        with _write_lock(self.store):
+            self.store._collection.update(ids=[self._store_id(chunk_key) for chunk_key in ids], metadatas=metadatas)
+            if hasattr(self.store, 'persist'):
+                self.store.persist()
+
+    def ids(self):
+        result = self.store._collection.get(where=self._where(), include=[])
+        return [self._chunk_id(store_id) for store_id in result["ids"]]
+
+    def delete(self, ids):
+        ids = list(ids)
+        with _write_lock(self.store):
+            for start in range(0, len(ids), 500):
+                self.store._collection.delete(ids=[self._store_id(chunk_key) for chunk_key in ids[start:start + 500]])
+            if ids and hasattr(self.store, 'persist'):
+                self.store.persist()
+
+    def similarity_search(self, query, k=4, where=None):
+        """Nearest chunks of this document, optionally narrowed by a metadata filter (e.g. pages)"""
+        return self.store.similarity_search(query, k=k, filter=self._where(where))
+
+
+class SharedVectorStore:
+    """All documents in one Chroma collection, told apart by "source" metadata.
+
+    Has the same get/contains interface as VectorStoreRegistry, but opens a
+    single store no matter how many documents there are, and supports
+    searches across documents.
+    """
+
+    def __init__(self, persist_directory, open_store):
+        self.persist_directory = persist_directory
+        self.open_store = open_store
+        self._lock = threading.Lock()
+        self._store = None
+
+    @property
+    def store(self):
+        with self._lock:
+            if self._store is None:
+                os.makedirs(self.persist_directory, exist_ok=True)
+                self._store = self.open_store(self.persist_directory)
+            return self._store
+
+    def names(self):
+        """Names of all documents in the collection"""
+        metadatas = self.store._collection.get(include=["metadatas"])["metadatas"]
+        return sorted({metadata.get("source") for metadata in metadatas if metadata and metadata.get("source")})
+
+    def __contains__(self, name):
+        try:
+            return bool(self.store._collection.get(where={"source": name}, limit=1, include=[])["ids"])
+        except Exception as e:
+            print(f"Error checking shared vector store for {name}: {e}")
+            return False
+
+    def get(self, name, default=None, create=False):
+        """Return a view of one document (which may not have any chunks yet)"""
+        try:
+            return DocumentVectors(self.store, source=name)
+        except Exception as e:
+            print(f"Error loading shared vector store: {e}")
+            return default
+
+    def reset(self, name):
+        """Delete every chunk of one document, also from other embedding models' collections.
+
+        A document is reset before it is re-embedded with a new model, so its
+        old vectors are in another model's collection; collections that end up
+        empty are dropped.
+        """
+        vectors = DocumentVectors(self.store, source=name)
+        vectors.delete(vectors.ids())
+        client = self.store._client
+        with _write_lock(self.store):
+            for collection_name in self.other_collections():
+                try:
+                    collection = client.get_collection(collection_name, embedding_function=None)
+                    collection.delete(where={"source": name})
+                    if collection.count() == 0:
+                        client.delete_collection(collection_name)
+                        print(f"Dropped empty shared collection: {collection_name}")
+                except Exception as e:
+                    print(f"Error removing {name} from shared collection {collection_name}: {e}")
+
+    def other_collections(self):
+        """Names of shared collections of other embedding models in the same directory"""
+        current = self.store._collection.name
+        names = [getattr(collection, "name", collection) for collection in self.store._client.list_collections()]
+        return sorted(
+            collection_name for collection_name in names
+            if collection_name != current
+            and (collection_name == SHARED_COLLECTION or collection_name.startswith(SHARED_COLLECTION + "_"))
+        )
+
+    def drop_other_collections(self):
+        """Delete the shared collections of other embedding models. Returns their names."""
+        names = self.other_collections()
+        with _write_lock(self.store):
+            for collection_name in names:
+                self.store._client.delete_collection(collection_name)
+        return names
+
+    def search(self, query, k=4, sources=None, where=None):
+        """Search across documents, optionally limited to some sources and a metadata filter"""
+        clauses = []
+        if sources:
+            clauses.append({"source": {"$in": list(sources)}})
+        if where:
+            clauses.append(where)
+        where = clauses[0] if len(clauses) == 1 else ({"$and": clauses} if clauses else None)
+        return self.store.similarity_search(query, k=k, filter=where)
+
+    def close(self, name):
+        # Nothing is held per document
+        pass
+
+
+class VectorStoreRegistry:
+    """Lazily opened per-document vector stores with LRU eviction.
+
+    Stores are only opened on first use. At most max_open stores (and roughly
+    max_open_bytes of on-disk index data) are kept open at once; the least
+    recently used ones are dropped when the budget is exceeded and handed to
+    release_store, if given, so their client can be freed. get() returns a
+    DocumentVectors view of the document's store.
+
+    A dropped store may still be in use by a search or an ingestion holding
+    a view of it; until those finish, get() hands out that same store again
+    rather than opening a second one on the same directory.
+    """
+
+    def __init__(self, vector_db_dir, open_store, max_open=8, max_open_bytes=None, release_store=None):
+        self.vector_db_dir = vector_db_dir
+        self.open_store = open_store
+        self.release_store = release_store
+        self.max_open = max(1, max_open)
+        self.max_open_bytes = max_open_bytes
+
+        self._lock = threading.RLock()
+        # name -> {"store": ..., "size": ...}
+        self._open = OrderedDict()
+        # name -> dropped store that is still referenced somewhere
+        self._dropped = weakref.WeakValueDictionary()
+
+    def _store_dir(self, name):
+        return os.path.join(self.vector_db_dir, name)
+
+    def names(self):
+        """Names of all documents with a persisted vector store"""
+        if not os.path.exists(self.vector_db_dir):
+            return []
+        return sorted(
+            entry for entry in os.listdir(self.vector_db_dir)
+            if os.path.isdir(self._store_dir(entry))
+        )
+
+    def __contains__(self, name):
+        with self._lock:
+            if name in self._open:
+                return True
+        return os.path.isdir(self._store_dir(name))
+
+    def __getitem__(self, name):
+        store = self.get(name)
+        if store is None:
+            raise KeyError(name)
+        return store
+
+    def _lookup(self, name):
+        """The open (or still referenced) store for a document, marked as most recently used"""
+        entry = self._open.get(name)
+        if entry is not None:
+            self._open.move_to_end(name)
+            return entry["store"]
+        store = self._dropped.pop(name, None)
+        if store is not None:
+            self._open[name] = {"store": store, "size": self._estimate_size(name)}
+            self._evict()
+        return store
+
+    def get(self, name, default=None, create=False):
+        """Return a view of a document's store, opening it on first use.
+
+        With create, a store directory is made for a new document.
+        """
+        with self._lock:
+            store = self._lookup(name)
+        if store is not None:
+            return DocumentVectors(store)
+
+        if create:
+            os.makedirs(self._store_dir(name), exist_ok=True)
+        if not os.path.isdir(self._store_dir(name)):
+            return default
+
+        # Opening can be slow, so it happens outside the lock and lookups of
+        # other documents do not wait for it
+        try:
+            store = self.open_store(self._store_dir(name))
+        except Exception as e:
+            print(f"Error loading vector store for {name}: {e}")
+            return default
+
+        with self._lock:
+            # Another thread may have opened the same store meanwhile; keep the first
+            existing = self._lookup(name)
+            if existing is not None:
+                return DocumentVectors(existing)
+            self._open[name] = {"store": store, "size": self._estimate_size(name)}
+            self._evict()
+            return DocumentVectors(store)
+
+    def _drop(self, name):
+        entry = self._open.pop(name, None)
+        if entry is None:
+            return
+        self._dropped[name] = entry["store"]
+        if self.release_store is not None:
+            try:
+                self.release_store(entry["store"])
+            except Exception as e:
+                print(f"Error releasing vector store for {name}: {e}")
+
+    def close(self, name):
+        """Drop an open store so its client and memory can be released"""
+        with self._lock:
+            self._drop(name)
+
+    def reset(self, name):
+        """Drop a document's collection (e.g. before re-embedding it with another model).
+
+        The next get(name, create=True) starts an empty collection.
+        """
+        with self._lock:
+            vectors = self.get(name)
+            if vectors is None:
+                return
+            with _write_lock(vectors.store):
+                vectors.store.delete_collection()
+            self._open.pop(name, None)
+            self._dropped.pop(name, None)
+
+    def _estimate_size(self, name):
+        if self.max_open_bytes is None:
+            return 0
+        return _directory_size(self._store_dir(name))
+
+    def _evict(self):
+        def over_budget():
+            if len(self._open) > self.max_open:
+                return True
+            if self.max_open_bytes is not None:
+                return sum(entry["size"] for entry in self._open.values()) > self.max_open_bytes
+            return False
+
+        # The most recently used store is at the end and is never evicted
+        while over_budget() and len(self._open) > 1:
+            name = next(iter(self._open))
+            self._drop(name)
+            print(f"Closed vector store for: {name}")